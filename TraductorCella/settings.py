@@ -36,6 +36,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'django_extensions',
     'resources',
     'specification',
@@ -100,6 +101,19 @@ DATABASES = {
     }
 }
 
+# Cached responses are invalidated by writes from web workers, job workers and commands alike, so the
+# 'responses' cache must be shared between processes. Responses are not cached with a local memory backend.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'responses': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': BASE_DIR / 'cache' / 'responses',
+        'OPTIONS': {'MAX_ENTRIES': 1000},
+    },
+}
+
 # Password validation
 # https://docs.djangoproject.com/en/3.1/ref/settings/#auth-password-validators
 
@@ -150,6 +164,16 @@ REST_FRAMEWORK = {
 # BITRIX_URL = "https://smola20.art-clever.ru/"
 BITRIX_URL = "127.0.0.1:8000/"
 BITRIX_AUF_CONF = {"login": "dev", "password": "123456"}
+BITRIX_DISPATCH_CONCURRENCY = 10
+BITRIX_DISPATCH_BATCH_SIZE = 100
+BITRIX_DISPATCH_POLL_INTERVAL = 1
+BITRIX_DISPATCH_TIMEOUT = 30
+BITRIX_DISPATCH_MAX_ATTEMPTS = 10
+# Requests per second for each Bitrix endpoint
+BITRIX_DISPATCH_RATE_LIMITS = {
+    'ajax/tsenaobnov.php': 10,
+    'ajax/smenastatusa.php': 10,
+}
 
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(days=1),
@@ -224,3 +248,17 @@ LOGGING = {
         }
     }
 }
+
+JOB_WORKERS = 2
+JOB_POLL_INTERVAL = 2
+JOB_STALE_TIMEOUT = 600
+JOB_HEARTBEAT_INTERVAL = 30
+
+ORDER_EVENT_BATCH_SIZE = 100
+ORDER_EVENT_POLL_INTERVAL = 1
+ORDER_BULK_CHUNK_SIZE = 500
+ORDER_ARCHIVE_AFTER_DAYS = 30
+ORDER_ARCHIVE_BATCH_SIZE = 1000
+
+RESPONSE_CACHE_ALIAS = 'responses'
+RESPONSE_CACHE_TIMEOUT = 300
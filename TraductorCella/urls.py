@@ -23,4 +23,5 @@ urlpatterns = [
     path('specification/', include('specification.urls')),
     path('order/', include('order.urls')),
     path('authenticate/', include('authentication.urls')),
+    path('cella/', include('cella.urls')),
 ]
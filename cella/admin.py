@@ -1,8 +1,9 @@
 from django.contrib import admin
 
 # Register your models here.
-from .models import File
+from .models import File, Job, OutboxMessage
 
 
 admin.site.register(File)
-
+admin.site.register(Job)
+admin.site.register(OutboxMessage)
@@ -3,3 +3,7 @@ from django.apps import AppConfig
 
 class CellaConfig(AppConfig):
     name = 'cella'
+
+    def ready(self):
+        from . import signals
+        signals.connect()
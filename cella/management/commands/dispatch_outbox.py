@@ -0,0 +1,18 @@
+import asyncio
+
+from django.core.management.base import BaseCommand
+
+from cella.service import OutboxDispatcher
+
+
+class Command(BaseCommand):
+    help = 'Delivers queued Bitrix notifications from the outbox.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=None)
+        parser.add_argument('--batch-size', type=int, default=None)
+        parser.add_argument('--once', action='store_true', help='Exit when the outbox is drained.')
+
+    def handle(self, *args, **options):
+        dispatcher = OutboxDispatcher(concurrency=options['concurrency'], batch_size=options['batch_size'])
+        asyncio.run(dispatcher.run(once=options['once']))
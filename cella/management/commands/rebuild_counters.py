@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from cella.service import Counters
+
+
+class Command(BaseCommand):
+    help = 'Recounts dashboard counters from the tables.'
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            values = Counters.rebuild()
+        self.stdout.write(self.style.SUCCESS(f"Counters: {values}"))
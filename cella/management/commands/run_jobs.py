@@ -0,0 +1,49 @@
+import logging
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from cella.service import Jobs, run_job
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Runs queued file import jobs in a process pool.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=settings.JOB_WORKERS)
+        parser.add_argument('--poll-interval', type=float, default=settings.JOB_POLL_INTERVAL)
+        parser.add_argument('--once', action='store_true', help='Exit when there are no queued jobs left.')
+
+    def handle(self, *args, **options):
+        workers = options['workers']
+        poll_interval = options['poll_interval']
+        running = set()
+
+        context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=django.setup) as pool:
+            while True:
+                Jobs.requeue_stale()
+                ids = Jobs.claim(workers - len(running))
+                connections.close_all()
+
+                for job_id in ids:
+                    logger.info(f"Starting job {job_id} | {self.__class__.__name__}")
+                    running.add(pool.submit(run_job, job_id))
+
+                if len(running) == 0:
+                    if options['once']:
+                        return
+                    time.sleep(poll_interval)
+                    continue
+
+                done, running = wait(running, timeout=poll_interval, return_when=FIRST_COMPLETED)
+                for future in done:
+                    if future.exception() is not None:
+                        logger.error(f"Job worker error | {self.__class__.__name__}", exc_info=future.exception())
@@ -0,0 +1,39 @@
+# Generated by Django 3.1.5 on 2026-10-17 23:29
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('authentication', '0001_initial'),
+        ('cella', '0002_recoding'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Job',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('REX', 'Resources excel'), ('SXM', 'Specifications xml')], max_length=3)),
+                ('status', models.CharField(choices=[('PND', 'Pending'), ('RUN', 'Running'), ('DNE', 'Done'), ('FLD', 'Failed')], default='PND', max_length=3)),
+                ('total_rows', models.IntegerField(default=0)),
+                ('processed_rows', models.IntegerField(default=0)),
+                ('created_rows', models.IntegerField(default=0)),
+                ('updated_rows', models.IntegerField(default=0)),
+                ('errors', models.JSONField(default=list)),
+                ('message', models.TextField(null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('started_at', models.DateTimeField(null=True)),
+                ('updated_at', models.DateTimeField(null=True)),
+                ('finished_at', models.DateTimeField(null=True)),
+                ('file', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='jobs', to='cella.file')),
+                ('operator', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, to='authentication.operator')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='job',
+            index=models.Index(fields=['status', 'created_at'], name='cella_job_status_4e48e4_idx'),
+        ),
+    ]
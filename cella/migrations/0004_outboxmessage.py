@@ -0,0 +1,33 @@
+# Generated by Django 3.1.5 on 2026-10-17 23:31
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cella', '0003_job'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OutboxMessage',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('endpoint', models.CharField(choices=[('ajax/tsenaobnov.php', 'Price'), ('ajax/smenastatusa.php', 'Status')], max_length=100)),
+                ('key', models.CharField(max_length=150, null=True)),
+                ('payload', models.JSONField()),
+                ('status', models.CharField(choices=[('PND', 'Pending'), ('SNT', 'Sent'), ('SPS', 'Superseded'), ('FLD', 'Failed')], default='PND', max_length=3)),
+                ('attempts', models.IntegerField(default=0)),
+                ('next_attempt_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('last_error', models.TextField(null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('sent_at', models.DateTimeField(null=True)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='outboxmessage',
+            index=models.Index(fields=['status', 'next_attempt_at'], name='cella_outbo_status_df89cc_idx'),
+        ),
+    ]
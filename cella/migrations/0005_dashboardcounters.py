@@ -0,0 +1,45 @@
+# Generated by Django 3.1.5 on 2026-10-17 23:46
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def fill_counters(apps, schema_editor):
+    Order = apps.get_model('order', 'Order')
+    Resource = apps.get_model('resources', 'Resource')
+    Specification = apps.get_model('specification', 'Specification')
+    DashboardCounters = apps.get_model('cella', 'DashboardCounters')
+
+    DashboardCounters.objects.update_or_create(pk=1, defaults={
+        'orders_inactive': Order.objects.filter(status='INC').count(),
+        'orders_confirmed': Order.objects.filter(status='CNF').count(),
+        'orders_canceled': Order.objects.filter(status='CND').count(),
+        'resources_expired': Resource.objects.filter(amount_limit__gte=F('amount')).count(),
+        'specifications_unverified': Specification.objects.filter(verified=False).count(),
+    })
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cella', '0004_outboxmessage'),
+        ('order', '0004_order_events'),
+        ('resources', '0006_stock_ledger'),
+        ('specification', '0004_trigram_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DashboardCounters',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('orders_inactive', models.IntegerField(default=0)),
+                ('orders_confirmed', models.IntegerField(default=0)),
+                ('orders_canceled', models.IntegerField(default=0)),
+                ('resources_expired', models.IntegerField(default=0)),
+                ('specifications_unverified', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
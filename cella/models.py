@@ -1,4 +1,5 @@
 from django.db import models
+from django.utils import timezone
 
 from authentication.models import Operator
 
@@ -13,3 +14,103 @@ class Recoding(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     operator = models.ForeignKey(Operator, on_delete=models.SET_NULL, null=True)
     message = models.TextField()
+
+
+class Job(models.Model):
+    class JobKind(models.TextChoices):
+        RESOURCES_EXCEL = 'REX', 'Resources excel'
+        SPECIFICATIONS_XML = 'SXM', 'Specifications xml'
+
+    class JobStatus(models.TextChoices):
+        PENDING = 'PND', 'Pending'
+        RUNNING = 'RUN', 'Running'
+        DONE = 'DNE', 'Done'
+        FAILED = 'FLD', 'Failed'
+
+    kind = models.CharField(max_length=3, choices=JobKind.choices)
+    status = models.CharField(max_length=3, choices=JobStatus.choices, default=JobStatus.PENDING)
+    file = models.ForeignKey(File, on_delete=models.CASCADE, related_name='jobs')
+    operator = models.ForeignKey(Operator, on_delete=models.SET_NULL, null=True)
+    total_rows = models.IntegerField(default=0)
+    processed_rows = models.IntegerField(default=0)
+    created_rows = models.IntegerField(default=0)
+    updated_rows = models.IntegerField(default=0)
+    errors = models.JSONField(default=list)
+    message = models.TextField(null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True)
+    updated_at = models.DateTimeField(null=True)
+    finished_at = models.DateTimeField(null=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'created_at'])
+        ]
+
+    @property
+    def progress(self):
+        if self.total_rows == 0:
+            return 1.0 if self.finished() else 0.0
+        return round(self.processed_rows / self.total_rows, 4)
+
+    def pending(self):
+        return self.status == Job.JobStatus.PENDING
+
+    def running(self):
+        return self.status == Job.JobStatus.RUNNING
+
+    def finished(self):
+        return self.status in [Job.JobStatus.DONE, Job.JobStatus.FAILED]
+
+    def __str__(self):
+        return f"{self.get_kind_display()} job {self.id} - {self.get_status_display()}"
+
+
+class OutboxMessage(models.Model):
+    class OutboxEndpoint(models.TextChoices):
+        PRICE = 'ajax/tsenaobnov.php', 'Price'
+        STATUS = 'ajax/smenastatusa.php', 'Status'
+
+    class OutboxStatus(models.TextChoices):
+        PENDING = 'PND', 'Pending'
+        SENT = 'SNT', 'Sent'
+        SUPERSEDED = 'SPS', 'Superseded'
+        FAILED = 'FLD', 'Failed'
+
+    endpoint = models.CharField(max_length=100, choices=OutboxEndpoint.choices)
+    key = models.CharField(max_length=150, null=True)
+    payload = models.JSONField()
+    status = models.CharField(max_length=3, choices=OutboxStatus.choices, default=OutboxStatus.PENDING)
+    attempts = models.IntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'])
+        ]
+
+    def __str__(self):
+        return f"{self.endpoint} {self.payload} - {self.get_status_display()}"
+
+
+class DashboardCounters(models.Model):
+    orders_inactive = models.IntegerField(default=0)
+    orders_confirmed = models.IntegerField(default=0)
+    orders_canceled = models.IntegerField(default=0)
+    resources_expired = models.IntegerField(default=0)
+    specifications_unverified = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Dashboard counters at {self.updated_at}"
+
+
+class VersionStamp(models.Model):
+    app = models.CharField(max_length=50, unique=True)
+    version = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.app} - {self.version}"
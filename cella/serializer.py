@@ -1,9 +1,31 @@
 from rest_framework import serializers
 
-from cella.models import File
+from cella.models import File, Job
 
 
 class FileSerializer(serializers.ModelSerializer):
     class Meta:
         model = File
         fields = ['file']
+
+
+class JobSerializer(serializers.ModelSerializer):
+    progress = serializers.FloatField(read_only=True)
+
+    class Meta:
+        model = Job
+        fields = [
+            'id',
+            'kind',
+            'status',
+            'progress',
+            'total_rows',
+            'processed_rows',
+            'created_rows',
+            'updated_rows',
+            'errors',
+            'message',
+            'created_at',
+            'started_at',
+            'finished_at',
+        ]
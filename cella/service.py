@@ -0,0 +1,479 @@
+import asyncio
+import hashlib
+import json
+import logging
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import timedelta
+
+import aiohttp
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.exceptions import ObjectDoesNotExist
+from django.db import transaction, connections, DatabaseError
+from django.db.models import F, Q, Count
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from authentication.models import Operator
+from utils.db.transaction import CommitBatch
+from .models import File, Job, OutboxMessage, DashboardCounters, VersionStamp
+
+logger = logging.getLogger(__name__)
+
+
+class JobProgress:
+    flush_every = 1000
+    max_errors = 1000
+
+    def __init__(self, job):
+        self.job = job
+        self.total_rows = 0
+        self.processed_rows = 0
+        self.created_rows = 0
+        self.updated_rows = 0
+        self.errors = []
+        self._flushed_rows = 0
+        self._stopped = threading.Event()
+        self._heartbeat = None
+
+    def start_heartbeat(self, interval=None):
+        """
+        Keeps `updated_at` fresh from a background thread, so a job that is slow between flushes
+        (e.g. one large XML parse) is not taken for stale and requeued.
+        """
+        if interval is None:
+            interval = settings.JOB_HEARTBEAT_INTERVAL
+        self._stopped.clear()
+        self._heartbeat = threading.Thread(target=self._beat, args=(interval,), daemon=True)
+        self._heartbeat.start()
+
+    def stop_heartbeat(self):
+        self._stopped.set()
+        if self._heartbeat is not None:
+            self._heartbeat.join()
+            self._heartbeat = None
+
+    def _beat(self, interval):
+        try:
+            while not self._stopped.wait(interval):
+                try:
+                    Job.objects.filter(id=self.job.id, status=Job.JobStatus.RUNNING).update(updated_at=timezone.now())
+                except DatabaseError:
+                    logger.warning(f"Heartbeat failed for job {self.job.id} | {self.__class__.__name__}", exc_info=True)
+        finally:
+            connections.close_all()
+
+    def set_total(self, total_rows):
+        self.total_rows = total_rows
+        self.flush()
+
+    def advance(self, processed=0, created=0, updated=0):
+        self.processed_rows += processed
+        self.created_rows += created
+        self.updated_rows += updated
+        if self.processed_rows - self._flushed_rows >= self.flush_every:
+            self.flush()
+
+    def error(self, row, message):
+        self.processed_rows += 1
+        if len(self.errors) < self.max_errors:
+            self.errors.append({'row': row, 'error': str(message)})
+
+    def flush(self, **fields):
+        Job.objects.filter(id=self.job.id).update(
+            total_rows=self.total_rows,
+            processed_rows=self.processed_rows,
+            created_rows=self.created_rows,
+            updated_rows=self.updated_rows,
+            errors=self.errors,
+            updated_at=timezone.now(),
+            **fields
+        )
+        self._flushed_rows = self.processed_rows
+
+
+class Jobs:
+    class DoesNotExist(ObjectDoesNotExist):
+        pass
+
+    handlers = {
+        Job.JobKind.RESOURCES_EXCEL: 'resources.service.import_resources_from_excel',
+        Job.JobKind.SPECIFICATIONS_XML: 'specification.service.import_specifications_from_xml',
+    }
+
+    @classmethod
+    def get(cls, job):
+        if not isinstance(job, Job):
+            try:
+                return Job.objects.get(id=job)
+            except Job.DoesNotExist:
+                logger.warning(f"Job does not exist. Id: '{job}' | {cls.__name__}")
+                raise cls.DoesNotExist()
+        else:
+            return job
+
+    @classmethod
+    def enqueue(cls, kind, file, operator=None):
+        if not isinstance(file, File):
+            file = File.objects.get(id=file)
+        if operator is not None:
+            operator = Operator.objects.get_or_create_operator(operator)
+        return Job.objects.create(kind=kind, file=file, operator=operator)
+
+    @classmethod
+    def claim(cls, limit=1):
+        with transaction.atomic():
+            ids = list(Job.objects.select_for_update(skip_locked=True).filter(
+                status=Job.JobStatus.PENDING
+            ).order_by('created_at').values_list('id', flat=True)[:limit])
+            now = timezone.now()
+            Job.objects.filter(id__in=ids).update(status=Job.JobStatus.RUNNING, started_at=now, updated_at=now)
+        return ids
+
+    @classmethod
+    def requeue_stale(cls, timeout=None):
+        if timeout is None:
+            timeout = settings.JOB_STALE_TIMEOUT
+        with transaction.atomic():
+            ids = list(Job.objects.select_for_update(skip_locked=True).filter(
+                status=Job.JobStatus.RUNNING,
+                updated_at__lt=timezone.now() - timedelta(seconds=timeout)
+            ).values_list('id', flat=True))
+            Job.objects.filter(id__in=ids).update(status=Job.JobStatus.PENDING, processed_rows=0, created_rows=0,
+                                                  updated_rows=0, errors=[])
+        if len(ids) != 0:
+            logger.warning(f"Requeued stale jobs {ids} | {cls.__name__}")
+        return ids
+
+    @classmethod
+    def run(cls, job):
+        job = Job.objects.select_related('file').get(id=job)
+        progress = JobProgress(job)
+        handler = import_string(cls.handlers[job.kind])
+        progress.start_heartbeat()
+        try:
+            handler(job.file, progress)
+        except Exception as ex:
+            logger.error(f"Job failed: {job} | {cls.__name__}", exc_info=True)
+            progress.flush(status=Job.JobStatus.FAILED, message=str(ex), finished_at=timezone.now())
+        else:
+            logger.info(f"Job done: {job}, processed={progress.processed_rows}, created={progress.created_rows}, "
+                        f"updated={progress.updated_rows}, errors={len(progress.errors)} | {cls.__name__}")
+            progress.flush(status=Job.JobStatus.DONE, finished_at=timezone.now())
+        finally:
+            progress.stop_heartbeat()
+
+
+def run_job(job_id):
+    try:
+        Jobs.run(job_id)
+    finally:
+        connections.close_all()
+
+
+class Outbox:
+    lease = 60
+    backoff_base = 5
+    backoff_max = 3600
+
+    @classmethod
+    def push(cls, endpoint, payload, key=None):
+        return OutboxMessage.objects.create(endpoint=endpoint, payload=payload, key=key)
+
+    @classmethod
+    def push_many(cls, endpoint, payloads, keys=None):
+        if keys is None:
+            keys = [None] * len(payloads)
+        return OutboxMessage.objects.bulk_create([
+            OutboxMessage(endpoint=endpoint, payload=payload, key=key) for payload, key in zip(payloads, keys)
+        ])
+
+    @classmethod
+    def claim(cls, limit):
+        with transaction.atomic():
+            now = timezone.now()
+            messages = list(OutboxMessage.objects.select_for_update(skip_locked=True).filter(
+                status=OutboxMessage.OutboxStatus.PENDING,
+                next_attempt_at__lte=now
+            ).order_by('id')[:limit])
+
+            # Only the newest message for a key is worth sending, e.g. the last prime cost of a product.
+            latest = {}
+            for message in messages:
+                if message.key is not None:
+                    latest[(message.endpoint, message.key)] = message.id
+            superseded = [message.id for message in messages
+                          if message.key is not None and latest[(message.endpoint, message.key)] != message.id]
+            messages = [message for message in messages if message.id not in superseded]
+
+            OutboxMessage.objects.filter(id__in=superseded).update(status=OutboxMessage.OutboxStatus.SUPERSEDED)
+            OutboxMessage.objects.filter(id__in=[message.id for message in messages]).update(
+                next_attempt_at=now + timedelta(seconds=cls.lease))
+        return messages
+
+    @classmethod
+    def complete(cls, results):
+        now = timezone.now()
+        sent = [message_id for message_id, error in results if error is None]
+        OutboxMessage.objects.filter(id__in=sent).update(status=OutboxMessage.OutboxStatus.SENT, sent_at=now,
+                                                         attempts=F('attempts') + 1, last_error=None)
+
+        for message_id, error in results:
+            if error is None:
+                continue
+            message = OutboxMessage.objects.get(id=message_id)
+            message.attempts += 1
+            message.last_error = error
+            if message.attempts >= settings.BITRIX_DISPATCH_MAX_ATTEMPTS:
+                message.status = OutboxMessage.OutboxStatus.FAILED
+                logger.error(f"Outbox message {message.id} failed after {message.attempts} attempts: {error} | "
+                             f"{cls.__name__}")
+            else:
+                delay = min(cls.backoff_base * 2 ** (message.attempts - 1), cls.backoff_max)
+                message.next_attempt_at = now + timedelta(seconds=delay)
+                logger.warning(f"Outbox message {message.id} failed, retry in {delay}s: {error} | {cls.__name__}")
+            message.save(update_fields=['attempts', 'last_error', 'status', 'next_attempt_at'])
+
+
+class RateLimiter:
+
+    def __init__(self, rate):
+        self.interval = 1 / rate if rate else 0
+        self._next = 0
+        self._lock = asyncio.Lock()
+
+    async def wait(self):
+        async with self._lock:
+            now = time.monotonic()
+            delay = self._next - now
+            self._next = max(now, self._next) + self.interval
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+class OutboxDispatcher:
+
+    def __init__(self, concurrency=None, batch_size=None, poll_interval=None):
+        self.concurrency = concurrency or settings.BITRIX_DISPATCH_CONCURRENCY
+        self.batch_size = batch_size or settings.BITRIX_DISPATCH_BATCH_SIZE
+        self.poll_interval = poll_interval or settings.BITRIX_DISPATCH_POLL_INTERVAL
+        self.semaphore = None
+        self.limiters = {}
+
+    async def run(self, once=False):
+        self.semaphore = asyncio.Semaphore(self.concurrency)
+        self.limiters = {endpoint: RateLimiter(rate) for endpoint, rate in
+                         settings.BITRIX_DISPATCH_RATE_LIMITS.items()}
+        connector = aiohttp.TCPConnector(limit=self.concurrency)
+        async with aiohttp.ClientSession(connector=connector,
+                                         auth=aiohttp.BasicAuth(**settings.BITRIX_AUF_CONF),
+                                         headers={'content-type': 'application/json'},
+                                         timeout=aiohttp.ClientTimeout(total=settings.BITRIX_DISPATCH_TIMEOUT)
+                                         ) as session:
+            while True:
+                messages = await sync_to_async(Outbox.claim)(self.batch_size)
+                if len(messages) == 0:
+                    if once:
+                        return
+                    await asyncio.sleep(self.poll_interval)
+                    continue
+                results = await asyncio.gather(*[self.deliver(session, message) for message in messages])
+                await sync_to_async(Outbox.complete)(results)
+
+    async def deliver(self, session, message):
+        limiter = self.limiters.get(message.endpoint)
+        async with self.semaphore:
+            if limiter is not None:
+                await limiter.wait()
+            try:
+                async with session.post(settings.BITRIX_URL + message.endpoint, json=message.payload) as response:
+                    if response.status >= 400:
+                        return message.id, f"HTTP {response.status}: {await response.text()}"
+            except (aiohttp.ClientError, asyncio.TimeoutError) as ex:
+                return message.id, repr(ex)
+        logger.info(f"Sent {message.endpoint} {message.payload} | {self.__class__.__name__}")
+        return message.id, None
+
+
+class Counters:
+    """
+    Dashboard badge counters kept in a single DashboardCounters row. Services that change a counted
+    field wrap the change in `track`, which adds the difference of the counted rows to the counters
+    in the same transaction.
+    """
+    pk = 1
+
+    @classmethod
+    def definitions(cls):
+        from order.models import Order
+        from resources.models import Resource
+        from specification.models import Specification
+
+        return {
+            'orders_inactive': (Order, Q(status=Order.OrderStatus.INACTIVE)),
+            'orders_confirmed': (Order, Q(status=Order.OrderStatus.CONFIRMED)),
+            'orders_canceled': (Order, Q(status=Order.OrderStatus.CANCELED)),
+            'resources_expired': (Resource, Q(amount_limit__gte=F('amount'))),
+            'specifications_unverified': (Specification, Q(verified=False)),
+        }
+
+    @classmethod
+    def read(cls):
+        values = DashboardCounters.objects.filter(pk=cls.pk).values(*cls.definitions().keys()).first()
+        if values is None:
+            values = cls.rebuild()
+        return values
+
+    @classmethod
+    def rebuild(cls):
+        values = {}
+        for name, (model, condition) in cls.definitions().items():
+            values[name] = model.objects.filter(condition).count()
+        DashboardCounters.objects.update_or_create(pk=cls.pk, defaults=values)
+        return values
+
+    @classmethod
+    def count(cls, model, ids):
+        conditions = {name: condition for name, (counted, condition) in cls.definitions().items() if counted is model}
+        if len(conditions) == 0 or len(ids) == 0:
+            return {name: 0 for name in conditions}
+        return model.objects.filter(id__in=ids).aggregate(
+            **{name: Count('id', filter=condition) for name, condition in conditions.items()})
+
+    @classmethod
+    def add(cls, deltas):
+        deltas = {name: delta for name, delta in deltas.items() if delta != 0}
+        if len(deltas) == 0:
+            return
+        updated = DashboardCounters.objects.filter(pk=cls.pk).update(
+            **{name: F(name) + delta for name, delta in deltas.items()})
+        if updated == 0:
+            cls.rebuild()
+
+    @classmethod
+    def created(cls, model, ids):
+        cls.add(cls.count(model, ids))
+
+    @classmethod
+    @contextmanager
+    def track(cls, model, ids):
+        ids = list(ids)
+        if not any(counted is model for counted, _ in cls.definitions().values()) or len(ids) == 0:
+            yield
+            return
+        with transaction.atomic():
+            list(model.objects.select_for_update().filter(id__in=ids).order_by('id').values_list('id'))
+            before = cls.count(model, ids)
+            yield
+            after = cls.count(model, ids)
+            cls.add({name: after[name] - before[name] for name in before})
+
+
+class ResponseCache:
+    """
+    Cached list responses. Each key includes the current generation of every model the view reads, and a
+    committed write to one of those models replaces its generation, so stale entries are never read again
+    and simply expire.
+    """
+    prefix = 'responses'
+    stats_names = ('hits', 'misses', 'invalidations')
+    pending = CommitBatch(lambda names: ResponseCache._bump(names))
+
+    @classmethod
+    def models(cls):
+        from order.models import Order, OrderSource, OrderSpecification
+        from resources.models import Resource, ResourceDelivery, ResourceProvider
+        from specification.models import Specification, SpecificationCategory, SpecificationResource
+
+        return [Order, OrderSource, OrderSpecification, Resource, ResourceDelivery, ResourceProvider, Specification,
+                SpecificationCategory, SpecificationResource]
+
+    @classmethod
+    def cache(cls):
+        return caches[settings.RESPONSE_CACHE_ALIAS]
+
+    @classmethod
+    def enabled(cls):
+        # A local memory cache would miss the invalidations made by other processes.
+        return not isinstance(cls.cache(), LocMemCache)
+
+    @classmethod
+    def key(cls, scope, models, params):
+        cache = cls.cache()
+        names = {f"{cls.prefix}:generation:{model._meta.label_lower}": model for model in models}
+        generations = cache.get_many(names.keys())
+        missing = {name: uuid.uuid4().hex for name in names if name not in generations}
+        if len(missing) != 0:
+            cache.set_many(missing, timeout=None)
+            generations.update(missing)
+        digest = hashlib.md5(json.dumps([sorted(generations.items()), params], sort_keys=True).encode()).hexdigest()
+        return f"{cls.prefix}:{scope}:{digest}"
+
+    @classmethod
+    def get(cls, key):
+        data = cls.cache().get(key)
+        cls._incr('hits' if data is not None else 'misses')
+        return data
+
+    @classmethod
+    def set(cls, key, data):
+        cls.cache().set(key, data, timeout=settings.RESPONSE_CACHE_TIMEOUT)
+
+    @classmethod
+    def invalidate(cls, *models):
+        # Bumped once per transaction after commit, so a reader can't cache rows of the old generation under
+        # the new one.
+        cls.pending.add(*[f"{cls.prefix}:generation:{model._meta.label_lower}" for model in models])
+
+    @classmethod
+    def stats(cls):
+        values = cls.cache().get_many([f"{cls.prefix}:stats:{name}" for name in cls.stats_names])
+        return {name: values.get(f"{cls.prefix}:stats:{name}", 0) for name in cls.stats_names}
+
+    @classmethod
+    def _bump(cls, names):
+        cls.cache().set_many({name: uuid.uuid4().hex for name in names}, timeout=None)
+        cls._incr('invalidations', len(names))
+
+    @classmethod
+    def _incr(cls, name, delta=1):
+        key = f"{cls.prefix}:stats:{name}"
+        cache = cls.cache()
+        if not cache.add(key, delta, timeout=None):
+            try:
+                cache.incr(key, delta)
+            except ValueError:
+                cache.set(key, delta, timeout=None)
+
+
+class Versions:
+    """
+    Monotonic per-app version stamps, bumped after every committed write to the app's models. Views derive
+    ETags from them, so a conditional GET is answered with one primary key lookup.
+    """
+
+    pending = CommitBatch(lambda apps: Versions._bump(apps))
+
+    @classmethod
+    def get(cls, apps):
+        versions = dict(VersionStamp.objects.filter(app__in=apps).values_list('app', 'version'))
+        return [versions.get(app, 0) for app in apps]
+
+    @classmethod
+    def bump(cls, *apps):
+        # Collected per transaction, so a transaction bumps each app once however many rows it writes.
+        cls.pending.add(*apps)
+
+    @classmethod
+    def _bump(cls, apps):
+        apps = sorted(apps)
+        existing = set(VersionStamp.objects.filter(app__in=apps).values_list('app', flat=True))
+        for app in apps:
+            if app not in existing:
+                VersionStamp.objects.get_or_create(app=app)
+        VersionStamp.objects.filter(app__in=apps).update(version=F('version') + 1)
@@ -0,0 +1,19 @@
+from django.db.models.signals import post_save, post_delete
+
+from utils.db.signals import bulk_changed
+from .service import ResponseCache, Versions
+
+
+def invalidate_responses(sender, **kwargs):
+    ResponseCache.invalidate(sender)
+
+
+def bump_version(sender, **kwargs):
+    Versions.bump(sender._meta.app_label)
+
+
+def connect():
+    for model in ResponseCache.models():
+        for signal in (post_save, post_delete, bulk_changed):
+            signal.connect(invalidate_responses, sender=model, dispatch_uid=f'responses:{model._meta.label_lower}')
+            signal.connect(bump_version, sender=model, dispatch_uid=f'versions:{model._meta.label_lower}')
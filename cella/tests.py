@@ -1,3 +1,197 @@
-from django.test import TestCase
+import io
+import tempfile
+import time
+from datetime import timedelta
 
-# Create your tests here.
+import pandas as pd
+from django.core.files.base import ContentFile
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from order.service import Orders
+from resources.models import Resource
+from resources.service import Resources
+from specification.service import Specifications
+from .models import File, Job, OutboxMessage
+from .service import Jobs, JobProgress, Outbox, Counters, ResponseCache, Versions
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class JobTest(TestCase):
+
+    def makeExcelFile(self, rows):
+        excel = pd.DataFrame(rows, columns=['Спецификация / Ресурс', 'ID', 'Название', 'Количество ', 'Цена',
+                                            'Поставщик'])
+        content = io.BytesIO()
+        excel.to_excel(content, index=False)
+        file = File()
+        file.file.save('resources.xlsx', ContentFile(content.getvalue()))
+        return file
+
+    def testClaimOldestPending(self):
+        file = self.makeExcelFile([])
+        first = Jobs.enqueue(Job.JobKind.RESOURCES_EXCEL, file)
+        second = Jobs.enqueue(Job.JobKind.RESOURCES_EXCEL, file)
+
+        self.assertEqual(Jobs.claim(1), [first.id])
+        self.assertEqual(Jobs.claim(2), [second.id])
+        self.assertEqual(Jobs.claim(1), [])
+        self.assertTrue(Jobs.get(first.id).running())
+
+    def testRunResourcesExcel(self):
+        file = self.makeExcelFile([
+            ['resource', 1, 'Resource 1', 5, 10, 'Provider 1'],
+            ['resource', 2, None, 3, 20, None],
+            ['resource', 3, 'Resource 3', 1, 1, None],
+        ])
+        job = Jobs.enqueue(Job.JobKind.RESOURCES_EXCEL, file)
+        Jobs.claim(1)
+        Jobs.run(job.id)
+
+        job = Jobs.get(job.id)
+        self.assertEqual(job.status, Job.JobStatus.DONE)
+        self.assertEqual(job.total_rows, 3)
+        self.assertEqual(job.processed_rows, 3)
+        self.assertEqual(job.created_rows, 2)
+        self.assertEqual(job.errors, [{'row': 3, 'error': "'Название' is empty"}])
+        self.assertEqual(Resource.objects.count(), 2)
+
+
+class JobHeartbeatTest(TransactionTestCase):
+
+    def testHeartbeatKeepsSlowJobFresh(self):
+        job = Jobs.enqueue(Job.JobKind.RESOURCES_EXCEL, File.objects.create(file='resources.xlsx'))
+        Jobs.claim(1)
+        Job.objects.filter(id=job.id).update(updated_at=timezone.now() - timedelta(hours=1))
+
+        progress = JobProgress(job)
+        progress.start_heartbeat(interval=0.05)
+        time.sleep(0.3)
+        progress.stop_heartbeat()
+
+        self.assertEqual(Jobs.requeue_stale(timeout=60), [])
+        self.assertTrue(Jobs.get(job.id).running())
+
+
+class OutboxTest(TestCase):
+    endpoint = OutboxMessage.OutboxEndpoint.PRICE
+
+    def testClaimSupersedesOlderMessagesWithSameKey(self):
+        old, other, new = Outbox.push_many(self.endpoint, [{'ID': '1', 'price': 1.0}, {'ID': '2', 'price': 1.0},
+                                                           {'ID': '1', 'price': 2.0}],
+                                           keys=['price:1', 'price:2', 'price:1'])
+
+        self.assertEqual([message.id for message in Outbox.claim(10)], [other.id, new.id])
+        self.assertEqual(OutboxMessage.objects.get(id=old.id).status, OutboxMessage.OutboxStatus.SUPERSEDED)
+        self.assertEqual(Outbox.claim(10), [])
+
+    def testCompleteRetriesWithBackoff(self):
+        sent, failed = Outbox.push_many(self.endpoint, [{'ID': '1'}, {'ID': '2'}])
+        Outbox.complete([(sent.id, None), (failed.id, 'HTTP 500')])
+
+        sent = OutboxMessage.objects.get(id=sent.id)
+        failed = OutboxMessage.objects.get(id=failed.id)
+        self.assertEqual(sent.status, OutboxMessage.OutboxStatus.SENT)
+        self.assertEqual(failed.status, OutboxMessage.OutboxStatus.PENDING)
+        self.assertEqual(failed.attempts, 1)
+        self.assertEqual(failed.last_error, 'HTTP 500')
+        self.assertGreater(failed.next_attempt_at, failed.created_at)
+        self.assertEqual(Outbox.claim(10), [])
+
+
+class CountersTest(TestCase):
+
+    def testCountersFollowServiceChanges(self):
+        resource = Resources.create('Resource 1', '1', cost_value=1, amount_value=20, amount_limit=10, user='system')
+        specification = Specifications.create(name='Specification 1', product_id='100', user='system',
+                                              resources_create=[{'id': resource.id, 'amount': 15}])
+        order = Orders.create('order', products=[{'product_id': '100', 'amount': '1'}])
+        self.assertEqual(Counters.read(), Counters.rebuild())
+        self.assertEqual(Counters.read()['orders_inactive'], 1)
+
+        Resources.set_cost(resource, 2, user='system')
+        Orders.confirm(order)
+        self.assertEqual(Counters.read(), {
+            'orders_inactive': 0,
+            'orders_confirmed': 1,
+            'orders_canceled': 0,
+            'resources_expired': 1,
+            'specifications_unverified': 1,
+        })
+
+        Specifications.set_price(specification, 10)
+        Resources.bulk_delete([resource.id], user='system')
+        Orders.bulk_delete([order.id])
+        self.assertEqual(Counters.read(), Counters.rebuild())
+        self.assertEqual(sum(Counters.read().values()), 0)
+        self.assertFalse(Resource.objects.exists())
+
+
+class ResponseCacheTest(TransactionTestCase):
+
+    def setUp(self):
+        ResponseCache.cache().clear()
+        self.client = APIClient()
+        self.client.force_authenticate(get_user_model().objects.create_user(username='user', password='user'))
+        self.resource = Resource.objects.create(name='Resource 1', external_id='1', cost=1, amount=10)
+
+    def get(self, path):
+        return self.client.get(path, {'ordering': 'name'}).data
+
+    def testListIsCachedUntilModelChanges(self):
+        Specifications.create(name='Specification 1', product_id='100', user='system',
+                              resources_create=[{'id': self.resource.id, 'amount': 1}])
+        self.assertEqual(self.get('/resource/list/')['results'][0]['amount'], '10.00')
+        self.assertEqual(self.get('/specification/list/')['results'][0]['available_to_assemble'], 10)
+        self.get('/specification/categories/')
+        self.get('/resource/list/')
+
+        Resource.objects.filter(id=self.resource.id).update(amount=5)
+        self.assertEqual(self.get('/resource/list/')['results'][0]['amount'], '5.00')
+        self.assertEqual(self.get('/specification/list/')['results'][0]['available_to_assemble'], 5)
+        self.get('/specification/categories/')
+
+        stats = self.client.get('/cella/cache/').data
+        self.assertEqual((stats['hits'], stats['misses']), (2, 5))
+
+    @override_settings(CACHES={
+        'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+        'responses': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'responses'},
+    })
+    def testLocalMemoryCacheIsNotUsed(self):
+        self.get('/resource/list/')
+        self.get('/resource/list/')
+        self.assertEqual(ResponseCache.stats(), {'hits': 0, 'misses': 0, 'invalidations': 0})
+
+    def testInvalidatedOncePerTransaction(self):
+        invalidations = ResponseCache.stats()['invalidations']
+        with transaction.atomic():
+            for number in range(3):
+                Resource.objects.create(name=f'Resource {number}', external_id=f'r{number}', cost=1, amount=1)
+            Resource.objects.update(amount=2)
+            self.assertEqual(ResponseCache.stats()['invalidations'], invalidations)
+        self.assertEqual(ResponseCache.stats()['invalidations'], invalidations + 1)
+        self.assertEqual(Versions.get(['resources']), [2])
+
+        with self.assertRaises(ValueError):
+            with transaction.atomic():
+                Resource.objects.update(amount=3)
+                raise ValueError()
+        with transaction.atomic():
+            Resource.objects.update(amount=4)
+        self.assertEqual(ResponseCache.stats()['invalidations'], invalidations + 2)
+        self.assertEqual(Versions.get(['resources']), [3])
+
+    def testConditionalGet(self):
+        etag = self.client.get(f'/resource/{self.resource.id}/')['ETag']
+        self.assertEqual(self.client.get(f'/resource/{self.resource.id}/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.assertEqual(self.client.get('/specification/list/', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+        Resources.change_amount(self.resource.id, 1)
+        response = self.client.get(f'/resource/{self.resource.id}/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(Versions.get(['resources', 'order']), [2, 0])
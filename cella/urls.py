@@ -0,0 +1,9 @@
+from django.urls import path
+
+from cella.views import JobDetailView, DashboardView, ResponseCacheStatsView
+
+urlpatterns = [
+    path('job/<int:j_id>/', JobDetailView.as_view()),
+    path('dashboard/', DashboardView.as_view()),
+    path('cache/', ResponseCacheStatsView.as_view()),
+]
@@ -0,0 +1,42 @@
+from logging import getLogger
+
+from django.http import Http404
+from rest_framework import status
+from rest_framework.generics import RetrieveAPIView
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from authentication.permissions import DefaultPermission
+from cella.serializer import JobSerializer
+from cella.service import Jobs, Counters, ResponseCache
+
+logger = getLogger(__name__)
+
+
+class JobDetailView(RetrieveAPIView):
+    serializer_class = JobSerializer
+    permission_classes = [DefaultPermission]
+
+    def get_object(self):
+        j_id = self.kwargs['j_id']
+        try:
+            job = Jobs.get(j_id)
+        except Jobs.DoesNotExist:
+            logger.warning(f"Can`t get object 'Job' with id: {j_id} | {self.__class__.__name__}")
+            raise Http404()
+
+        return job
+
+
+class DashboardView(APIView):
+    permission_classes = [DefaultPermission]
+
+    def get(self, request, *args, **kwargs):
+        return Response(data=Counters.read(), status=status.HTTP_200_OK)
+
+
+class ResponseCacheStatsView(APIView):
+    permission_classes = [DefaultPermission]
+
+    def get(self, request, *args, **kwargs):
+        return Response(data=ResponseCache.stats(), status=status.HTTP_200_OK)
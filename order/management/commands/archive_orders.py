@@ -0,0 +1,16 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from order.service import Orders
+
+
+class Command(BaseCommand):
+    help = 'Archives confirmed and canceled orders older than the given age.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=settings.ORDER_ARCHIVE_AFTER_DAYS)
+        parser.add_argument('--batch-size', type=int, default=settings.ORDER_ARCHIVE_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        archived = Orders.archive_old(options['days'], options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"Archived {archived} orders"))
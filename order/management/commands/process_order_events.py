@@ -0,0 +1,22 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from order.service import OrderEvents
+
+
+class Command(BaseCommand):
+    help = 'Applies received Bitrix order events.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=settings.ORDER_EVENT_BATCH_SIZE)
+        parser.add_argument('--poll-interval', type=float, default=settings.ORDER_EVENT_POLL_INTERVAL)
+        parser.add_argument('--once', action='store_true', help='Exit when there are no pending events left.')
+
+    def handle(self, *args, **options):
+        while True:
+            if OrderEvents.process(options['batch_size']) == 0:
+                if options['once']:
+                    return
+                time.sleep(options['poll_interval'])
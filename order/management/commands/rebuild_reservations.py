@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from order.service import Reservations
+
+
+class Command(BaseCommand):
+    help = 'Drops all reservations and reserves stock for every inactive order again.'
+
+    def handle(self, *args, **options):
+        created = Reservations.rebuild()
+        self.stdout.write(self.style.SUCCESS(f"Created {created} reservations"))
@@ -0,0 +1,23 @@
+# Generated by Django 3.1.5 on 2026-10-17 23:34
+
+import django.contrib.postgres.indexes
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('order', '0002_auto_20210323_1854'),
+        ('resources', '0005_trigram_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='order',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['external_id'], name='order_external_id_trgm', opclasses=['gin_trgm_ops']),
+        ),
+        migrations.AddIndex(
+            model_name='ordersource',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['name'], name='ordersource_name_trgm', opclasses=['gin_trgm_ops']),
+        ),
+    ]
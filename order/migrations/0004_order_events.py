@@ -0,0 +1,37 @@
+# Generated by Django 3.1.5 on 2026-10-17 23:44
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('order', '0003_trigram_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OrderEvent',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=150, unique=True)),
+                ('external_id', models.CharField(max_length=100)),
+                ('kind', models.CharField(choices=[('CRT', 'Create'), ('CHG', 'Change'), ('SHP', 'Ship'), ('CNL', 'Cancel')], max_length=3)),
+                ('payload', models.JSONField()),
+                ('status', models.CharField(choices=[('PND', 'Pending'), ('DNE', 'Done'), ('SKP', 'Skipped'), ('FLD', 'Failed')], default='PND', max_length=3)),
+                ('error', models.TextField(null=True)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('processed_at', models.DateTimeField(null=True)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='order',
+            name='external_id',
+            field=models.CharField(db_index=True, max_length=100),
+        ),
+        migrations.AddIndex(
+            model_name='orderevent',
+            index=models.Index(fields=['status', 'external_id', 'id'], name='order_order_status_2d3ab3_idx'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 3.1.5 on 2026-10-17 23:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('order', '0004_order_events'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(condition=models.Q(_negated=True, status='ARC'), fields=['status', 'created_at'], name='order_active_status_idx'),
+        ),
+    ]
@@ -1,13 +1,24 @@
+from django.contrib.postgres.indexes import GinIndex
 from django.db import models
+from django.utils import timezone
 
 from cella.models import Operator
+from resources.models import Resource
 from specification.models import Specification
+from utils.db.query import SignalingQuerySet
 
 
 class OrderSource(models.Model):
     name = models.CharField(max_length=150)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    objects = SignalingQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            GinIndex(fields=['name'], name='ordersource_name_trgm', opclasses=['gin_trgm_ops'])
+        ]
+
     def __str__(self):
         return f"{self.name}"
 
@@ -19,11 +30,21 @@ class Order(models.Model):
         CONFIRMED = 'CNF', 'Confirmed'
         CANCELED = 'CND', 'Canceled'
 
-    external_id = models.CharField(max_length=100)
+    external_id = models.CharField(max_length=100, db_index=True)
     status = models.CharField(max_length=3, choices=OrderStatus.choices, default=OrderStatus.INACTIVE)
     created_at = models.DateTimeField(auto_now_add=True)
     source = models.ForeignKey(OrderSource, on_delete=models.SET_NULL, null=True)
 
+    objects = SignalingQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            GinIndex(fields=['external_id'], name='order_external_id_trgm', opclasses=['gin_trgm_ops']),
+            # Archived orders are the bulk of the table and are never listed.
+            models.Index(fields=['status', 'created_at'], name='order_active_status_idx',
+                         condition=~models.Q(status='ARC'))
+        ]
+
     def canceled(self):
         return self.status == Order.OrderStatus.CANCELED
 
@@ -51,3 +72,47 @@ class OrderSpecification(models.Model):
     specification = models.ForeignKey(Specification, on_delete=models.CASCADE, related_name='order_specifications')
     amount = models.IntegerField()
     assembled = models.BooleanField(default=False)
+
+    objects = SignalingQuerySet.as_manager()
+
+
+class Reservation(models.Model):
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='reservations')
+    specification = models.ForeignKey(Specification, on_delete=models.CASCADE, related_name='reservations',
+                                      null=True)
+    resource = models.ForeignKey(Resource, on_delete=models.CASCADE, related_name='reservations', null=True)
+    amount = models.DecimalField(max_digits=12, decimal_places=2)
+
+    def __str__(self):
+        return f"Reservation {self.order_id} - {self.specification_id or self.resource_id} {self.amount}"
+
+
+class OrderEvent(models.Model):
+    class EventKind(models.TextChoices):
+        CREATE = 'CRT', 'Create'
+        CHANGE = 'CHG', 'Change'
+        SHIP = 'SHP', 'Ship'
+        CANCEL = 'CNL', 'Cancel'
+
+    class EventStatus(models.TextChoices):
+        PENDING = 'PND', 'Pending'
+        DONE = 'DNE', 'Done'
+        SKIPPED = 'SKP', 'Skipped'
+        FAILED = 'FLD', 'Failed'
+
+    key = models.CharField(max_length=150, unique=True)
+    external_id = models.CharField(max_length=100)
+    kind = models.CharField(max_length=3, choices=EventKind.choices)
+    payload = models.JSONField()
+    status = models.CharField(max_length=3, choices=EventStatus.choices, default=EventStatus.PENDING)
+    error = models.TextField(null=True)
+    created_at = models.DateTimeField(default=timezone.now)
+    processed_at = models.DateTimeField(null=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'external_id', 'id'])
+        ]
+
+    def __str__(self):
+        return f"{self.get_kind_display()} {self.external_id} - {self.get_status_display()}"
@@ -3,6 +3,7 @@ from rest_framework import serializers
 from order.models import OrderSpecification, OrderSource, Order
 from order.service import Orders
 from specification.serializer import SpecificationShortSerializer, SpecificationSerializer
+from utils.serializer import ValuesSerializer
 
 
 class OrderSpecificationSerializer(serializers.ModelSerializer):
@@ -84,6 +85,37 @@ class OrderSerializer(serializers.ModelSerializer):
         read_only_fields = ['status']
 
 
+class OrderValuesSerializer(ValuesSerializer):
+    serializer_class = OrderSerializer
+    computed_fields = ('missing_resources', 'missing_specifications')
+
+    @classmethod
+    def compute(cls, rows):
+        shortages = Orders.shortages([row['pk'] for row in rows])
+        for row in rows:
+            row['missing_specifications'], row['missing_resources'] = shortages.get(row['pk'], (set(), set()))
+
+
+class OrderBulkItemSerializer(serializers.Serializer):
+    action = serializers.ChoiceField(choices=['create', 'change', 'ship', 'cancel'])
+    external_id = serializers.CharField(max_length=100)
+    source_name = serializers.CharField(max_length=100, allow_null=True, required=False, allow_blank=True)
+    specifications_create = OrderSpecificationCreateUpdateSerializer(many=True, required=False)
+
+    validate_specifications_create = OrderSerializer.validate_specifications_create
+
+    def validate(self, attrs):
+        if attrs['action'] in ('create', 'change') and 'specifications_create' not in attrs:
+            raise serializers.ValidationError({'specifications_create': 'This field is required.'})
+        return attrs
+
+    def update(self, instance, validated_data):
+        pass
+
+    def create(self, validated_data):
+        pass
+
+
 class ProductSerializer(serializers.Serializer):
     def update(self, instance, validated_data):
         pass
@@ -1,22 +1,118 @@
-import asyncio
+import hashlib
+import json
+from datetime import timedelta
+from decimal import Decimal
+from itertools import groupby
 from typing import List, Dict
 import logging
 
-import aiohttp
-from asgiref.sync import async_to_sync
+import numpy as np
+
 from django.conf import settings
 from django.core.exceptions import ObjectDoesNotExist
 from django.db import IntegrityError, transaction, DatabaseError
-from django.db.models import Count, Q
-
-from order.models import Order, OrderSource, OrderSpecification
-from specification.models import Specification
+from django.db.models import F, Sum, DecimalField, Exists, OuterRef, Case, When, Value, Prefetch
+from django.utils import timezone
+
+from cella.models import OutboxMessage
+from cella.service import Outbox, Counters
+from order.models import Order, OrderSource, OrderSpecification, OrderEvent, Reservation
+from resources.models import Resource, StockMovement
+from resources.service import Stock
+from specification.models import Specification, SpecificationResource
 from specification.service import Specifications
-from utils.function import product_amounts
 
 logger = logging.getLogger(__name__)
 
 
+class Reservations:
+    """
+    Stock promised to inactive orders. An order reserves the unreserved stock of its specifications first and
+    the resources to build the rest, the same way confirm_many draws stock. `reserved` on specifications and
+    resources is kept equal to the sum of their reservation rows.
+    """
+
+    @classmethod
+    def reserve(cls, order_ids):
+        with transaction.atomic():
+            lines = list(OrderSpecification.objects.filter(
+                order_id__in=order_ids, order__status=Order.OrderStatus.INACTIVE
+            ).order_by('order_id', 'id').values_list('order_id', 'specification_id', 'amount'))
+            if len(lines) == 0:
+                return 0
+
+            specification_ids = {specification_id for _, specification_id, _ in lines}
+            bom = {}
+            for specification_id, resource_id, amount in SpecificationResource.objects.filter(
+                    specification_id__in=specification_ids).values_list('specification_id', 'resource_id', 'amount'):
+                bom.setdefault(specification_id, []).append((resource_id, amount))
+            available = {pk: amount - reserved for pk, amount, reserved in
+                         Specification.objects.select_for_update().filter(id__in=specification_ids).order_by(
+                             'id').values_list('id', 'amount', 'reserved')}
+
+            amounts = {}
+            for order_id, specification_id, amount in lines:
+                taken = min(amount, max(available[specification_id], 0))
+                available[specification_id] -= taken
+                if taken != 0:
+                    key = (order_id, 'specification', specification_id)
+                    amounts[key] = amounts.get(key, 0) + taken
+                for resource_id, resource_amount in bom.get(specification_id, []):
+                    if amount - taken != 0:
+                        key = (order_id, 'resource', resource_id)
+                        amounts[key] = amounts.get(key, 0) + resource_amount * (amount - taken)
+
+            Reservation.objects.bulk_create([
+                Reservation(**{'order_id': order_id, f'{field}_id': pk}, amount=amount)
+                for (order_id, field, pk), amount in amounts.items()
+            ])
+            cls._add(amounts.items())
+        return len(amounts)
+
+    @classmethod
+    def release(cls, order_ids):
+        with transaction.atomic():
+            reservations = list(Reservation.objects.filter(order_id__in=order_ids).values_list(
+                'order_id', 'specification_id', 'resource_id', 'amount'))
+            if len(reservations) == 0:
+                return 0
+            cls._add([((order_id, 'specification', specification_id), -amount)
+                      if specification_id is not None else ((order_id, 'resource', resource_id), -amount)
+                      for order_id, specification_id, resource_id, amount in reservations])
+            Reservation.objects.filter(order_id__in=order_ids).delete()
+        return len(reservations)
+
+    @classmethod
+    def rebuild(cls):
+        """
+        Drops all reservations and reserves every inactive order again, oldest first.
+        """
+        with transaction.atomic():
+            Reservation.objects.all().delete()
+            Specification.objects.exclude(reserved=0).update(reserved=0)
+            Resource.objects.exclude(reserved=0).update(reserved=0)
+            return cls.reserve(list(Order.objects.filter(status=Order.OrderStatus.INACTIVE).order_by(
+                'id').values_list('id', flat=True)))
+
+    @classmethod
+    def _add(cls, amounts):
+        deltas = {'specification': {}, 'resource': {}}
+        for (_, field, pk), amount in amounts:
+            deltas[field][pk] = deltas[field].get(pk, 0) + amount
+
+        # Specifications before resources, as in Stock.
+        for model, field in ((Specification, 'specification'), (Resource, 'resource')):
+            model_deltas = {pk: delta for pk, delta in deltas[field].items() if delta != 0}
+            if len(model_deltas) == 0:
+                continue
+            list(model.objects.select_for_update().filter(id__in=model_deltas.keys()).order_by('id').values_list('id'))
+            model.objects.filter(id__in=model_deltas.keys()).update(reserved=F('reserved') + Case(
+                *[When(id=pk, then=Value(delta)) for pk, delta in model_deltas.items()],
+                default=Value(0),
+                output_field=model._meta.get_field('reserved')
+            ))
+
+
 class Orders:
     class AssembleError(Exception):
         pass
@@ -36,6 +132,8 @@ class Orders:
     class ActionError(Exception):
         pass
 
+    mrp_usage_days = 30
+
     @classmethod
     def get_by_external_id(cls, external_id):
         return Order.objects.get(external_id=external_id)
@@ -57,12 +155,9 @@ class Orders:
 
     @classmethod
     def list(cls):
-        orders = Order.objects.prefetch_related(
+        orders = Order.objects.select_related('source').prefetch_related(
             'order_specifications',
-            'order_specifications__specification',
-            'order_specifications__specification__res_specs',
-            'order_specifications__specification__res_specs__resource'
-
+            'order_specifications__specification'
         ).exclude(
             status__in=[
                 Order.OrderStatus.ARCHIVED
@@ -72,57 +167,183 @@ class Orders:
 
     @classmethod
     def add_assembling_info(cls, orders):
+        shortages = cls.shortages([order.id for order in orders])
         for order in orders:
-            m, n = cls.assembling_info(order)
+            m, n = shortages.get(order.id, (set(), set()))
             order.missing_resources = n
             order.missing_specifications = m
         return orders
 
     @classmethod
     def assembling_info(cls, order):
-        if not isinstance(order, Order):
-            order = Order.objects.prefetch_related(
-                'order_specifications',
-                'order_specifications__specification',
-                'order_specifications__specification__res_specs',
-                'order_specifications__specification__res_specs__resource'
-            ).get(id=order)
-
-        resources = {}
-        miss_resources = set()
-        miss_specification = set()
-        try:
-            for order_spec in order.order_specifications.all():
-                specification = order_spec.specification
-
-                for res_spec in specification.res_specs.all():
-                    resource = res_spec.resource
-
-                    if resource.id not in resources:
-                        resources[resource.id] = [
-                            resource.amount,
-                            res_spec.amount * (order_spec.amount - specification.amount)
-                        ]
+        order_id = order.id if isinstance(order, Order) else order
+        return cls.shortages([order_id]).get(order_id, (set(), set()))
 
-                    else:
-                        resources[resource.id][1] += res_spec.amount * (order_spec.amount - specification.amount)
+    @classmethod
+    def shortages(cls, order_ids):
+        """
+        Returns {order_id: (missing specification ids, missing resource ids)} for the orders that can't be
+        assembled, aggregating BOM requirements per order and resource in the database.
+        """
+        order_field = 'specification__order_specifications__order_id'
+        try:
+            requirements = SpecificationResource.objects.filter(**{f'{order_field}__in': order_ids}).values(
+                order_field, 'resource_id', 'resource__amount'
+            ).annotate(required=Sum(
+                F('amount') * (F('specification__order_specifications__amount') - F('specification__amount')),
+                output_field=DecimalField(max_digits=12, decimal_places=2)
+            )).filter(required__gt=F('resource__amount')).values_list(order_field, 'resource_id')
+
+            missing = {}
+            for order_id, resource_id in requirements:
+                missing.setdefault(order_id, (set(), set()))[1].add(resource_id)
+            if len(missing) == 0:
+                return missing
+
+            for order_id, specification_id, resource_id in SpecificationResource.objects.filter(**{
+                f'{order_field}__in': missing.keys(),
+                'resource_id__in': set().union(*[resources for _, resources in missing.values()])
+            }).values_list(order_field, 'specification_id', 'resource_id').distinct():
+                if resource_id in missing[order_id][1]:
+                    missing[order_id][0].add(specification_id)
+        except DatabaseError:
+            logger.warning(f"Assemble info error. orders: {order_ids} | {cls.__name__}", exc_info=True)
+            raise cls.AssembleError()
+        return missing
 
-                    if resources[resource.id][0] < resources[resource.id][1]:
-                        miss_resources.add(resource.id)
-                        miss_specification.add(specification.id)
+    @classmethod
+    def mrp(cls, statuses=None, usage_days=None):
+        """
+        Nets the demand of all open orders against specification and resource stock.
+        Cover days are estimated from the resource consumption recorded over the last `usage_days`.
+        """
+        if statuses is None:
+            statuses = [Order.OrderStatus.INACTIVE]
+        if usage_days is None:
+            usage_days = cls.mrp_usage_days
+
+        rows = list(SpecificationResource.objects.filter(
+            specification__order_specifications__order__status__in=statuses, resource__isnull=False
+        ).values(
+            'id', 'specification__amount', 'amount', 'resource_id', 'resource__name', 'resource__external_id',
+            'resource__amount'
+        ).annotate(ordered=Sum('specification__order_specifications__amount')).values_list(
+            'specification__amount', 'amount', 'ordered', 'resource_id', 'resource__name', 'resource__external_id',
+            'resource__amount'
+        ))
+        if len(rows) == 0:
+            return []
+
+        specification_amount, bom_amount, ordered, resource_ids, names, external_ids, resource_amount = zip(*rows)
+        to_build = np.maximum(np.array(ordered, dtype=float) - np.array(specification_amount, dtype=float), 0)
+        resource_ids, first, inverse = np.unique(resource_ids, return_index=True, return_inverse=True)
+        required = np.bincount(inverse, weights=np.array(bom_amount, dtype=float) * to_build)
+        stock = np.array(resource_amount, dtype=float)[first]
+        shortage = np.maximum(required - stock, 0)
+
+        used = dict(StockMovement.objects.filter(
+            resource_id__in=resource_ids.tolist(),
+            delta__lt=0,
+            reason__in=[StockMovement.MovementReason.ORDER, StockMovement.MovementReason.BUILD],
+            created_at__gte=timezone.now() - timedelta(days=usage_days)
+        ).values('resource_id').annotate(used=Sum('delta')).values_list('resource_id', 'used'))
+        daily_usage = -np.array([float(used.get(resource_id, 0)) for resource_id in resource_ids.tolist()]) / usage_days
+        with np.errstate(divide='ignore', invalid='ignore'):
+            cover_days = np.where(daily_usage > 0, np.maximum(stock, 0) / daily_usage, np.nan)
+
+        report = []
+        for index in np.lexsort((np.nan_to_num(cover_days, nan=np.inf), -shortage)):
+            report.append({
+                'id': int(resource_ids[index]),
+                'name': names[first[index]],
+                'external_id': external_ids[first[index]],
+                'amount': stock[index],
+                'required': required[index],
+                'shortage': shortage[index],
+                'daily_usage': daily_usage[index],
+                'cover_days': None if np.isnan(cover_days[index]) else cover_days[index]
+            })
+        return report
 
-        except Exception:
-            logger.warning(f"Assemble info error. order: {order} | {cls.__name__}", exc_info=True)
-            raise cls.AssembleError()
-        return miss_specification, miss_resources
+    @classmethod
+    def allocate(cls, statuses=None):
+        """
+        Walks open orders by created_at and draws down stock the way confirm does: specifications from storage
+        first, the rest built from resources. An order that can't be fully covered is blocked and keeps no stock.
+        """
+        if statuses is None:
+            statuses = [Order.OrderStatus.INACTIVE]
+
+        lines = list(OrderSpecification.objects.filter(order__status__in=statuses).order_by(
+            'order__created_at', 'order_id').values_list('order_id', 'order__external_id', 'specification_id',
+                                                         'amount'))
+        if len(lines) == 0:
+            return []
+        order_ids, external_ids, line_specifications, line_amounts = zip(*lines)
+        line_amounts = np.array(line_amounts, dtype=float)
+
+        specification_ids, line_index = np.unique(line_specifications, return_inverse=True)
+        amounts = dict(Specification.objects.filter(id__in=specification_ids.tolist()).values_list('id', 'amount'))
+        specification_stock = np.array([amounts[pk] for pk in specification_ids.tolist()], dtype=float)
+
+        bom = list(SpecificationResource.objects.filter(
+            specification_id__in=specification_ids.tolist(), resource__isnull=False
+        ).order_by('specification_id').values_list('specification_id', 'resource_id', 'amount', 'resource__amount'))
+        if len(bom) != 0:
+            bom_specifications, bom_resources, bom_amounts, bom_stock = zip(*bom)
+        else:
+            bom_specifications, bom_resources, bom_amounts, bom_stock = (), (), (), ()
+        resource_ids, first, bom_index = np.unique(np.array(bom_resources, dtype=int), return_index=True,
+                                                   return_inverse=True)
+        resource_stock = np.array(bom_stock, dtype=float)[first]
+        bom_amounts = np.array(bom_amounts, dtype=float)
+        # BOM rows are sorted by specification, so each specification owns one slice of them.
+        offsets = np.searchsorted(np.array(bom_specifications, dtype=int),
+                                  np.append(specification_ids, specification_ids[-1] + 1))
+
+        boundaries = np.flatnonzero(np.diff(np.array(order_ids))) + 1
+        report = []
+        for start, end in zip(np.append(0, boundaries), np.append(boundaries, len(order_ids))):
+            specifications, local = np.unique(line_index[start:end], return_inverse=True)
+            required = np.bincount(local, weights=line_amounts[start:end])
+            take = np.minimum(np.maximum(specification_stock[specifications], 0), required)
+            build = required - take
+
+            slices = [np.arange(offsets[index], offsets[index + 1]) for index in specifications[build > 0]]
+            rows = np.concatenate(slices) if len(slices) != 0 else np.array([], dtype=int)
+            multiplier = np.repeat(build[build > 0], [len(rows_slice) for rows_slice in slices])
+            resources, resource_local = np.unique(bom_index[rows], return_inverse=True)
+            need = np.bincount(resource_local, weights=bom_amounts[rows] * multiplier, minlength=len(resources))
+
+            short = need > resource_stock[resources] + 1e-9
+            unbuildable = (build > 0) & (offsets[specifications + 1] == offsets[specifications])
+            missing_resources = set(resource_ids[resources[short]].tolist())
+            missing_specifications = set(specification_ids[specifications[unbuildable]].tolist())
+            if len(missing_resources) != 0:
+                blocked_rows = rows[np.isin(bom_index[rows], resources[short])]
+                missing_specifications.update(
+                    specification_ids[np.searchsorted(offsets, blocked_rows, side='right') - 1].tolist())
+
+            shippable = len(missing_resources) == 0 and len(missing_specifications) == 0
+            if shippable:
+                specification_stock[specifications] -= take
+                resource_stock[resources] -= need
+            report.append({
+                'id': order_ids[start],
+                'external_id': external_ids[start],
+                'shippable': shippable,
+                'missing_specifications': missing_specifications,
+                'missing_resources': missing_resources
+            })
+        return report
 
     @classmethod
     def detail(cls, order):
+        # The detail renders every BOM line, so it is loaded with two joined queries instead of a prefetch per level.
         order = Order.objects.prefetch_related(
-            'order_specifications',
-            'order_specifications__specification',
-            'order_specifications__specification__res_specs',
-            'order_specifications__specification__res_specs__resource',
+            Prefetch('order_specifications', queryset=OrderSpecification.objects.select_related('specification')),
+            Prefetch('order_specifications__specification__res_specs',
+                     queryset=SpecificationResource.objects.select_related('resource')),
         ).get(id=order)
         m, n = cls.assembling_info(order)
         order.missing_resources = n
@@ -132,66 +353,240 @@ class Orders:
     @classmethod
     def delete(cls, order, user=None):
         order = cls.get(order)
-        order.delete()
+        cls.bulk_delete([order.id], user)
 
     @classmethod
     def bulk_delete(cls, ids, user=None):
-        Order.objects.filter(id__in=ids).delete()
+        with Counters.track(Order, ids):
+            Reservations.release(ids)
+            Order.objects.filter(id__in=ids).delete()
+
+    @classmethod
+    def confirm(cls, order, user=None, notify=False):
+        cls._single_action(cls.confirm_many, order, Order.OrderStatus.CONFIRMED, user, notify)
+
+    @classmethod
+    def cancel(cls, order, user=None, notify=False):
+        cls._single_action(cls.cancel_many, order, Order.OrderStatus.CANCELED, user, notify)
 
     @classmethod
-    def confirm(cls, order, user=None):
+    def confirm_many(cls, orders, user=None, notify=False):
+        """
+        Confirms orders in one transaction. Stock is drawn the same way for every order (specifications from
+        storage first, the shortfall built from resources), but the deltas of all orders are applied at once.
+        Returns {order id: error message or None}.
+        """
+        order_ids = cls._ids(orders)
         try:
             with transaction.atomic():
-                order = cls.get(order)
-                for order_specification in order.order_specifications.all():
-                    specification = order_specification.specification
-                    if specification.amount >= order_specification.amount:
-                        specification.amount -= order_specification.amount
+                locked = cls._lock_many(order_ids)
+                results = cls._check_status(order_ids, locked, [Order.OrderStatus.INACTIVE])
+                orders = [order for order in locked.values() if results[order.id] is None]
+
+                lines = list(OrderSpecification.objects.filter(order__in=orders).order_by(
+                    'order_id', 'id').values_list('specification_id', 'amount'))
+                bom = {}
+                for specification_id, resource_id, amount in SpecificationResource.objects.filter(
+                        specification_id__in={specification_id for specification_id, _ in lines}
+                ).values_list('specification_id', 'resource_id', 'amount'):
+                    bom.setdefault(specification_id, []).append((resource_id, amount))
+                amounts = Stock.lock(Specification, {specification_id for specification_id, _ in lines})
+
+                specification_deltas = {}
+                resource_deltas = {}
+                for specification_id, amount in lines:
+                    available = amounts[specification_id]
+                    if available >= amount:
+                        amounts[specification_id] = available - amount
                     else:
-                        missing_amount = order_specification.amount - specification.amount
-                        specification.amount = 0
-                        for specification_resource in specification.res_specs.all():
-                            resource = specification_resource.resource
-                            resource.amount -= specification_resource.amount * missing_amount
-                            resource.save()
-                    Specifications.notify_new_amount(specification)
-                    specification.save()
-                order.confirm()
-                order.save()
-        except Exception:
-            logger.error(f"Error while confirming order: {order} | {cls.__name__}", exc_info=True)
-            raise cls.ActionError(f"Error while confirming order: {order} | {cls.__name__}")
-
-    @classmethod
-    def cancel(cls, order, user=None):
-        order.cancel()
-        order.save()
+                        missing_amount = amount - available
+                        amounts[specification_id] = 0
+                        for resource_id, resource_amount in bom.get(specification_id, []):
+                            resource_deltas[resource_id] = resource_deltas.get(resource_id, 0) - \
+                                resource_amount * missing_amount
+                    specification_deltas[specification_id] = amounts[specification_id] - available + \
+                        specification_deltas.get(specification_id, 0)
+
+                Stock.change_specifications(specification_deltas, StockMovement.MovementReason.ORDER)
+                Stock.change_resources(resource_deltas, StockMovement.MovementReason.ORDER)
+                cls._set_status(orders, Order.OrderStatus.CONFIRMED, notify)
+        except DatabaseError:
+            logger.error(f"Error while confirming orders: {order_ids} | {cls.__name__}", exc_info=True)
+            raise cls.ActionError(f"Error while confirming orders: {order_ids} | {cls.__name__}")
+        return results
+
+    @classmethod
+    def cancel_many(cls, orders, user=None, notify=False):
+        order_ids = cls._ids(orders)
+        try:
+            with transaction.atomic():
+                locked = cls._lock_many(order_ids)
+                results = cls._check_status(order_ids, locked,
+                                            [Order.OrderStatus.INACTIVE, Order.OrderStatus.CONFIRMED])
+                cls._set_status([order for order in locked.values() if results[order.id] is None],
+                                Order.OrderStatus.CANCELED, notify)
+        except DatabaseError:
+            logger.error(f"Error while canceling orders: {order_ids} | {cls.__name__}", exc_info=True)
+            raise cls.ActionError(f"Error while canceling orders: {order_ids} | {cls.__name__}")
+        return results
+
+    @classmethod
+    def _single_action(cls, action, order, new_status, user, notify):
+        order_id = cls._ids([order])[0]
+        error = action([order_id], user, notify)[order_id]
+        if error is not None:
+            logger.warning(f"Action error for order {order_id}: {error} | {cls.__name__}")
+            raise cls.ActionError(error)
+        if isinstance(order, Order):
+            order.status = new_status
+
+    @classmethod
+    def _ids(cls, orders):
+        return [order.id if isinstance(order, Order) else int(order) for order in orders]
+
+    @classmethod
+    def _lock_many(cls, order_ids):
+        return {order.id: order for order in
+                Order.objects.select_for_update().filter(id__in=order_ids).order_by('id')}
+
+    @classmethod
+    def _check_status(cls, order_ids, orders, allowed):
+        results = {}
+        for order_id in order_ids:
+            order = orders.get(order_id)
+            if order is None:
+                results[order_id] = f"Order with id {order_id} does not exist"
+            elif order.status not in allowed:
+                results[order_id] = f"Wrong status: {order.status}"
+            else:
+                results[order_id] = None
+        return results
+
+    @classmethod
+    def _set_status(cls, orders, status, notify):
+        with Counters.track(Order, [order.id for order in orders]):
+            Reservations.release([order.id for order in orders])
+            Order.objects.filter(id__in=[order.id for order in orders]).update(status=status)
+        for order in orders:
+            order.status = status
+        if notify:
+            cls.notify_new_status_many(orders)
 
     @classmethod
     def archive(cls, order, user=None):
-        order.archive()
-        order.save()
+        with Counters.track(Order, [order.id]):
+            Reservations.release([order.id])
+            order.archive()
+            order.save()
+
+    @classmethod
+    def archive_old(cls, age_days=None, batch_size=None):
+        """
+        Archives confirmed and canceled orders older than `age_days` in batches, one transaction per batch.
+        """
+        if age_days is None:
+            age_days = settings.ORDER_ARCHIVE_AFTER_DAYS
+        if batch_size is None:
+            batch_size = settings.ORDER_ARCHIVE_BATCH_SIZE
+        cutoff = timezone.now() - timedelta(days=age_days)
+
+        archived = 0
+        while True:
+            with transaction.atomic():
+                ids = list(Order.objects.select_for_update(skip_locked=True).filter(
+                    status__in=[Order.OrderStatus.CONFIRMED, Order.OrderStatus.CANCELED],
+                    created_at__lt=cutoff
+                ).order_by('id').values_list('id', flat=True)[:batch_size])
+                if len(ids) == 0:
+                    break
+                with Counters.track(Order, ids):
+                    Order.objects.filter(id__in=ids).update(status=Order.OrderStatus.ARCHIVED)
+            archived += len(ids)
+        if archived != 0:
+            logger.info(f"Archived {archived} orders older than {age_days} days | {cls.__name__}")
+        return archived
 
     @classmethod
     def notify_new_status(cls, order):
-        request_body = cls.form_request_body_for_changed_status(order)
-        async_to_sync(send_status)(request_body)
+        cls.notify_new_status_many([order])
+
+    @classmethod
+    def notify_new_status_many(cls, orders):
+        Outbox.push_many(OutboxMessage.OutboxEndpoint.STATUS,
+                         [cls.form_request_body_for_changed_status(order) for order in orders],
+                         keys=[f"status:{order.external_id}" for order in orders])
 
     @classmethod
     def change(cls, external_id, source: str = None, products: List[Dict[str, str]] = None, user=None):
         try:
             with transaction.atomic():
-                order = Order.objects.get(external_id=external_id)
-                if source is None:
-                    source = order.source
-                order.delete()
-                cls.create(external_id, source, products, user)
+                order = Order.objects.select_for_update().get(external_id=external_id)
+                if source is not None and source != '':
+                    order.source = OrderSource.objects.get_or_create(name=source)[0]
+                    order.save(update_fields=['source'])
+                if products is not None:
+                    cls.change_lines(order, products)
 
         except DatabaseError as ex:
             logger.warning(f"Change error | {cls.__name__}", exc_info=True)
             raise cls.EditError(ex)
         return order
 
+    @classmethod
+    def change_lines(cls, order, products: List[Dict[str, str]]):
+        return cls.change_lines_many({order: products})[order.id]
+
+    @classmethod
+    def change_lines_many(cls, changes):
+        """
+        Brings the lines of each order in `changes` ({order: products}) in line with its products, keyed by
+        product_id: only added, removed and changed lines are written, so line ids and flags of untouched lines
+        are kept. Returns {order id: (added, updated, deleted)}.
+        """
+        wanted = {order.id: cls._product_amounts(products) for order, products in changes.items()}
+        specifications = Specifications.resolve_products(
+            {product_id for amounts in wanted.values() for product_id in amounts})
+
+        current = {order_id: {} for order_id in wanted}
+        for line in OrderSpecification.objects.select_related('specification').filter(
+                order_id__in=wanted.keys()).order_by('id'):
+            current[line.order_id].setdefault(line.specification.product_id, []).append(line)
+
+        to_delete = []
+        to_update = []
+        to_create = []
+        counts = {}
+        for order_id, amounts in wanted.items():
+            lines = current[order_id]
+            # Lines of removed products and surplus lines of a product go, kept lines follow the active
+            # specification.
+            deleted = [line.id for product_id, product_lines in lines.items()
+                       for line in (product_lines if product_id not in amounts else product_lines[1:])]
+            updated = []
+            for product_id, amount in amounts.items():
+                line = lines[product_id][0] if product_id in lines else None
+                if line is not None and (line.amount != amount or
+                                         line.specification_id != specifications[product_id].id):
+                    line.amount = amount
+                    line.specification = specifications[product_id]
+                    updated.append(line)
+            added = [OrderSpecification(order_id=order_id, specification=specifications[product_id], amount=amount)
+                     for product_id, amount in amounts.items() if product_id not in lines]
+
+            to_delete += deleted
+            to_update += updated
+            to_create += added
+            counts[order_id] = (len(added), len(updated), len(deleted))
+
+        OrderSpecification.objects.filter(id__in=to_delete).delete()
+        OrderSpecification.objects.bulk_update(to_update, fields=['amount', 'specification'])
+        OrderSpecification.objects.bulk_create(to_create)
+        changed = [order_id for order_id, count in counts.items() if sum(count) != 0]
+        if len(changed) != 0:
+            Reservations.release(changed)
+            Reservations.reserve(changed)
+        return counts
+
     @classmethod
     def create(cls, external_id, source: str = None, products: List[Dict[str, str]] = None, user=None):
         try:
@@ -205,41 +600,156 @@ class Orders:
                     external_id=external_id,
                     status=Order.OrderStatus.INACTIVE,
                     source=source)
+                Counters.add({'orders_inactive': 1})
 
                 if products is not None and len(products) != 0:
-                    order_specs = []
-                    specifications_objects = []
-                    for product in products:
-                        specification = Specification.objects.get_or_create(product_id=product['product_id'],
-                                                                            is_active=True)[0]
-                        specifications_objects.append(specification)
-                    order_specs_dict = product_amounts(specifications_objects, products)
-
-                    for product in order_specs_dict:
-                        order_spec = OrderSpecification(
-                            order=order,
-                            specification=product['specification'],
-                            amount=product['amount']
-                        )
-
-                        order_specs.append(order_spec)
-
-                    OrderSpecification.objects.bulk_create(order_specs)
+                    amounts = cls._product_amounts(products)
+                    specifications = Specifications.resolve_products(amounts.keys())
+                    order_specs_dict = [{'specification': specifications[product_id], 'amount': amount}
+                                        for product_id, amount in amounts.items()]
+
+                    OrderSpecification.objects.bulk_create([
+                        OrderSpecification(order=order, specification=product['specification'],
+                                           amount=product['amount'])
+                        for product in order_specs_dict
+                    ])
                     order.specifications = order_specs_dict
+                    Reservations.reserve([order.id])
 
         except DatabaseError as ex:
             logger.warning(f"Create error | {cls.__name__}", exc_info=True)
             raise cls.CreateError(ex)
         return order
 
+    @classmethod
+    def bulk_apply(cls, items, chunk_size=None):
+        """
+        Applies validated create/change/ship/cancel items in chunks, one transaction per chunk.
+        Returns {item index: error message or None}.
+        """
+        if chunk_size is None:
+            chunk_size = settings.ORDER_BULK_CHUNK_SIZE
+        results = {}
+        for start in range(0, len(items), chunk_size):
+            chunk = list(enumerate(items[start:start + chunk_size], start))
+            try:
+                with transaction.atomic():
+                    results.update(cls._bulk_apply_chunk(chunk))
+            except DatabaseError as ex:
+                logger.warning(f"Bulk chunk from {start} failed | {cls.__name__}", exc_info=True)
+                results.update({index: str(ex) for index, _ in chunk})
+        return results
+
+    @classmethod
+    def _bulk_apply_chunk(cls, chunk):
+        # Only consecutive items with the same action are batched, so the chunk is applied in submission order.
+        handlers = {
+            'create': cls._bulk_create,
+            'change': cls._bulk_change,
+            'ship': lambda pairs: cls._bulk_set_status(pairs, cls.confirm_many),
+            'cancel': lambda pairs: cls._bulk_set_status(pairs, cls.cancel_many),
+        }
+        results = {}
+        for action, pairs in groupby(chunk, key=lambda pair: pair[1]['action']):
+            results.update(handlers[action](list(pairs)))
+        return results
+
+    @classmethod
+    def _bulk_create(cls, pairs):
+        results = {}
+        existing = set(Order.objects.filter(
+            external_id__in=[item['external_id'] for _, item in pairs]
+        ).values_list('external_id', flat=True))
+        sources = {name: OrderSource.objects.get_or_create(name=name)[0]
+                   for name in {item.get('source_name') for _, item in pairs} if name}
+
+        new = []
+        for index, item in pairs:
+            if item['external_id'] in existing:
+                results[index] = f"Order {item['external_id']} already exists"
+                continue
+            existing.add(item['external_id'])
+            new.append((index, cls._product_amounts(item['specifications_create']), Order(
+                external_id=item['external_id'],
+                status=Order.OrderStatus.INACTIVE,
+                source=sources.get(item.get('source_name'))
+            )))
+
+        Order.objects.bulk_create([order for _, _, order in new])
+        Counters.add({'orders_inactive': len(new)})
+        specifications = Specifications.resolve_products(
+            {product_id for _, amounts, _ in new for product_id in amounts})
+        OrderSpecification.objects.bulk_create([
+            OrderSpecification(order=order, specification=specifications[product_id], amount=amount)
+            for _, amounts, order in new for product_id, amount in amounts.items()
+        ])
+        Reservations.reserve([order.id for _, _, order in new])
+        results.update({index: None for index, _, _ in new})
+        return results
+
+    @classmethod
+    def _bulk_change(cls, pairs):
+        results = {}
+        orders = {}
+        for order in Order.objects.select_for_update().filter(
+                external_id__in=[item['external_id'] for _, item in pairs]).order_by('id'):
+            orders.setdefault(order.external_id, []).append(order)
+
+        # Consecutive changes of an order end with the products and source of the last one.
+        products = {}
+        sources = {}
+        for index, item in pairs:
+            found = orders.get(item['external_id'], [])
+            if len(found) != 1:
+                results[index] = f"Order {item['external_id']} does not exist" if len(found) == 0 else \
+                    f"Order {item['external_id']} is not unique"
+                continue
+            order = found[0]
+            products[order] = item['specifications_create']
+            if item.get('source_name'):
+                sources[order] = item['source_name']
+            results[index] = None
+
+        names = {name: OrderSource.objects.get_or_create(name=name)[0] for name in set(sources.values())}
+        for order, name in sources.items():
+            order.source = names[name]
+        Order.objects.bulk_update(list(sources), fields=['source'])
+        cls.change_lines_many(products)
+        return results
+
+    @classmethod
+    def _bulk_set_status(cls, pairs, method):
+        ids = dict(Order.objects.filter(
+            external_id__in=[item['external_id'] for _, item in pairs]
+        ).values_list('external_id', 'id'))
+        try:
+            outcome = method(list(set(ids.values())))
+        except cls.ActionError as ex:
+            # The status change rolled back on its own savepoint, so the rest of the chunk still applies.
+            return {index: str(ex) for index, _ in pairs}
+        results = {}
+        for index, item in pairs:
+            order_id = ids.get(item['external_id'])
+            results[index] = outcome[order_id] if order_id is not None else \
+                f"Order {item['external_id']} does not exist"
+        return results
+
+    @classmethod
+    def _product_amounts(cls, products):
+        amounts = {}
+        for product in products:
+            amounts[product['product_id']] = amounts.get(product['product_id'], 0) + \
+                int(Decimal(str(product['amount'])))
+        return amounts
+
     @classmethod
     def status_count(cls):
-        count = Order.objects.aggregate(
-            inactive=Count('id', filter=Q(status=Order.OrderStatus.INACTIVE)),
-            canceld=Count('id', filter=Q(status=Order.OrderStatus.CANCELED)),
-            confirmed=Count('id', filter=Q(status=Order.OrderStatus.CONFIRMED)),
-        )
-        return count
+        counters = Counters.read()
+        return {
+            'inactive': counters['orders_inactive'],
+            'canceld': counters['orders_canceled'],
+            'confirmed': counters['orders_confirmed'],
+        }
 
     @classmethod
     def form_request_body_for_changed_status(cls, order):
@@ -252,18 +762,131 @@ class Orders:
             raise ValueError(f"Wrong status for forming request body. Status: {order.status}")
         return body
 
+
+class OrderEvents:
+    """
+    Bitrix webhooks are stored as events and applied by a worker, one event per order at a time and in the
+    order they were received.
+    """
+
+    class InvalidEvent(Exception):
+        pass
+
+    kinds = {
+        'create': OrderEvent.EventKind.CREATE,
+        'change': OrderEvent.EventKind.CHANGE,
+        'ship': OrderEvent.EventKind.SHIP,
+        'cancel': OrderEvent.EventKind.CANCEL,
+    }
+
     @classmethod
-    async def change_status(cls, body):
-        return asyncio.create_task(send_status(body))
+    def parse(cls, data):
+        try:
+            external_id = str(data['ID'])
+        except (KeyError, TypeError):
+            raise cls.InvalidEvent("'ID' not specified")
+
+        kind = next((kind for name, kind in cls.kinds.items() if name in data), None)
+        if kind is None:
+            raise cls.InvalidEvent(f"Unknown event for order {external_id}")
 
+        products = None
+        if kind in (OrderEvent.EventKind.CREATE, OrderEvent.EventKind.CHANGE):
+            try:
+                products = [dict(product_id=str(product['id']), amount=product['amount'])
+                            for product in data['products']]
+            except (KeyError, TypeError):
+                raise cls.InvalidEvent(f"Wrong 'products' for order {external_id}")
+        return external_id, kind, products
+
+    @classmethod
+    def key(cls, external_id, kind, products, previous=None):
+        key = f"{kind}:{external_id}"
+        # An order can change many times and back again, so a change is keyed by the change received before it:
+        # only a repeated delivery of the latest change is a duplicate.
+        if kind == OrderEvent.EventKind.CHANGE:
+            change = json.dumps([previous, products], sort_keys=True, default=str)
+            key += ':' + hashlib.sha1(change.encode()).hexdigest()
+        return key
 
-bitrix_url = settings.BITRIX_URL + "ajax/smenastatusa.php"
+    @classmethod
+    def receive(cls, data):
+        external_id, kind, products = cls.parse(data)
+        previous = None
+        if kind == OrderEvent.EventKind.CHANGE:
+            latest = OrderEvent.objects.filter(external_id=external_id, kind=kind).order_by('-id').first()
+            if latest is not None:
+                if cls.parse(latest.payload)[2] == products:
+                    return latest, False
+                previous = latest.id
+        return OrderEvent.objects.get_or_create(key=cls.key(external_id, kind, products, previous), defaults={
+            'external_id': external_id,
+            'kind': kind,
+            'payload': data
+        })
 
+    @classmethod
+    def process(cls, limit=None):
+        if limit is None:
+            limit = settings.ORDER_EVENT_BATCH_SIZE
+        earlier = OrderEvent.objects.filter(external_id=OuterRef('external_id'),
+                                            status=OrderEvent.EventStatus.PENDING,
+                                            id__lt=OuterRef('id'))
+        with transaction.atomic():
+            events = list(OrderEvent.objects.select_for_update(skip_locked=True).filter(
+                ~Exists(earlier), status=OrderEvent.EventStatus.PENDING
+            ).order_by('id')[:limit])
+            for event in events:
+                cls.apply(event)
+        return len(events)
 
-async def send_status(body: dict):
-    async with aiohttp.ClientSession(auth=aiohttp.BasicAuth(**settings.BITRIX_AUF_CONF)) as session:
-        headers = {'content-type': 'application/json'}
+    @classmethod
+    def apply(cls, event):
+        handlers = {
+            OrderEvent.EventKind.CREATE: cls._create,
+            OrderEvent.EventKind.CHANGE: cls._change,
+            OrderEvent.EventKind.SHIP: cls._ship,
+            OrderEvent.EventKind.CANCEL: cls._cancel,
+        }
+        _, _, products = cls.parse(event.payload)
         try:
-            await session.post(bitrix_url, json=body, headers=headers)
+            with transaction.atomic():
+                applied = handlers[event.kind](event.external_id, products)
+            event.status = OrderEvent.EventStatus.DONE if applied else OrderEvent.EventStatus.SKIPPED
         except Exception as ex:
-            logger.error("Error while posting new status", exc_info=True)
+            logger.error(f"Order event failed: {event} | {cls.__name__}", exc_info=True)
+            event.status = OrderEvent.EventStatus.FAILED
+            event.error = str(ex)
+        event.processed_at = timezone.now()
+        event.save(update_fields=['status', 'error', 'processed_at'])
+
+    @classmethod
+    def _create(cls, external_id, products):
+        if Order.objects.filter(external_id=external_id).exists():
+            return False
+        Orders.create(external_id=external_id, source='bitrix', products=products)
+        return True
+
+    @classmethod
+    def _change(cls, external_id, products):
+        if not Order.objects.filter(external_id=external_id).exists():
+            Orders.create(external_id=external_id, source='bitrix', products=products)
+        else:
+            Orders.change(external_id=external_id, products=products)
+        return True
+
+    @classmethod
+    def _ship(cls, external_id, products):
+        order = Orders.get_by_external_id(external_id)
+        if order.confirmed():
+            return False
+        Orders.confirm(order)
+        return True
+
+    @classmethod
+    def _cancel(cls, external_id, products):
+        order = Orders.get_by_external_id(external_id)
+        if order.canceled():
+            return False
+        Orders.cancel(order)
+        return True
@@ -1,3 +1,329 @@
+from datetime import timedelta
+from unittest import mock
+
+from django.contrib.auth import get_user_model
 from django.test import TestCase
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APITestCase
+
+from cella.models import OutboxMessage
+from cella.service import Counters
+from resources.models import Resource, StockMovement
+from resources.service import Stock
+from specification.models import Specification, SpecificationResource
+from specification.service import Specifications
+from .models import Order, OrderSpecification, OrderEvent, Reservation
+from .serializer import OrderSerializer, OrderDetailSerializer, OrderValuesSerializer
+from .service import Orders, OrderEvents, Reservations
+
+
+class OrderConfirmTest(TestCase):
+
+    def setUp(self):
+        self.resource = Resource.objects.create(name='Resource 1', external_id='1', cost=1, amount=100)
+        self.specification = Specifications.create(
+            name='Specification 1',
+            product_id='100',
+            resources_create=[{'id': self.resource.id, 'amount': 2}],
+            amount=3,
+            user='system'
+        )
+
+    def testConfirmTakesStockThenBuilds(self):
+        order = Orders.create('order-1', products=[{'product_id': '100', 'amount': '5'}])
+        Orders.confirm(order.id)
+
+        self.assertEqual(Order.objects.get(id=order.id).status, Order.OrderStatus.CONFIRMED)
+        self.assertEqual(Specification.objects.get(id=self.specification.id).amount, 0)
+        self.assertEqual(float(Resource.objects.get(id=self.resource.id).amount), 96)
+
+    def testBuildSet(self):
+        Specifications.build_set(self.specification.id, 10, from_resources=True, user='system')
+        self.assertEqual(Specification.objects.get(id=self.specification.id).amount, 13)
+        self.assertEqual(float(Resource.objects.get(id=self.resource.id).amount), 80)
+
+        with self.assertRaises(Specifications.CantBuildSet):
+            Specifications.build_set(self.specification.id, 100, from_resources=True, user='system')
+        self.assertEqual(Specification.objects.get(id=self.specification.id).amount, 13)
+
+
+class OrderShortageTest(TestCase):
+
+    def setUp(self):
+        self.scarce = Resource.objects.create(name='Scarce', external_id='1', cost=1, amount=5)
+        self.plenty = Resource.objects.create(name='Plenty', external_id='2', cost=1, amount=100)
+        self.first = Specifications.create(name='First', product_id='100', amount=1, user='system',
+                                           resources_create=[{'id': self.scarce.id, 'amount': 2},
+                                                             {'id': self.plenty.id, 'amount': 1}])
+        self.second = Specifications.create(name='Second', product_id='200', user='system',
+                                            resources_create=[{'id': self.plenty.id, 'amount': 1}])
+
+    def testShortages(self):
+        small = Orders.create('small', products=[{'product_id': '100', 'amount': '3'}])
+        large = Orders.create('large', products=[{'product_id': '100', 'amount': '4'},
+                                                 {'product_id': '200', 'amount': '10'}])
+
+        shortages = Orders.shortages([small.id, large.id])
+        self.assertNotIn(small.id, shortages)
+        self.assertEqual(shortages[large.id], ({self.first.id}, {self.scarce.id}))
+        self.assertEqual(Orders.assembling_info(small.id), (set(), set()))
+
+    def testDetailQueries(self):
+        order = Orders.create('large', products=[{'product_id': '100', 'amount': '4'},
+                                                 {'product_id': '200', 'amount': '10'}])
+        with self.assertNumQueries(5):
+            data = OrderDetailSerializer(Orders.detail(order.id)).data
+        self.assertEqual(sorted(len(line['specification']['res_specs']) for line in data['order_specifications']),
+                         [1, 2])
+        self.assertEqual(data['missing_resources'], [self.scarce.id])
+
+    def testMRP(self):
+        Orders.create('small', products=[{'product_id': '100', 'amount': '3'}])
+        Orders.create('large', products=[{'product_id': '100', 'amount': '2'},
+                                         {'product_id': '200', 'amount': '10'}])
+        Stock.change_resources({self.scarce.id: -2}, StockMovement.MovementReason.ORDER)
+
+        report = {row['id']: row for row in Orders.mrp()}
+        self.assertEqual(report[self.scarce.id]['required'], 8)
+        self.assertEqual(report[self.scarce.id]['shortage'], 5)
+        self.assertEqual(report[self.scarce.id]['cover_days'], 45)
+        self.assertEqual(report[self.plenty.id]['required'], 14)
+        self.assertEqual(report[self.plenty.id]['shortage'], 0)
+        self.assertIsNone(report[self.plenty.id]['cover_days'])
+
+    def testMRPSkipsLinesWithoutResource(self):
+        SpecificationResource.objects.create(specification=self.first, resource=None, amount=1)
+        Orders.create('small', products=[{'product_id': '100', 'amount': '3'}])
+
+        self.assertEqual(sorted(row['id'] for row in Orders.mrp()), sorted([self.scarce.id, self.plenty.id]))
+
+    def testAllocate(self):
+        first = Orders.create('first', products=[{'product_id': '100', 'amount': '3'}])
+        blocked = Orders.create('blocked', products=[{'product_id': '100', 'amount': '1'},
+                                                     {'product_id': '200', 'amount': '1'}])
+        last = Orders.create('last', products=[{'product_id': '200', 'amount': '10'}])
+
+        report = {row['id']: row for row in Orders.allocate()}
+        self.assertTrue(report[first.id]['shippable'])
+        self.assertFalse(report[blocked.id]['shippable'])
+        self.assertEqual(report[blocked.id]['missing_resources'], {self.scarce.id})
+        self.assertEqual(report[blocked.id]['missing_specifications'], {self.first.id})
+        self.assertTrue(report[last.id]['shippable'])
+
+    def testConfirmMany(self):
+        first = Orders.create('first', products=[{'product_id': '100', 'amount': '2'}])
+        second = Orders.create('second', products=[{'product_id': '100', 'amount': '1'},
+                                                   {'product_id': '200', 'amount': '3'}])
+        Orders.cancel(second)
+
+        results = Orders.confirm_many([first.id, second.id, 0], notify=True)
+        self.assertIsNone(results[first.id])
+        self.assertIsNotNone(results[second.id])
+        self.assertIsNotNone(results[0])
+        self.assertEqual(Order.objects.get(id=first.id).status, Order.OrderStatus.CONFIRMED)
+        self.assertEqual(float(Resource.objects.get(id=self.scarce.id).amount), 3)
+        self.assertEqual(OutboxMessage.objects.filter(endpoint=OutboxMessage.OutboxEndpoint.STATUS).count(), 1)
+
+        with self.assertRaises(Orders.ActionError):
+            Orders.confirm(first)
+
+    def testChangeKeepsUntouchedLines(self):
+        order = Orders.create('order', products=[{'product_id': '100', 'amount': '3'},
+                                                 {'product_id': '200', 'amount': '1'}])
+        kept = OrderSpecification.objects.get(order=order, specification=self.first)
+        kept.assembled = True
+        kept.save()
+
+        Orders.change('order', products=[{'product_id': '100', 'amount': '3'},
+                                         {'product_id': '200', 'amount': '4'},
+                                         {'product_id': '300', 'amount': '2'}])
+        self.assertTrue(Order.objects.filter(id=order.id).exists())
+        self.assertTrue(OrderSpecification.objects.get(id=kept.id).assembled)
+        self.assertEqual(
+            sorted(OrderSpecification.objects.filter(order=order).values_list('specification__product_id', 'amount')),
+            [('100', 3), ('200', 4), ('300', 2)]
+        )
+
+        Orders.change('order', products=[{'product_id': '300', 'amount': '1'}])
+        self.assertEqual(list(OrderSpecification.objects.filter(order=order).values_list('amount', flat=True)), [1])
+
+    def testChangeCleansLegacyLines(self):
+        order = Orders.create('order', products=[{'product_id': '100', 'amount': '3'}])
+        OrderSpecification.objects.create(order=order, specification=self.first, amount=2)
+        Specification.objects.filter(id=self.first.id).update(is_active=False)
+        current = Specification.objects.create(name='Specification 1 v2', product_id='100', is_active=True)
+
+        Orders.change('order', products=[{'product_id': '100', 'amount': '3'}])
+        self.assertEqual(
+            list(OrderSpecification.objects.filter(order=order).values_list('specification', 'amount')),
+            [(current.id, 3)]
+        )
+
+    def testCreateResolvesProductsInBulk(self):
+        products = [{'product_id': str(product_id), 'amount': '1'} for product_id in range(1000, 1050)]
+        products.append({'product_id': '100', 'amount': '2'})
+        with self.assertNumQueries(21):
+            order = Orders.create('bulk', source='bitrix', products=products)
+
+        self.assertEqual(OrderSpecification.objects.filter(order=order).count(), 51)
+        self.assertEqual(OrderSpecification.objects.get(order=order, specification__product_id='100').specification,
+                         self.first)
+
+    def testReservations(self):
+        first = Orders.create('first', products=[{'product_id': '100', 'amount': '3'}])
+        self.assertEqual(Specification.objects.get(id=self.first.id).reserved, 1)
+        self.assertEqual(float(Resource.objects.get(id=self.scarce.id).reserved), 4)
+        self.assertEqual(Specifications.assemble_info(self.first.id), 0)
+
+        second = Orders.create('second', products=[{'product_id': '100', 'amount': '1'}])
+        self.assertEqual(float(Resource.objects.get(id=self.scarce.id).available), -1)
+
+        Orders.change('first', products=[{'product_id': '200', 'amount': '5'}])
+        self.assertEqual(Specification.objects.get(id=self.first.id).reserved, 0)
+        self.assertEqual(float(Resource.objects.get(id=self.scarce.id).reserved), 2)
+        self.assertEqual(float(Resource.objects.get(id=self.plenty.id).reserved), 6)
+
+        Orders.cancel(second)
+        Orders.confirm(first)
+        self.assertEqual(Specification.objects.get(id=self.first.id).reserved, 0)
+        self.assertEqual(float(Resource.objects.get(id=self.plenty.id).reserved), 0)
+        self.assertFalse(Reservation.objects.exists())
+
+        Orders.create('third', products=[{'product_id': '100', 'amount': '2'}])
+        Resource.objects.update(reserved=0)
+        Reservations.rebuild()
+        self.assertEqual(float(Resource.objects.get(id=self.scarce.id).reserved), 2)
+
+    def testValuesSerializerParity(self):
+        Orders.create('first', source='bitrix', products=[{'product_id': '100', 'amount': '4'},
+                                                          {'product_id': '200', 'amount': '1'}])
+        Orders.create('second', products=[{'product_id': '200', 'amount': '2'}])
+        Orders.create('empty')
+
+        queryset = Orders.list()
+        self.assertEqual(
+            JSONRenderer().render(OrderValuesSerializer.render(OrderValuesSerializer.project(queryset))),
+            JSONRenderer().render(OrderSerializer(Orders.add_assembling_info(list(queryset)), many=True).data)
+        )
+
+    def testArchiveOld(self):
+        old = Orders.create('old', products=[{'product_id': '200', 'amount': '1'}])
+        recent = Orders.create('recent', products=[{'product_id': '200', 'amount': '1'}])
+        pending = Orders.create('pending', products=[{'product_id': '200', 'amount': '1'}])
+        Orders.cancel_many([old.id, recent.id])
+        Order.objects.filter(id__in=[old.id, pending.id]).update(created_at=timezone.now() - timedelta(days=60))
+
+        self.assertEqual(Orders.archive_old(age_days=30, batch_size=1), 1)
+        self.assertEqual(Order.objects.get(id=old.id).status, Order.OrderStatus.ARCHIVED)
+        self.assertEqual(Order.objects.get(id=recent.id).status, Order.OrderStatus.CANCELED)
+        self.assertEqual(Order.objects.get(id=pending.id).status, Order.OrderStatus.INACTIVE)
+        self.assertEqual(Counters.read()['orders_canceled'], 1)
+
+
+
+class OrderEventTest(APITestCase):
+
+    def setUp(self):
+        self.client.force_authenticate(get_user_model().objects.create_user(username='bitrix', password='bitrix'))
+
+    def post(self, data):
+        return self.client.post('/order/receive/', data=data, format='json')
+
+    def testEventsAreDedupedAndAppliedInSequence(self):
+        create = {'ID': '77', 'create': True, 'products': [{'id': '100', 'amount': 2}]}
+        self.assertEqual(self.post(create).data, {'received': True, 'duplicate': False})
+        self.assertEqual(self.post(create).data, {'received': True, 'duplicate': True})
+        self.post({'ID': '77', 'change': True, 'products': [{'id': '100', 'amount': 5}]})
+        self.post({'ID': '77', 'cancel': True})
+        self.assertEqual(self.post({'ID': '77'}).status_code, 400)
+        self.assertFalse(Order.objects.exists())
+
+        while OrderEvents.process():
+            pass
+
+        order = Order.objects.get(external_id='77')
+        self.assertEqual(order.status, Order.OrderStatus.CANCELED)
+        self.assertEqual(list(order.order_specifications.values_list('amount', flat=True)), [5])
+        self.assertEqual(OrderEvent.objects.filter(status=OrderEvent.EventStatus.DONE).count(), 3)
+
+    def testChangeRevert(self):
+        self.post({'ID': '78', 'create': True, 'products': [{'id': '100', 'amount': 1}]})
+        changes = [{'ID': '78', 'change': True, 'products': [{'id': '100', 'amount': amount}]} for amount in (2, 3)]
+        self.assertEqual(self.post(changes[0]).data['duplicate'], False)
+        self.assertEqual(self.post(changes[0]).data['duplicate'], True)
+        self.assertEqual(self.post(changes[1]).data['duplicate'], False)
+        self.assertEqual(self.post(changes[0]).data['duplicate'], False)
+
+        while OrderEvents.process():
+            pass
+
+        order = Order.objects.get(external_id='78')
+        self.assertEqual(list(order.order_specifications.values_list('amount', flat=True)), [2])
+        self.assertEqual(OrderEvent.objects.filter(kind=OrderEvent.EventKind.CHANGE).count(), 3)
+
+    def testBulk(self):
+        Orders.create('existing', products=[{'product_id': '100', 'amount': '1'}])
+        response = self.client.post('/order/bulk/', format='json', data=[
+            {'action': 'create', 'external_id': 'a', 'source_name': 'market',
+             'specifications_create': [{'product_id': '100', 'amount': 1}, {'product_id': '900', 'amount': 2}]},
+            {'action': 'create', 'external_id': 'existing',
+             'specifications_create': [{'product_id': '100', 'amount': 1}]},
+            {'action': 'create', 'external_id': 'b', 'specifications_create': []},
+            {'action': 'change', 'external_id': 'existing',
+             'specifications_create': [{'product_id': '100', 'amount': 4}]},
+            {'action': 'ship', 'external_id': 'a'},
+            {'action': 'cancel', 'external_id': 'missing'},
+        ])
+        results = response.data['results']
+
+        self.assertEqual([result['correct'] for result in results], [True, False, False, True, True, False])
+        self.assertIn('specifications_create', results[2]['errors'])
+        self.assertEqual(Order.objects.get(external_id='a').status, Order.OrderStatus.CONFIRMED)
+        self.assertEqual(Order.objects.get(external_id='a').source.name, 'market')
+        self.assertEqual(OrderSpecification.objects.get(order__external_id='existing').amount, 4)
+
+    def testBulkChange(self):
+        first = Orders.create('first', products=[{'product_id': '100', 'amount': '1'}])
+        second = Orders.create('second', products=[{'product_id': '100', 'amount': '1'}])
+        response = self.client.post('/order/bulk/', format='json', data=[
+            {'action': 'change', 'external_id': 'first', 'source_name': 'market',
+             'specifications_create': [{'product_id': '100', 'amount': 2}]},
+            {'action': 'change', 'external_id': 'second',
+             'specifications_create': [{'product_id': '200', 'amount': 3}]},
+            {'action': 'change', 'external_id': 'missing',
+             'specifications_create': [{'product_id': '100', 'amount': 1}]},
+            {'action': 'change', 'external_id': 'first', 'specifications_create': [{'product_id': '100', 'amount': 5}]},
+        ])
+
+        self.assertEqual([result['correct'] for result in response.data['results']], [True, True, False, True])
+        self.assertEqual(Order.objects.get(id=first.id).source.name, 'market')
+        self.assertEqual(list(first.order_specifications.values_list('specification__product_id', 'amount')),
+                         [('100', 5)])
+        self.assertEqual(list(second.order_specifications.values_list('specification__product_id', 'amount')),
+                         [('200', 3)])
+
+    def testBulkReportsFailedStatusChange(self):
+        Orders.create('a', products=[{'product_id': '100', 'amount': '1'}])
+        with mock.patch.object(Orders, 'confirm_many', side_effect=Orders.ActionError('Error while confirming')):
+            response = self.client.post('/order/bulk/', format='json', data=[
+                {'action': 'create', 'external_id': 'b', 'specifications_create': [{'product_id': '100', 'amount': 1}]},
+                {'action': 'ship', 'external_id': 'a'},
+            ])
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([result['correct'] for result in response.data['results']], [True, False])
+        self.assertTrue(Order.objects.filter(external_id='b').exists())
+
+    def testBulkKeepsSubmissionOrder(self):
+        response = self.client.post('/order/bulk/', format='json', data=[
+            {'action': 'change', 'external_id': 'n', 'specifications_create': [{'product_id': '100', 'amount': 2}]},
+            {'action': 'create', 'external_id': 'n', 'specifications_create': [{'product_id': '100', 'amount': 1}]},
+            {'action': 'cancel', 'external_id': 'n'},
+            {'action': 'ship', 'external_id': 'n'},
+        ])
 
-# Create your tests here.
+        self.assertEqual([result['correct'] for result in response.data['results']], [False, True, True, False])
+        order = Order.objects.get(external_id='n')
+        self.assertEqual(order.status, Order.OrderStatus.CANCELED)
+        self.assertEqual(list(order.order_specifications.values_list('amount', flat=True)), [1])
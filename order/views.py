@@ -4,23 +4,29 @@ from django.http import Http404
 from rest_framework import status
 from rest_framework.authentication import BasicAuthentication
 from django_filters.rest_framework import DjangoFilterBackend
-from rest_framework.filters import SearchFilter, OrderingFilter
+from rest_framework.filters import OrderingFilter
 from rest_framework.generics import RetrieveAPIView, ListAPIView, CreateAPIView
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework.permissions import IsAuthenticated
-from order.serializer import OrderSerializer, OrderGetSerializer, OrderDetailSerializer
-from order.service import Orders
+from order.models import Order, OrderSource, OrderSpecification
+from order.serializer import OrderSerializer, OrderDetailSerializer, OrderBulkItemSerializer, OrderValuesSerializer
+from order.service import Orders, OrderEvents
+from resources.models import Resource
+from specification.models import Specification, SpecificationResource
 from utils.exception import NoParameterSpecified, WrongParameterValue, WrongParameterType, QueryError, StatusError
-from utils.pagination import StandardResultsSetPagination
+from utils.filters import TrigramSearchFilter
+from utils.pagination import KeysetPagination
+from utils.view import CachedListMixin, ConditionalGetMixin, ValuesListMixin
 from authentication.permissions import OfficeWorkerPermission, StorageWorkerPermission, DefaultPermission
 
 logger = logging.getLogger(__name__)
 
 
-class OrderDetailView(RetrieveAPIView):
+class OrderDetailView(ConditionalGetMixin, RetrieveAPIView):
     serializer_class = OrderDetailSerializer
     permission_classes = [DefaultPermission]
+    etag_apps = ['order', 'specification', 'resources']
 
     def get_object(self):
         o_id = self.kwargs.get('o_id')
@@ -33,11 +39,15 @@ class OrderDetailView(RetrieveAPIView):
         return order
 
 
-class OrderListView(ListAPIView):
+class OrderListView(ConditionalGetMixin, CachedListMixin, ValuesListMixin, ListAPIView):
     serializer_class = OrderSerializer
+    values_serializer_class = OrderValuesSerializer
     permission_classes = [DefaultPermission]
-    pagination_class = StandardResultsSetPagination
-    filter_backends = [SearchFilter, OrderingFilter, DjangoFilterBackend]
+    # Missing resources and specifications depend on stock and bills of materials.
+    cache_models = [Order, OrderSource, OrderSpecification, Specification, SpecificationResource, Resource]
+    etag_apps = ['order', 'specification', 'resources']
+    pagination_class = KeysetPagination
+    filter_backends = [OrderingFilter, TrigramSearchFilter, DjangoFilterBackend]
     filterset_fields = ['status']
     search_fields = ['external_id', 'id', 'source__name']
     ordering = 'status'
@@ -55,18 +65,6 @@ class OrderListView(ListAPIView):
             logger.warning(f"Queryset error | {self.__class__.__name__}", exc_info=True)
             raise QueryError()
 
-    def list(self, request, *args, **kwargs):
-        queryset = self.filter_queryset(self.get_queryset())
-
-        page = self.paginate_queryset(queryset)
-        if page is not None:
-            page = Orders.add_assembling_info(page)
-            serializer = self.get_serializer(page, many=True)
-            return self.get_paginated_response(serializer.data)
-
-        serializer = self.get_serializer(queryset, many=True)
-        return Response(serializer.data)
-
 
 class OrderManageActionView(APIView):
     permission_classes = [StorageWorkerPermission]
@@ -86,16 +84,28 @@ class OrderManageActionView(APIView):
             logger.warning(f"'action' not specified | {self.__class__.__name__}", exc_info=True)
             raise NoParameterSpecified('action')
 
+        if isinstance(order_id, list) and action is not None:
+            actions = {'confirm': Orders.confirm_many, 'cancel': Orders.cancel_many}
+            if action not in actions:
+                raise WrongParameterValue('action')
+            try:
+                results = actions[action](order_id, request.user, notify=True)
+            except (Orders.ActionError, ValueError, TypeError):
+                logger.warning(f"Manage action error for orders with ids: {order_id} | {self.__class__.__name__}")
+                raise StatusError()
+            return Response(data={
+                'correct': all(error is None for error in results.values()),
+                'results': [{'id': o_id, 'correct': error is None, 'error': error} for o_id, error in results.items()]
+            }, status=status.HTTP_202_ACCEPTED)
+
         if order_id is not None and action is not None:
             try:
                 if action == 'confirm':
                     order = Orders.get(order_id)
-                    Orders.confirm(order, request.user)
-                    Orders.notify_new_status(order)
+                    Orders.confirm(order, request.user, notify=True)
                 elif action == 'cancel':
                     order = Orders.get(order_id)
-                    Orders.cancel(order, request.user)
-                    Orders.notify_new_status(order)
+                    Orders.cancel(order, request.user, notify=True)
                 else:
                     raise WrongParameterValue('action')
             except Orders.ActionError:
@@ -121,6 +131,20 @@ class OrderAssemblingInfoView(APIView):
                         status=status.HTTP_200_OK)
 
 
+class OrderMRPView(APIView):
+    permission_classes = [DefaultPermission]
+
+    def get(self, request, *args, **kwargs):
+        return Response(data=Orders.mrp(), status=status.HTTP_200_OK)
+
+
+class OrderAllocationView(APIView):
+    permission_classes = [DefaultPermission]
+
+    def get(self, request, *args, **kwargs):
+        return Response(data=Orders.allocate(), status=status.HTTP_200_OK)
+
+
 class OrderStatusCount(APIView):
     permission_classes = [IsAuthenticated, DefaultPermission]
 
@@ -152,40 +176,40 @@ class OrderCreateView(CreateAPIView):
         return serializer.save(request=self.request)
 
 
-class ReceiveOrderView(APIView):
-    permission_classes = (IsAuthenticated,)
-    authentication_classes = (BasicAuthentication,)
+class OrderBulkView(APIView):
+    permission_classes = [OfficeWorkerPermission]
 
     def post(self, request, *args, **kwargs):
-        logger.info(f"Received order {request.data} | {self.__class__.__name__}")
-        data = request.data
-        external_id = data['ID']
+        if not isinstance(request.data, list):
+            raise WrongParameterType('orders', 'list')
 
-        try:
-            if 'create' in data:
-                specifications = data['products']
-                products = []
+        results = [None] * len(request.data)
+        items = []
+        for index, data in enumerate(request.data):
+            serializer = OrderBulkItemSerializer(data=data)
+            if serializer.is_valid():
+                items.append((index, serializer.validated_data))
+            else:
+                results[index] = {'correct': False, 'errors': serializer.errors}
 
-                for specification in specifications:
-                    product = dict(product_id=specification['id'], amount=specification['amount'])
-                    products.append(product)
+        outcome = Orders.bulk_apply([item for _, item in items])
+        for position, (index, item) in enumerate(items):
+            error = outcome[position]
+            results[index] = {'correct': error is None, 'error': error}
 
-                Orders.create(external_id=external_id, source='bitrix', products=products)
-            elif 'ship' in data:
-                Orders.confirm(external_id)
-            elif 'cancel' in data:
-                Orders.cancel(external_id)
-            elif 'change' in data:
+        return Response(data={'results': results}, status=status.HTTP_200_OK)
 
-                specifications = data['products']
-                products = []
 
-                for specification in specifications:
-                    product = dict(product_id=specification['id'], amount=specification['amount'])
-                    products.append(product)
+class ReceiveOrderView(APIView):
+    permission_classes = (IsAuthenticated,)
+    authentication_classes = (BasicAuthentication,)
 
-                Orders.change(external_id=external_id, products=products)
+    def post(self, request, *args, **kwargs):
+        logger.info(f"Received order {request.data} | {self.__class__.__name__}")
+        try:
+            event, created = OrderEvents.receive(request.data)
+        except OrderEvents.InvalidEvent as ex:
+            logger.warning(f"Invalid order event: {ex} | {self.__class__.__name__}")
+            return Response(data={'received': False, 'error': str(ex)}, status=status.HTTP_400_BAD_REQUEST)
 
-            return Response(data={'received': True}, status=status.HTTP_202_ACCEPTED)
-        except Exception as ex:
-            return Response(data={'received': False}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(data={'received': True, 'duplicate': not created}, status=status.HTTP_202_ACCEPTED)
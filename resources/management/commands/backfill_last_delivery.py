@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from resources.models import Resource, ResourceDelivery
+
+
+class Command(BaseCommand):
+    help = 'Fills last delivery fields of resources from the delivery history.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        deliveries = ResourceDelivery.objects.order_by('resource_id', '-time_stamp', '-created_at').distinct(
+            'resource_id').values_list('resource_id', 'time_stamp', 'comment', 'cost', 'provider_id')
+
+        resources = []
+        updated = 0
+        for resource_id, time_stamp, comment, cost, provider_id in deliveries.iterator(chunk_size=batch_size):
+            resources.append(Resource(id=resource_id,
+                                      last_delivery_date=time_stamp,
+                                      last_delivery_comment=comment,
+                                      last_delivery_cost=cost,
+                                      last_delivery_provider_id=provider_id))
+            if len(resources) == batch_size:
+                updated += self.update(resources)
+                resources = []
+        updated += self.update(resources)
+
+        self.stdout.write(self.style.SUCCESS(f"Updated {updated} resources"))
+
+    @staticmethod
+    def update(resources):
+        with transaction.atomic():
+            Resource.objects.bulk_update(resources, fields=['last_delivery_date', 'last_delivery_comment',
+                                                            'last_delivery_cost', 'last_delivery_provider'])
+        return len(resources)
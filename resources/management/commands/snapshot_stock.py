@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from resources.service import Stock
+
+
+class Command(BaseCommand):
+    help = 'Rolls up resource and specification amounts into a daily stock snapshot.'
+
+    def handle(self, *args, **options):
+        count = Stock.snapshot()
+        self.stdout.write(self.style.SUCCESS(f"Stored {count} snapshots"))
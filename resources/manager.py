@@ -1,9 +1,9 @@
 from django.db.models import Manager
 
-from utils.db.query import GetOrCreateQuery, ObjectExisting
+from utils.db.query import GetOrCreateQuery, ObjectExisting, SignalingQuerySet
 
 
-class ResourceProviderManager(Manager):
+class ResourceProviderManager(Manager.from_queryset(SignalingQuerySet)):
 
     def get_or_create_by_name(self, name):
         if name is None:
@@ -0,0 +1,34 @@
+# Generated by Django 3.1.5 on 2026-10-17 23:32
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('resources', '0003_remove_resource_comment'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='resource',
+            name='last_delivery_comment',
+            field=models.CharField(max_length=400, null=True),
+        ),
+        migrations.AddField(
+            model_name='resource',
+            name='last_delivery_cost',
+            field=models.DecimalField(decimal_places=2, max_digits=12, null=True),
+        ),
+        migrations.AddField(
+            model_name='resource',
+            name='last_delivery_date',
+            field=models.DateField(null=True),
+        ),
+        migrations.AddField(
+            model_name='resource',
+            name='last_delivery_provider',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='resources.resourceprovider'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 3.1.5 on 2026-10-17 23:34
+
+import django.contrib.postgres.indexes
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('resources', '0004_resource_last_delivery'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.AddIndex(
+            model_name='resource',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['name'], name='resource_name_trgm', opclasses=['gin_trgm_ops']),
+        ),
+        migrations.AddIndex(
+            model_name='resource',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['external_id'], name='resource_external_id_trgm', opclasses=['gin_trgm_ops']),
+        ),
+        migrations.AddIndex(
+            model_name='resourceprovider',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['name'], name='resourceprovider_name_trgm', opclasses=['gin_trgm_ops']),
+        ),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 3.1.5 on 2026-10-17 23:38
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('specification', '0004_trigram_indexes'),
+        ('resources', '0005_trigram_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockSnapshot',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('taken_at', models.DateTimeField()),
+                ('resource', models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='snapshots', to='resources.resource')),
+                ('specification', models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='snapshots', to='specification.specification')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='StockMovement',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('delta', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('reason', models.CharField(choices=[('DLV', 'Delivery'), ('BLD', 'Build'), ('ORD', 'Order'), ('MNL', 'Manual'), ('IMP', 'Import')], max_length=3)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('resource', models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='movements', to='resources.resource')),
+                ('specification', models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='movements', to='specification.specification')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='stocksnapshot',
+            constraint=models.UniqueConstraint(fields=('resource', 'taken_at'), name='stocksnapshot_resource_taken_at'),
+        ),
+        migrations.AddConstraint(
+            model_name='stocksnapshot',
+            constraint=models.UniqueConstraint(fields=('specification', 'taken_at'), name='stocksnapshot_specification_taken_at'),
+        ),
+        migrations.AddIndex(
+            model_name='stockmovement',
+            index=models.Index(fields=['resource', 'created_at'], name='resources_s_resourc_a253de_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='stockmovement',
+            index=models.Index(fields=['specification', 'created_at'], name='resources_s_specifi_ff3212_idx'),
+        ),
+    ]
@@ -1,7 +1,9 @@
+from django.contrib.postgres.indexes import GinIndex
 from django.db import models
 from django.utils import timezone
 
 from cella.models import Operator
+from utils.db.query import SignalingQuerySet
 from .manager import ResourceProviderManager
 
 
@@ -11,6 +13,11 @@ class ResourceProvider(models.Model):
 
     objects = ResourceProviderManager()
 
+    class Meta:
+        indexes = [
+            GinIndex(fields=['name'], name='resourceprovider_name_trgm', opclasses=['gin_trgm_ops'])
+        ]
+
     def __str__(self):
         return self.name
 
@@ -24,10 +31,46 @@ class Resource(models.Model):
     name = models.CharField(max_length=400)
     external_id = models.CharField(max_length=100, unique=True)
     amount = models.DecimalField(max_digits=12, decimal_places=2, default=.0)
+    reserved = models.DecimalField(max_digits=12, decimal_places=2, default=0, editable=False)
     amount_limit = models.DecimalField(max_digits=12, decimal_places=2, default=10.0)
     created_at = models.DateTimeField(auto_now_add=True)
     storage_place = models.CharField(max_length=100, null=True)
     cost = models.DecimalField(max_digits=12, decimal_places=2)
+    last_delivery_date = models.DateField(null=True)
+    last_delivery_comment = models.CharField(max_length=400, null=True)
+    last_delivery_cost = models.DecimalField(max_digits=12, decimal_places=2, null=True)
+    last_delivery_provider = models.ForeignKey(ResourceProvider,
+                                               on_delete=models.SET_NULL,
+                                               related_name='+',
+                                               null=True,
+                                               blank=True)
+
+    objects = SignalingQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            GinIndex(fields=['name'], name='resource_name_trgm', opclasses=['gin_trgm_ops']),
+            GinIndex(fields=['external_id'], name='resource_external_id_trgm', opclasses=['gin_trgm_ops'])
+        ]
+
+    @property
+    def available(self):
+        return self.amount - self.reserved
+
+    def set_last_delivery(self, delivery):
+        self.last_delivery_date = delivery.time_stamp
+        self.last_delivery_comment = delivery.comment
+        self.last_delivery_cost = delivery.cost
+        self.last_delivery_provider = delivery.provider
+
+    def is_last_delivery(self, delivery):
+        # Same order as backfill_last_delivery: '-time_stamp' puts undated deliveries first, the newest wins ties.
+        # Delivery cost is never NULL, so a NULL cost means there is no last delivery yet.
+        if self.last_delivery_cost is None or delivery.time_stamp is None:
+            return True
+        if self.last_delivery_date is None:
+            return False
+        return delivery.time_stamp >= self.last_delivery_date
 
     def __str__(self):
         return f"{self.name} - {self.external_id}"
@@ -43,6 +86,8 @@ class ResourceDelivery(models.Model):
     time_stamp = models.DateField(null=True)
     created_at = models.DateTimeField(default=timezone.now)
 
+    objects = SignalingQuerySet.as_manager()
+
     def set_resource(self, resource):
         self.resource = resource
 
@@ -67,3 +112,45 @@ class ResourceDelivery(models.Model):
 
     def __str__(self):
         return f"Delivery for {self.resource.id} - {self.amount}"
+
+
+class StockMovement(models.Model):
+    class MovementReason(models.TextChoices):
+        DELIVERY = 'DLV', 'Delivery'
+        BUILD = 'BLD', 'Build'
+        ORDER = 'ORD', 'Order'
+        MANUAL = 'MNL', 'Manual'
+        IMPORT = 'IMP', 'Import'
+
+    resource = models.ForeignKey(Resource, on_delete=models.CASCADE, related_name='movements', null=True)
+    specification = models.ForeignKey('specification.Specification', on_delete=models.CASCADE,
+                                      related_name='movements', null=True)
+    delta = models.DecimalField(max_digits=12, decimal_places=2)
+    reason = models.CharField(max_length=3, choices=MovementReason.choices)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['resource', 'created_at']),
+            models.Index(fields=['specification', 'created_at'])
+        ]
+
+    def __str__(self):
+        return f"Movement {self.resource_id or self.specification_id} {self.delta} {self.reason}"
+
+
+class StockSnapshot(models.Model):
+    resource = models.ForeignKey(Resource, on_delete=models.CASCADE, related_name='snapshots', null=True)
+    specification = models.ForeignKey('specification.Specification', on_delete=models.CASCADE,
+                                      related_name='snapshots', null=True)
+    amount = models.DecimalField(max_digits=12, decimal_places=2)
+    taken_at = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['resource', 'taken_at'], name='stocksnapshot_resource_taken_at'),
+            models.UniqueConstraint(fields=['specification', 'taken_at'], name='stocksnapshot_specification_taken_at')
+        ]
+
+    def __str__(self):
+        return f"Snapshot {self.resource_id or self.specification_id} {self.amount} at {self.taken_at}"
@@ -1,8 +1,10 @@
+from django.db.models import F
 from rest_framework import serializers
 from rest_framework.validators import UniqueValidator
 
 from .models import Resource, ResourceProvider, ResourceDelivery
 from .service import Resources
+from utils.serializer import ValuesSerializer
 
 
 class ResourceProviderSerializer(serializers.ModelSerializer):
@@ -42,12 +44,14 @@ class ResourceSerializer(serializers.ModelSerializer):
     provider = ResourceProviderSerializer(read_only=True, allow_null=True)
     provider_name = serializers.CharField(write_only=True, required=False, allow_null=True, default=None,
                                           allow_blank=True)
-    comment = serializers.CharField(max_length=400, read_only=True, allow_null=True, allow_blank=True)
+    comment = serializers.CharField(source='last_delivery_comment', max_length=400, read_only=True, allow_null=True,
+                                    allow_blank=True)
     cost = serializers.DecimalField(max_digits=12, decimal_places=2, required=False, min_value=0, allow_null=True)
     amount = serializers.DecimalField(max_digits=12, decimal_places=2, required=False, min_value=0, allow_null=True)
     storage_place = serializers.CharField(allow_null=True, required=False, allow_blank=True)
     amount_limit = serializers.DecimalField(max_digits=12, decimal_places=2, allow_null=True, default=10.0)
     last_delivery_date = serializers.DateField(read_only=True, allow_null=True)
+    available = serializers.DecimalField(max_digits=12, decimal_places=2, read_only=True)
 
     class Meta:
         model = Resource
@@ -59,6 +63,8 @@ class ResourceSerializer(serializers.ModelSerializer):
             'provider_name',
             'cost',
             'amount',
+            'reserved',
+            'available',
             'amount_limit',
             'storage_place',
             'last_delivery_date',
@@ -106,6 +112,11 @@ class ResourceSerializer(serializers.ModelSerializer):
         return resource
 
 
+class ResourceValuesSerializer(ValuesSerializer):
+    serializer_class = ResourceSerializer
+    expressions = {'available': F('amount') - F('reserved')}
+
+
 class ResourceShortSerializer(serializers.ModelSerializer):
     cost = serializers.DecimalField(max_digits=12, decimal_places=2)
     amount = serializers.DecimalField(max_digits=12, decimal_places=2)
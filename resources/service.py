@@ -1,24 +1,154 @@
-import asyncio
-
-import aiohttp
-from asgiref.sync import sync_to_async, async_to_sync
-from django.conf import settings
 from django.core.exceptions import ObjectDoesNotExist
 from django.db import IntegrityError, transaction, DatabaseError
 import logging
+from contextlib import nullcontext
 import pandas as pd
-from django.db.models import OuterRef, Subquery, F, Q, Count, Sum
+from django.db.models import F, Case, When, Value, Sum, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.utils import timezone
 
 from authentication.models import Operator
-from cella.models import File
-from specification.models import Specification, SpecificationResource
+from cella.models import Job, OutboxMessage
+from cella.service import Jobs, Outbox, Counters
+from specification.models import Specification
 from utils.function import random_str
 
-from .models import Resource, ResourceProvider, ResourceDelivery
+from .models import Resource, ResourceProvider, ResourceDelivery, StockMovement, StockSnapshot
 
 logger = logging.getLogger(__name__)
 
 
+class Stock:
+    """
+    All stock amount mutations go through here: rows are locked in id order
+    (specifications before resources), changed with a single UPDATE and
+    recorded in the movement ledger.
+    """
+
+    class InsufficientStock(Exception):
+        def __init__(self, negative):
+            super().__init__(negative)
+            self.negative = negative
+
+    @classmethod
+    def lock(cls, model, ids):
+        return dict(model.objects.select_for_update().filter(id__in=ids).order_by('id').values_list('id', 'amount'))
+
+    @classmethod
+    def change(cls, model, deltas, reason, allow_negative=True):
+        amount_field = model._meta.get_field('amount')
+        deltas = {pk: amount_field.to_python(delta) for pk, delta in deltas.items()}
+        deltas = {pk: delta for pk, delta in deltas.items() if delta != 0}
+        if len(deltas) == 0:
+            return {}
+
+        with transaction.atomic():
+            amounts = cls.lock(model, deltas.keys())
+            deltas = {pk: delta for pk, delta in deltas.items() if pk in amounts}
+            negative = {pk: amounts[pk] + delta for pk, delta in deltas.items() if amounts[pk] + delta < 0}
+            if len(negative) != 0:
+                if not allow_negative:
+                    raise cls.InsufficientStock(negative)
+                logger.warning(f"{model.__name__} amount < 0 for {list(negative)} | {cls.__name__}")
+
+            with Counters.track(model, deltas.keys()) if model is Resource else nullcontext():
+                model.objects.filter(id__in=deltas.keys()).update(amount=F('amount') + Case(
+                    *[When(id=pk, then=Value(delta)) for pk, delta in deltas.items()],
+                    default=Value(0),
+                    output_field=amount_field
+                ))
+            cls.record(model, deltas, reason)
+        return negative
+
+    @classmethod
+    def set(cls, model, amounts, reason):
+        amounts = cls._to_python(model, amounts)
+        with transaction.atomic():
+            current = cls.lock(model, amounts.keys())
+            return cls.change(model, {pk: amount - current[pk] for pk, amount in amounts.items() if pk in current},
+                              reason)
+
+    @classmethod
+    def record(cls, model, deltas, reason):
+        field = cls._ledger_field(model)
+        now = timezone.now()
+        StockMovement.objects.bulk_create([
+            StockMovement(**{f'{field}_id': pk}, delta=delta, reason=reason, created_at=now)
+            for pk, delta in deltas.items() if delta != 0
+        ])
+
+    @classmethod
+    def change_resources(cls, deltas, reason, allow_negative=True):
+        return cls.change(Resource, deltas, reason, allow_negative)
+
+    @classmethod
+    def change_specifications(cls, deltas, reason, allow_negative=True):
+        return cls.change(Specification, deltas, reason, allow_negative)
+
+    @classmethod
+    def set_resources(cls, amounts, reason):
+        return cls.set(Resource, amounts, reason)
+
+    @classmethod
+    def set_specifications(cls, amounts, reason):
+        return cls.set(Specification, amounts, reason)
+
+    @classmethod
+    def snapshot(cls, taken_at=None):
+        """
+        Rolls current amounts back to `taken_at` (start of today by default)
+        and stores them, so balance_at only has to replay movements since.
+        """
+        if taken_at is None:
+            taken_at = timezone.localtime().replace(hour=0, minute=0, second=0, microsecond=0)
+
+        snapshots = []
+        for model in (Resource, Specification):
+            field = cls._ledger_field(model)
+            tail = cls._movements_total(field, created_at__gt=taken_at)
+            for pk, amount, delta in model.objects.annotate(tail=tail).values_list('id', 'amount', 'tail'):
+                snapshots.append(StockSnapshot(**{f'{field}_id': pk}, amount=amount - delta, taken_at=taken_at))
+        StockSnapshot.objects.bulk_create(snapshots, batch_size=RESOURCE_UPSERT_BATCH_SIZE, ignore_conflicts=True)
+        return len(snapshots)
+
+    @classmethod
+    def balance_at(cls, model, ids, moment):
+        field = cls._ledger_field(model)
+        latest = StockSnapshot.objects.filter(**{field: OuterRef('pk'), 'taken_at__lte': moment}).order_by('-taken_at')
+        # Movements are replayed forward from the latest snapshot, items without a snapshot yet are rolled back
+        # from their current amount.
+        tail = Case(
+            When(snapshot_at__isnull=True, then=cls._movements_total(field, created_at__gt=moment)),
+            default=cls._movements_total(field, created_at__gt=OuterRef('snapshot_at'), created_at__lte=moment)
+        )
+        balances = {}
+        for pk, amount, snapshot_at, snapshot_amount, delta in model.objects.filter(id__in=list(ids)).annotate(
+                snapshot_at=Subquery(latest.values('taken_at')[:1]),
+                snapshot_amount=Subquery(latest.values('amount')[:1])
+        ).annotate(tail=tail).values_list('id', 'amount', 'snapshot_at', 'snapshot_amount', 'tail'):
+            balances[pk] = amount - delta if snapshot_at is None else snapshot_amount + delta
+        return balances
+
+    @classmethod
+    def _movements_total(cls, field, **filters):
+        """
+        Correlated sum of the item's movements, read through the (item, created_at) index.
+        """
+        delta_field = StockMovement._meta.get_field('delta')
+        movements = StockMovement.objects.filter(**{field: OuterRef('pk')}, **filters).order_by().values(
+            field).annotate(total=Sum('delta')).values('total')
+        return Coalesce(Subquery(movements, output_field=delta_field), Value(0), output_field=delta_field)
+
+    @classmethod
+    def _ledger_field(cls, model):
+        return 'resource' if model is Resource else 'specification'
+
+    @classmethod
+    def _to_python(cls, model, amounts):
+        amount_field = model._meta.get_field('amount')
+        return {pk: amount_field.to_python(amount) for pk, amount in amounts.items()}
+
+
 class Resources:
     class ResourceDoesNotExist(ObjectDoesNotExist):
         pass
@@ -43,19 +173,21 @@ class Resources:
         if new_name is not None:
             resource.name = new_name
 
-        resource.comment = comment
         provider = ResourceProvider.objects.get_or_create_by_name(provider_name).object()
 
         resource.provider = provider
         delivery = cls._create_delivery(resource, provider, cost, amount, comment, time_stamp)
-
-        cls.set_cost(resource, cost, user=user, save=True)
-        cls.change_amount(resource, amount, user=user, save=True)
+        if resource.is_last_delivery(delivery):
+            resource.set_last_delivery(delivery)
 
         try:
             with transaction.atomic():
                 delivery.save()
-                resource.save()
+                resource.save(update_fields=['name', 'provider', 'last_delivery_date', 'last_delivery_comment',
+                                             'last_delivery_cost', 'last_delivery_provider'])
+                cls.set_cost(resource, cost, user=user, save=True)
+                cls.change_amount(resource, amount, user=user, save=True,
+                                  reason=StockMovement.MovementReason.DELIVERY)
         except Exception as ex:
             logger.error(f"make delivery error | {cls.__name__}", exc_info=True)
 
@@ -92,25 +224,27 @@ class Resources:
     def set_amount(cls, resource, amount_value, user, save=True):
         resource = cls.get(resource)
 
-        resource.amount = amount_value
-        if amount_value < 0:
-            logger.warning(f"resources amount < 0 for resources '{resource.id}'")
-
         if save:
-            resource.save()
+            Stock.set_resources({resource.id: amount_value}, StockMovement.MovementReason.MANUAL)
+            resource.refresh_from_db(fields=['amount'])
+        else:
+            resource.amount = amount_value
+            if amount_value < 0:
+                logger.warning(f"resources amount < 0 for resources '{resource.id}'")
 
         return amount_value
 
     @classmethod
-    def change_amount(cls, resource, delta_amount, user=None, save=True):
+    def change_amount(cls, resource, delta_amount, user=None, save=True, reason=StockMovement.MovementReason.MANUAL):
         resource = cls.get(resource)
 
-        resource.amount = float(resource.amount) + float(delta_amount)
-        if resource.amount < 0:
-            logger.warning(f"resources amount < 0 for resources '{resource.id}'")
-
         if save:
-            resource.save()
+            Stock.change_resources({resource.id: delta_amount}, reason)
+            resource.refresh_from_db(fields=['amount'])
+        else:
+            resource.amount = float(resource.amount) + float(delta_amount)
+            if resource.amount < 0:
+                logger.warning(f"resources amount < 0 for resources '{resource.id}'")
 
         return resource.amount
 
@@ -123,7 +257,8 @@ class Resources:
                 specification = res__spec.specification
                 specification.verified = False
                 specifications.append(specification)
-            Specification.objects.bulk_update(specifications, fields=['verified'])
+            with Counters.track(Specification, [specification.id for specification in specifications]):
+                Specification.objects.bulk_update(specifications, fields=['verified'])
 
         else:
             resource = cls.get(resource)
@@ -132,27 +267,25 @@ class Resources:
             logger.warning(f"resources cost < 0 for resources '{resource.id}'")
 
         if save:
-            resource.save()
-            query_cost = Resource.objects.filter(id=OuterRef('resource_id'))
-
-            query_res_spec = SpecificationResource.objects.filter(
-                specification=OuterRef('pk'),
-            ).values('specification_id').annotate(
-                total_cost=Sum(Subquery(query_cost.values('cost')) * F('amount')))
-
-            specifications = Specification.objects.filter(res_specs__resource=resource).annotate(
-                prime_cost=Subquery(query_res_spec.values('total_cost'))).values('product_id', 'prime_cost')
-            specifications = sync_to_async(specifications.all)
-            spc = async_to_sync(cls.send_prime_cost)
-
-            spc(specifications)
+            with transaction.atomic():
+                resource.save(update_fields=['cost'])
+                specifications = Specification.objects.filter(res_specs__resource=resource)
+                specifications.update_prime_cost()
+                cls.notify_new_prime_cost(specifications)
         return cost_value
 
+    @classmethod
+    def notify_new_prime_cost(cls, specifications):
+        products = list(specifications.values_list('product_id', 'prime_cost'))
+        Outbox.push_many(
+            OutboxMessage.OutboxEndpoint.PRICE,
+            [{"ID": product_id, "primeCost": float(prime_cost)} for product_id, prime_cost in products],
+            keys=[f"prime_cost:{product_id}" for product_id, _ in products]
+        )
+
     @classmethod
     def expired_count(cls):
-        count = Resource.objects.aggregate(
-            count=Count('id', filter=Q(amount_limit__gte=F('amount'))))
-        return count['count']
+        return Counters.read()['resources_expired']
 
     @classmethod
     def update_fields(cls, resource, resource_name=None, external_id=None, provider_name: str = None, user=None):
@@ -175,6 +308,7 @@ class Resources:
                 if len(value_data) == 0:
                     logger.warning(f"No fields updated for resources with id '{resource.id}'")
                     return cls.detail(resource)
+                resource.save(update_fields=['name', 'external_id', 'provider'])
 
         except DatabaseError:
             logger.warning(f"Update error | {cls.__name__}", exc_info=True)
@@ -185,11 +319,7 @@ class Resources:
     @classmethod
     def detail(cls, resource):
 
-        resource = cls.get(resource)
-        resource.last_delivery_date = \
-        ResourceDelivery.objects.values('time_stamp').filter(resource=resource).latest('time_stamp')['time_stamp']
-        print(resource.last_delivery_date)
-        return resource
+        return cls.get(resource, related=['provider'])
 
     @classmethod
     def create(cls, resource_name: str, external_id: str, cost_value: float = 0, amount_value: float = 0,
@@ -216,7 +346,6 @@ class Resources:
                     resource = Resource.objects.create(name=resource_name,
                                                        external_id=external_id,
                                                        provider=provider,
-                                                       amount=amount_value,
                                                        storage_place=storage_place,
                                                        cost=cost_value,
                                                        amount_limit=amount_limit)
@@ -224,6 +353,7 @@ class Resources:
                 except IntegrityError as ex:
                     logger.warning(f"Not unique external id '{external_id}'")
                     raise cls.ExternalIdUniqueError(ex)
+                Counters.created(Resource, [resource.id])
 
                 operator = Operator.objects.get_or_create_operator(user)
 
@@ -255,11 +385,7 @@ class Resources:
     @classmethod
     def list(cls):
         try:
-            delivery_query = ResourceDelivery.objects.filter(resource=OuterRef('pk')).order_by('-time_stamp')
-            query = Resource.objects.select_related('provider').annotate(
-                last_delivery_date=Subquery(delivery_query.values('time_stamp')[:1]),
-                comment=Subquery(delivery_query.values('comment')[:1]),
-            ).order_by('-created_at')
+            query = Resource.objects.select_related('provider').order_by('-created_at')
         except DatabaseError as ex:
             logger.error(f"Error while getting resource list: {ex} | {cls.__name__}", exc_info=True)
             raise cls.QueryError()
@@ -279,114 +405,148 @@ class Resources:
     @classmethod
     def delete(cls, resource, user):
         resource = cls.get(resource)
-        resource.delete()
+        cls.bulk_delete([resource.id], user)
 
     @classmethod
     def bulk_delete(cls, ids, user):
-        Resource.objects.filter(id__in=ids).delete()
+        with transaction.atomic():
+            specification_ids = list(Specification.objects.filter(res_specs__resource_id__in=ids).values_list(
+                'id', flat=True))
+            with Counters.track(Resource, ids):
+                Resource.objects.filter(id__in=ids).delete()
+            Specification.objects.filter(id__in=specification_ids).update_prime_cost()
 
     @classmethod
-    async def create_from_excel(cls, file_instance_id, operator_id):
-        asyncio.create_task(create_from_excel(file_instance_id, operator_id))
-        return
-
-    @classmethod
-    async def send_prime_cost(cls, products):
-        products = await products()
-        return asyncio.create_task(send_prime_cost(products))
-
-
-async def create_from_excel(file_instance_id, operator_id=None):
-    try:
-        file = await sync_to_async(File.objects.get)(id=file_instance_id)
-        excel = pd.read_excel(file.file)
-    except Exception:
-        logger.warning(f"Error while reading excel file {file_instance_id}", exc_info=True)
-        raise
-    try:
-        operator = await (sync_to_async(Operator.objects.get_or_create_operator)(operator_id))
-        actions = []
-        costs = []
-        provider_dict = {}
-        ext = []
-        resources = []
-        for x in range(excel.shape[0]):
-
-            row = excel.iloc[x]
-            if (not pd.isnull(row['Спецификация / Ресурс'])) and \
-                    row['Спецификация / Ресурс'].lower() == 'resource':
-                obj = dict()
-                obj['name'] = row['Название']
-
-                if pd.isnull(row['ID']):
-                    external_id = random_str(24)
-
-                else:
-                    external_id = str(int(row['ID']))
-
-                if external_id in ext:
-                    continue
-                else:
-                    ext.append(external_id)
-
-                obj['external_id'] = external_id
-
-                if pd.isnull(row['Количество ']):
-                    amount_value = 0
-                else:
-                    amount_value = row['Количество ']
-
-                if pd.isnull(row['Поставщик']):
-                    provider = None
-                else:
-                    provider_name = row['Поставщик']
-                    if provider_name not in provider_dict:
-                        provider = (await (sync_to_async(ResourceProvider.objects.get_or_create)(name=provider_name)))[
-                            0]
-                        provider_dict[provider_name] = provider
-                    else:
-                        provider = provider_dict[provider_name]
-
-                obj['provider'] = provider
-                resource = Resource(**obj)
-                if pd.isnull(row['Цена']):
-                    cost_value = 0
-                else:
-                    cost_value = row['Цена']
-                await sync_to_async(Resources.set_cost)(resource, cost_value, operator, verified=True, save=False)
-                await sync_to_async(Resources.set_amount)(resource, amount_value, operator, save=False)
-
-                resources.append(resource)
-
-        group = asyncio.gather((sync_to_async(Resource.objects.bulk_create)(resources)))
-        await group
-    except Exception as ex:
-        logger.warning(f"Error while creating resources from excel", exc_info=True)
-        raise Resources.CreateError()
-
-
-bitrix_url = settings.BITRIX_URL + "ajax/tsenaobnov.php"
-
-
-def session_post(session, products, lnp):
-    i = 0
-    headers = {'content-type': 'application/json'}
-    while i < lnp:
-        product = products[i]
-        logger.info(f"sent prime cost {product}")
-        i += 1
-        yield session.post(bitrix_url, json={"ID": product["product_id"], "primeCost": product['prime_cost']},
-                           headers=headers)
-
-
-async def send_prime_cost(products):
-    tasks = []
-    ln = sync_to_async(len)
-    lnp = await ln(products)
-    async with aiohttp.ClientSession(auth=aiohttp.BasicAuth(**settings.BITRIX_AUF_CONF)) as session:
-        for sp in session_post(session, products, lnp):
-            tasks.append(sp)
+    def create_from_excel(cls, file_instance_id, operator_id):
+        return Jobs.enqueue(Job.JobKind.RESOURCES_EXCEL, file_instance_id, operator_id)
+
+
+RESOURCE_EXCEL_KIND_COLUMN = 'Спецификация / Ресурс'
+RESOURCE_EXCEL_COLUMNS = {
+    'ID': 'external_id',
+    'Название': 'name',
+    'Количество ': 'amount',
+    'Цена': 'cost',
+    'Поставщик': 'provider_name',
+}
+RESOURCE_UPSERT_BATCH_SIZE = 1000
+
+
+def normalize_excel_resources(excel):
+    kind = excel[RESOURCE_EXCEL_KIND_COLUMN].astype('string').str.strip().str.lower()
+    frame = excel.loc[kind.eq('resource').fillna(False).to_numpy(), list(RESOURCE_EXCEL_COLUMNS)]
+    frame = frame.rename(columns=RESOURCE_EXCEL_COLUMNS)
+    # Sheet row numbers for error reporting, the header takes the first row.
+    frame.insert(0, 'row', frame.index + 2)
+
+    raw_ids = frame['external_id']
+    numeric_ids = pd.to_numeric(raw_ids, errors='coerce')
+    external_ids = raw_ids.astype('string').str.strip()
+    is_numeric = numeric_ids.notna()
+    external_ids[is_numeric] = numeric_ids[is_numeric].astype('int64').astype('string')
+    is_missing = raw_ids.isna()
+    external_ids[is_missing] = [random_str(24) for _ in range(int(is_missing.sum()))]
+    frame['external_id'] = external_ids.astype(object)
+
+    frame['name'] = frame['name'].fillna('').astype(str).str.strip()
+    frame['amount'] = pd.to_numeric(frame['amount'], errors='coerce').fillna(0).round(2)
+    frame['cost'] = pd.to_numeric(frame['cost'], errors='coerce').fillna(0).round(2)
+    provider_names = frame['provider_name'].astype('string').str.strip()
+    has_provider = provider_names.ne('').fillna(False).to_numpy(dtype=bool)
+    frame['provider_name'] = provider_names.astype(object).where(has_provider, None)
+
+    return frame.drop_duplicates('external_id', keep='first').reset_index(drop=True)
+
+
+def resolve_providers(names):
+    names = set(name for name in names if name is not None)
+    providers = {}
+    for provider_id, name in ResourceProvider.objects.filter(name__in=names).order_by('-id').values_list('id', 'name'):
+        providers[name] = provider_id
+
+    missing = [ResourceProvider(name=name) for name in names if name not in providers]
+    for provider in ResourceProvider.objects.bulk_create(missing):
+        providers[provider.name] = provider.id
+    return providers
+
+
+def upsert_resources(frame, batch_size=RESOURCE_UPSERT_BATCH_SIZE, progress=None, providers=None):
+    if providers is None:
+        providers = resolve_providers(frame['provider_name'].unique())
+    created = 0
+    updated = 0
+
+    for start in range(0, frame.shape[0], batch_size):
+        batch = frame.iloc[start:start + batch_size]
         try:
-            await asyncio.gather(*tasks)
-        except Exception as ex:
-            logger.error(f"error while sending products new prime_cost", exc_info=True)
+            batch_created, batch_updated = _upsert_resource_batch(batch, providers)
+        except DatabaseError as ex:
+            if batch.shape[0] > 1:
+                logger.warning(f"Resource batch upsert failed, retrying row by row: {ex}")
+                batch_created, batch_updated = upsert_resources(batch, 1, progress, providers)
+            elif progress is not None:
+                progress.error(int(batch['row'].iloc[0]), ex)
+                continue
+            else:
+                raise
+        else:
+            if progress is not None:
+                progress.advance(batch.shape[0], batch_created, batch_updated)
+
+        created += batch_created
+        updated += batch_updated
+
+    return created, updated
+
+
+def _upsert_resource_batch(batch, providers):
+    with transaction.atomic():
+        existing = {
+            external_id: (resource_id, cost, amount) for resource_id, external_id, cost, amount in
+            Resource.objects.select_for_update().filter(
+                external_id__in=list(batch['external_id'])
+            ).order_by('id').values_list('id', 'external_id', 'cost', 'amount')
+        }
+        amount_field = Resource._meta.get_field('amount')
+        movements = {}
+        to_create = []
+        to_update = []
+        cost_changed = []
+        for _, external_id, name, amount, cost, provider_name in batch.itertuples(index=False, name=None):
+            resource = Resource(external_id=external_id, name=name, amount=amount, cost=cost,
+                                provider_id=providers.get(provider_name))
+            if external_id in existing:
+                resource.id, old_cost, old_amount = existing[external_id]
+                if float(old_cost) != cost:
+                    cost_changed.append(resource.id)
+                movements[resource.id] = amount_field.to_python(amount) - old_amount
+                to_update.append(resource)
+            else:
+                to_create.append(resource)
+
+        Resource.objects.bulk_create(to_create)
+        Counters.created(Resource, [resource.id for resource in to_create])
+        with Counters.track(Resource, [resource.id for resource in to_update]):
+            Resource.objects.bulk_update(to_update, fields=['name', 'amount', 'cost', 'provider'])
+        movements.update({resource.id: amount_field.to_python(resource.amount) for resource in to_create})
+        Stock.record(Resource, movements, StockMovement.MovementReason.IMPORT)
+        if len(cost_changed) != 0:
+            specifications = Specification.objects.filter(res_specs__resource_id__in=cost_changed)
+            with Counters.track(Specification, specifications.values_list('id', flat=True)):
+                specifications.update(verified=False)
+            specifications.update_prime_cost()
+            Resources.notify_new_prime_cost(specifications)
+
+    return len(to_create), len(to_update)
+
+
+def import_resources_from_excel(file, progress):
+    excel = pd.read_excel(file.file)
+    frame = normalize_excel_resources(excel)
+    progress.set_total(frame.shape[0])
+
+    without_name = frame['name'].eq('')
+    for row in frame.loc[without_name, 'row']:
+        progress.error(int(row), "'Название' is empty")
+
+    upsert_resources(frame.loc[~without_name], progress=progress)
@@ -1,8 +1,21 @@
+import io
+from datetime import date
+from unittest import mock
+
+import pandas as pd
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
 from rest_framework.test import APITestCase
 
-from .models import Resource, ResourceProvider
+from cella.service import ResponseCache
+from .models import Resource, ResourceProvider, ResourceDelivery, StockMovement
+from .serializer import ResourceSerializer, ResourceValuesSerializer
+from .service import Resources, Stock, normalize_excel_resources, upsert_resources
 from utils.test.mixins import ResponseTestCaseMixin
 from utils.function import dict_items_to_str
+from utils.pagination import KeysetPagination
 
 
 class ResourceCreateTest(ResponseTestCaseMixin, APITestCase):
@@ -148,3 +161,235 @@ class ResourceCreateTest(ResponseTestCaseMixin, APITestCase):
 
     def getLabel(self):
         return self.label or self.request_data.get('name') or self.request_data.get('id')
+
+
+class ResourceExcelImportTest(TestCase):
+    columns = ['Спецификация / Ресурс', 'ID', 'Название', 'Количество ', 'Цена', 'Поставщик']
+
+    def makeExcel(self, rows):
+        return pd.DataFrame(rows, columns=self.columns)
+
+    def testNormalize(self):
+        excel = self.makeExcel([
+            ['Resource', 1.0, 'Resource 1', 5, 10.5, 'Provider 1'],
+            ['Specification', 2.0, 'Specification 2', 1, 1, None],
+            ['resource', 1.0, 'Resource 1 duplicate', 7, 11, None],
+            [None, 3.0, 'Empty kind', 1, 1, None],
+            ['resource', None, 'Resource without id', None, None, ' '],
+        ])
+        frame = normalize_excel_resources(excel)
+
+        self.assertEqual(frame.shape[0], 2)
+        self.assertEqual(frame.loc[0, 'external_id'], '1')
+        self.assertEqual(frame.loc[0, 'name'], 'Resource 1')
+        self.assertEqual(frame.loc[0, 'provider_name'], 'Provider 1')
+        self.assertEqual(len(frame.loc[1, 'external_id']), 24)
+        self.assertEqual(frame.loc[1, 'amount'], 0)
+        self.assertEqual(frame.loc[1, 'cost'], 0)
+        self.assertIsNone(frame.loc[1, 'provider_name'])
+
+    def testReuploadUpdatesResources(self):
+        excel = self.makeExcel([
+            ['resource', 1, 'Resource 1', 5, 10, 'Provider 1'],
+            ['resource', 2, 'Resource 2', 3, 20, 'Provider 1'],
+        ])
+        self.assertEqual(upsert_resources(normalize_excel_resources(excel), batch_size=1), (2, 0))
+
+        excel = self.makeExcel([
+            ['resource', 1, 'Resource 1 renamed', 8, 15, 'Provider 2'],
+            ['resource', 3, 'Resource 3', 1, 1, None],
+        ])
+        self.assertEqual(upsert_resources(normalize_excel_resources(excel)), (1, 1))
+
+        self.assertEqual(Resource.objects.count(), 3)
+        self.assertEqual(ResourceProvider.objects.count(), 2)
+        resource = Resource.objects.select_related('provider').get(external_id='1')
+        self.assertEqual(resource.name, 'Resource 1 renamed')
+        self.assertEqual(float(resource.amount), 8)
+        self.assertEqual(float(resource.cost), 15)
+        self.assertEqual(resource.provider.name, 'Provider 2')
+
+
+class ResourceDeliveryTest(TestCase):
+
+    def setUp(self):
+        self.resource = Resource.objects.create(name='Resource 1', external_id='1', cost=10, amount=5)
+
+    def testLastDeliveryFields(self):
+        Resources.make_delivery(self.resource.id, provider_name='Provider 1', cost=12, amount=3, comment='new',
+                                time_stamp=date(2021, 3, 10), user='system')
+        Resources.make_delivery(self.resource.id, provider_name='Provider 2', cost=11, amount=2, comment='old',
+                                time_stamp=date(2021, 3, 1), user='system')
+
+        resource = Resources.list().get(id=self.resource.id)
+        self.assertEqual(float(resource.amount), 10)
+        self.assertEqual(resource.last_delivery_date, date(2021, 3, 10))
+        self.assertEqual(resource.last_delivery_comment, 'new')
+        self.assertEqual(float(resource.last_delivery_cost), 12)
+        self.assertEqual(resource.last_delivery_provider.name, 'Provider 1')
+
+    def testBackfill(self):
+        provider = ResourceProvider.objects.create(name='Provider 1')
+        ResourceDelivery.objects.create(resource=self.resource, provider=provider, cost=3, amount=1,
+                                        comment='old', time_stamp=date(2021, 3, 1))
+        ResourceDelivery.objects.create(resource=self.resource, provider=provider, cost=4, amount=1,
+                                        comment='new', time_stamp=date(2021, 3, 2))
+
+        call_command('backfill_last_delivery', stdout=io.StringIO())
+
+        resource = Resource.objects.get(id=self.resource.id)
+        self.assertEqual(resource.last_delivery_date, date(2021, 3, 2))
+        self.assertEqual(resource.last_delivery_comment, 'new')
+        self.assertEqual(float(resource.last_delivery_cost), 4)
+        self.assertEqual(resource.last_delivery_provider_id, provider.id)
+
+    def testLastDeliveryMatchesBackfill(self):
+        later, earlier = date(2021, 3, 10), date(2021, 3, 1)
+        cases = [
+            ([later, None], '1'),
+            ([None, later], '0'),
+            ([None, None], '1'),
+            ([None, later, None], '2'),
+            ([later, earlier], '0'),
+            ([earlier, later], '1'),
+            ([later, later], '1'),
+        ]
+        resources = []
+        for number, (time_stamps, last) in enumerate(cases):
+            resource = Resource.objects.create(name=f'Case {number}', external_id=f'case-{number}', cost=1)
+            for index, time_stamp in enumerate(time_stamps):
+                Resources.make_delivery(resource.id, provider_name='Provider', cost=1, comment=str(index),
+                                        time_stamp=time_stamp, user='system')
+            resources.append((resource.id, last))
+            with self.subTest(time_stamps=time_stamps):
+                self.assertEqual(Resource.objects.get(id=resource.id).last_delivery_comment, last)
+
+        Resource.objects.update(last_delivery_comment=None)
+        call_command('backfill_last_delivery', stdout=io.StringIO())
+        for resource_id, last in resources:
+            self.assertEqual(Resource.objects.get(id=resource_id).last_delivery_comment, last)
+
+
+class ResourceSearchTest(ResponseTestCaseMixin, APITestCase):
+
+    def setUp(self):
+        provider = ResourceProvider.objects.create(name='Steel Works')
+        Resource.objects.create(name='Steel bolt M6', external_id='1001', cost=1, provider=provider)
+        Resource.objects.create(name='Wooden plank', external_id='1002', cost=1, provider=provider)
+        Resource.objects.create(name='Glass panel', external_id='2001', cost=1)
+
+    def search(self, term, **params):
+        response = self.client.get('/resource/list/', data={'search': term, **params})
+        self.assertResponseSuccess(response, "{status_code}, {response_data}")
+        return [resource['name'] for resource in response.data['results']]
+
+    def testSearch(self):
+        self.assertEqual(self.search('bolt'), ['Steel bolt M6'])
+        self.assertEqual(self.search('STEEL'), ['Steel bolt M6', 'Wooden plank'])
+        self.assertEqual(self.search('steel plank'), ['Wooden plank'])
+        self.assertEqual(self.search('200'), ['Glass panel'])
+        self.assertEqual(self.search('100', ordering='-name'), ['Wooden plank', 'Steel bolt M6'])
+        self.assertEqual(self.search('9' * 30), [])
+
+
+class ResourcePaginationTest(ResponseTestCaseMixin, APITestCase):
+
+    def setUp(self):
+        ResponseCache.cache().clear()
+        steel = ResourceProvider.objects.create(name='Steel Works')
+        wood = ResourceProvider.objects.create(name='Wood Works')
+        for external_id, amount, provider in [('1', 5, steel), ('2', 3, None), ('3', 5, wood), ('4', 1, None),
+                                              ('5', 5, steel), ('6', 3, wood), ('7', 2, None)]:
+            Resource.objects.create(name=f'Resource {external_id}', external_id=external_id, cost=1, amount=amount,
+                                    provider=provider)
+
+    def scroll(self, ordering):
+        response = self.client.get('/resource/list/', data={'cursor': '', 'page_size': 2, 'ordering': ordering})
+        external_ids = []
+        while True:
+            self.assertResponseSuccess(response, "{status_code}, {response_data}")
+            self.assertNotIn('count', response.data)
+            external_ids += [resource['external_id'] for resource in response.data['results']]
+            if response.data['next'] is None:
+                return external_ids
+            response = self.client.get(response.data['next'])
+
+    def testScroll(self):
+        self.assertEqual(self.scroll('-amount'), ['1', '3', '5', '2', '6', '7', '4'])
+        self.assertEqual(self.scroll('provider__name'), ['1', '5', '3', '6', '2', '4', '7'])
+        self.assertEqual(self.scroll('-provider__name'), ['2', '4', '7', '3', '6', '1', '5'])
+        self.assertEqual(self.client.get('/resource/list/', data={'cursor': 'x'}).status_code, 404)
+
+    def testEstimatedCount(self):
+        response = self.client.get('/resource/list/', data={'page_size': 3})
+        self.assertEqual((response.data['count'], response.data['count_exact']), (7, True))
+
+        with mock.patch.object(KeysetPagination, 'exact_count_threshold', 0):
+            response = self.client.get('/resource/list/', data={'page_size': 3, 'page': 2, 'ordering': 'external_id'})
+            self.assertFalse(response.data['count_exact'])
+            self.assertEqual([resource['external_id'] for resource in response.data['results']], ['4', '5', '6'])
+            self.assertIsNotNone(response.data['next'])
+            response = self.client.get(response.data['next'])
+            self.assertEqual([resource['external_id'] for resource in response.data['results']], ['7'])
+            self.assertIsNone(response.data['next'])
+
+
+class ResourceValuesSerializerTest(TestCase):
+
+    def testParity(self):
+        plain = Resource.objects.create(name='Plain', external_id='1', cost=1.5, amount=3, storage_place='A1')
+        delivered = Resource.objects.create(name='Delivered', external_id='2', cost=0, amount_limit=0)
+        Resources.make_delivery(delivered.id, provider_name='Steel Works', cost=12.345, amount=7, comment='first',
+                                time_stamp=date(2021, 3, 1))
+        Resource.objects.filter(id=plain.id).update(reserved=1.25)
+
+        queryset = Resources.list()
+        self.assertEqual(
+            JSONRenderer().render(ResourceValuesSerializer.render(ResourceValuesSerializer.project(queryset))),
+            JSONRenderer().render(ResourceSerializer(queryset, many=True).data)
+        )
+
+
+class StockTest(TestCase):
+
+    def setUp(self):
+        self.first = Resource.objects.create(name='Resource 1', external_id='1', cost=1, amount=10)
+        self.second = Resource.objects.create(name='Resource 2', external_id='2', cost=1, amount=1)
+
+    def testChange(self):
+        negative = Stock.change_resources({self.first.id: -2.5, self.second.id: -3},
+                                          StockMovement.MovementReason.MANUAL)
+        self.first.refresh_from_db()
+        self.second.refresh_from_db()
+        self.assertEqual(float(self.first.amount), 7.5)
+        self.assertEqual(float(self.second.amount), -2)
+        self.assertEqual(list(negative), [self.second.id])
+
+    def testInsufficientStock(self):
+        with self.assertRaises(Stock.InsufficientStock):
+            Stock.change_resources({self.first.id: -2, self.second.id: -3}, StockMovement.MovementReason.MANUAL,
+                                   allow_negative=False)
+        self.first.refresh_from_db()
+        self.assertEqual(float(self.first.amount), 10)
+
+    def testLedger(self):
+        Resources.make_delivery(self.first, provider_name='Provider', cost=1, amount=5, user='system')
+        Resources.set_amount(self.first, 12, user='system')
+        self.assertEqual(
+            [(movement.reason, float(movement.delta)) for movement in
+             StockMovement.objects.filter(resource=self.first).order_by('id')],
+            [(StockMovement.MovementReason.DELIVERY, 5), (StockMovement.MovementReason.MANUAL, -3)]
+        )
+
+    def testBalanceAt(self):
+        before = timezone.now()
+        Stock.change_resources({self.first.id: 5}, StockMovement.MovementReason.MANUAL)
+        self.assertEqual(float(Stock.balance_at(Resource, [self.first.id], before)[self.first.id]), 10)
+
+        Stock.snapshot(timezone.now())
+        middle = timezone.now()
+        Stock.change_resources({self.first.id: -3}, StockMovement.MovementReason.MANUAL)
+        balances = Stock.balance_at(Resource, [self.first.id, self.second.id], middle)
+        self.assertEqual(float(balances[self.first.id]), 15)
+        self.assertEqual(float(balances[self.second.id]), 1)
+        self.assertEqual(float(Stock.balance_at(Resource, [self.first.id], timezone.now())[self.first.id]), 12)
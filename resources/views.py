@@ -1,7 +1,6 @@
-from asgiref.sync import async_to_sync
 from django.http import Http404
 from rest_framework import status
-from rest_framework.filters import SearchFilter, OrderingFilter
+from rest_framework.filters import OrderingFilter
 from rest_framework.generics import RetrieveAPIView, CreateAPIView, UpdateAPIView, ListAPIView
 
 from logging import getLogger
@@ -10,24 +9,27 @@ from rest_framework.response import Response
 from rest_framework.views import APIView
 
 from authentication.models import Operator
-from cella.serializer import FileSerializer
+from cella.serializer import FileSerializer, JobSerializer
 
-from resources.models import Resource
+from resources.models import Resource, ResourceDelivery, ResourceProvider
 from resources.serializer import ResourceSerializer, \
-    ResourceShortSerializer, ResourceProviderSerializer, ResourceDeliverySerializer
+    ResourceShortSerializer, ResourceProviderSerializer, ResourceDeliverySerializer, ResourceValuesSerializer
 from resources.service import Resources
 from utils.exception import ParameterExceptions, NoParameterSpecified, FileException, CreationError, UpdateError, \
     QueryError, WrongParameterType
-from utils.pagination import StandardResultsSetPagination
+from utils.filters import TrigramSearchFilter
+from utils.pagination import KeysetPagination
+from utils.view import CachedListMixin, ConditionalGetMixin, ValuesListMixin
 from authentication.permissions import OfficeWorkerPermission, StorageWorkerPermission, DefaultPermission
 from rest_framework.permissions import IsAuthenticated
 
 logger = getLogger(__name__)
 
 
-class ResourceDetailView(RetrieveAPIView):
+class ResourceDetailView(ConditionalGetMixin, RetrieveAPIView):
     serializer_class = ResourceSerializer
     permission_classes = [DefaultPermission]
+    etag_apps = ['resources']
 
     def get_object(self):
         r_id = self.kwargs['r_id']
@@ -85,11 +87,14 @@ class ExpiredResourceCount(APIView):
         return Response(data={'count': Resources.expired_count()}, status=status.HTTP_200_OK)
 
 
-class ResourceListView(ListAPIView):
+class ResourceListView(ConditionalGetMixin, CachedListMixin, ValuesListMixin, ListAPIView):
     serializer_class = ResourceSerializer
+    values_serializer_class = ResourceValuesSerializer
     permission_classes = [StorageWorkerPermission]
-    pagination_class = StandardResultsSetPagination
-    filter_backends = [SearchFilter, OrderingFilter]
+    cache_models = [Resource, ResourceProvider, ResourceDelivery]
+    etag_apps = ['resources']
+    pagination_class = KeysetPagination
+    filter_backends = [OrderingFilter, TrigramSearchFilter]
     search_fields = ['name', 'id', 'provider__name', 'external_id']
     ordering = '-created_at'
     ordering_fields = [
@@ -112,9 +117,10 @@ class ResourceListView(ListAPIView):
             raise QueryError()
 
 
-class ResourceShortListView(ListAPIView):
+class ResourceShortListView(ConditionalGetMixin, ListAPIView):
     serializer_class = ResourceShortSerializer
     permission_classes = [DefaultPermission]
+    etag_apps = ['resources']
 
     def get_queryset(self):
         try:
@@ -124,9 +130,11 @@ class ResourceShortListView(ListAPIView):
             raise QueryError()
 
 
-class ProviderListView(ListAPIView):
+class ProviderListView(ConditionalGetMixin, CachedListMixin, ListAPIView):
     serializer_class = ResourceProviderSerializer
     permission_classes = [DefaultPermission]
+    cache_models = [ResourceProvider]
+    etag_apps = ['resources']
 
     def get_queryset(self):
         try:
@@ -149,12 +157,11 @@ class ResourceExelUploadView(CreateAPIView):
         instance = self.get_instance()
         try:
             operator = Operator.objects.get_or_create_operator(request.user)
-            print(operator)
-            creation = async_to_sync(Resources.create_from_excel)
-            creation(file_instance_id=instance.id, operator_id=operator.id)
+            job = Resources.create_from_excel(file_instance_id=instance.id, operator_id=operator.id)
         except Exception as e:
             logger.warning(f"File error. File: {response}| {self.__class__.__name__}", exc_info=True)
             raise FileException()
+        response.data['job'] = JobSerializer(job).data
         return response
 
     def perform_create(self, serializer):
@@ -0,0 +1,12 @@
+from django_filters import rest_framework as filters
+
+from .models import Specification
+
+
+class SpecificationFilter(filters.FilterSet):
+    available_to_assemble_min = filters.NumberFilter(field_name='available_to_assemble', lookup_expr='gte')
+    available_to_assemble_max = filters.NumberFilter(field_name='available_to_assemble', lookup_expr='lte')
+
+    class Meta:
+        model = Specification
+        fields = ['verified']
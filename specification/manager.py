@@ -0,0 +1,31 @@
+from django.db.models import Manager, OuterRef, Subquery, Sum, Min, F, Value, DecimalField, IntegerField
+from django.db.models.functions import Coalesce, Floor, Greatest, Cast
+
+from utils.db.query import SignalingQuerySet
+
+
+class SpecificationQuerySet(SignalingQuerySet):
+
+    def update_prime_cost(self):
+        from .models import SpecificationResource
+
+        cost_query = SpecificationResource.objects.filter(specification=OuterRef('pk')).values(
+            'specification_id').annotate(
+            total_cost=Sum(F('resource__cost') * F('amount'))).values('total_cost')
+
+        return self.update(prime_cost=Coalesce(
+            Subquery(cost_query, output_field=DecimalField(max_digits=12, decimal_places=2)), Value(0)))
+
+    def with_available_to_assemble(self):
+        from .models import SpecificationResource
+
+        available_query = SpecificationResource.objects.filter(specification=OuterRef('pk'), amount__gt=0).values(
+            'specification_id').annotate(
+            available=Min(Cast(Floor((F('resource__amount') - F('resource__reserved')) / F('amount')), IntegerField()))).values('available')
+
+        return self.annotate(available_to_assemble=Greatest(
+            Coalesce(Subquery(available_query, output_field=IntegerField()), Value(0)), Value(0)))
+
+
+class SpecificationManager(Manager.from_queryset(SpecificationQuerySet)):
+    pass
@@ -0,0 +1,32 @@
+# Generated by Django 3.1.5 on 2026-10-17 23:31
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery, Sum, F, Value
+from django.db.models.functions import Coalesce
+
+
+def fill_prime_cost(apps, schema_editor):
+    Specification = apps.get_model('specification', 'Specification')
+    SpecificationResource = apps.get_model('specification', 'SpecificationResource')
+
+    cost_query = SpecificationResource.objects.filter(specification=OuterRef('pk')).values(
+        'specification_id').annotate(
+        total_cost=Sum(F('resource__cost') * F('amount'))).values('total_cost')
+    Specification.objects.update(prime_cost=Coalesce(
+        Subquery(cost_query, output_field=models.DecimalField(max_digits=12, decimal_places=2)), Value(0)))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('specification', '0002_auto_20210319_2122'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='specification',
+            name='prime_cost',
+            field=models.DecimalField(db_index=True, decimal_places=2, default=0, max_digits=12),
+        ),
+        migrations.RunPython(fill_prime_cost, migrations.RunPython.noop),
+    ]
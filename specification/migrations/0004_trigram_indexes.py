@@ -0,0 +1,27 @@
+# Generated by Django 3.1.5 on 2026-10-17 23:34
+
+import django.contrib.postgres.indexes
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('resources', '0005_trigram_indexes'),
+        ('specification', '0003_specification_prime_cost'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='specification',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['name'], name='specification_name_trgm', opclasses=['gin_trgm_ops']),
+        ),
+        migrations.AddIndex(
+            model_name='specification',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['product_id'], name='specification_product_id_trgm', opclasses=['gin_trgm_ops']),
+        ),
+        migrations.AddIndex(
+            model_name='specificationcategory',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['name'], name='specificationcategory_trgm', opclasses=['gin_trgm_ops']),
+        ),
+    ]
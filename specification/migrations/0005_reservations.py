@@ -0,0 +1,18 @@
+# Generated by Django 3.1.5 on 2026-10-17 23:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('specification', '0004_trigram_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='specification',
+            name='reserved',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+    ]
@@ -1,7 +1,10 @@
+from django.contrib.postgres.indexes import GinIndex
 from django.db import models
 
 from cella.models import Operator
 from resources.models import Resource
+from utils.db.query import SignalingQuerySet
+from .manager import SpecificationManager
 
 
 class SpecificationCategory(models.Model):
@@ -9,6 +12,13 @@ class SpecificationCategory(models.Model):
     coefficient = models.DecimalField(max_digits=12, decimal_places=2, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    objects = SignalingQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            GinIndex(fields=['name'], name='specificationcategory_trgm', opclasses=['gin_trgm_ops'])
+        ]
+
     def __str__(self):
         return self.name
 
@@ -24,11 +34,25 @@ class Specification(models.Model):
     is_active = models.BooleanField(default=True)
     price = models.DecimalField(max_digits=12, decimal_places=2, default=.0)
     amount = models.IntegerField(default=0)
+    reserved = models.IntegerField(default=0, editable=False)
     coefficient = models.DecimalField(max_digits=12, decimal_places=2, default=None, null=True)
     verified = models.BooleanField(default=True)
     created_at = models.DateTimeField(auto_now_add=True)
     storage_place = models.CharField(max_length=100, null=True, blank=True)
     amount_accuracy = models.CharField(max_length=1, default='X')
+    prime_cost = models.DecimalField(max_digits=12, decimal_places=2, default=0, db_index=True)
+
+    objects = SpecificationManager()
+
+    class Meta:
+        indexes = [
+            GinIndex(fields=['name'], name='specification_name_trgm', opclasses=['gin_trgm_ops']),
+            GinIndex(fields=['product_id'], name='specification_product_id_trgm', opclasses=['gin_trgm_ops'])
+        ]
+
+    @property
+    def available(self):
+        return self.amount - self.reserved
 
     def __str__(self):
         return f"{self.name}"
@@ -39,5 +63,7 @@ class SpecificationResource(models.Model):
     specification = models.ForeignKey(Specification, on_delete=models.CASCADE, null=True, related_name='res_specs')
     amount = models.DecimalField(max_digits=12, decimal_places=2)
 
+    objects = SignalingQuerySet.as_manager()
+
     def __str__(self):
         return f"{self.resource} - {self.specification}"
@@ -1,7 +1,9 @@
+from django.db.models import F
 from rest_framework import serializers
 from resources.serializer import ResourceShortSerializer
 from specification.models import SpecificationCategory, Specification
 from specification.service import Specifications
+from utils.serializer import ValuesSerializer
 
 
 class SpecificationCategorySerializer(serializers.ModelSerializer):
@@ -60,6 +62,7 @@ class SpecificationDetailSerializer(serializers.ModelSerializer):
     verified = serializers.BooleanField(read_only=True, allow_null=True)
     amount = serializers.IntegerField(allow_null=True, required=False, default=0, min_value=0)
     available_to_assemble = serializers.IntegerField(read_only=True, allow_null=True)
+    available = serializers.IntegerField(read_only=True)
     prime_cost = serializers.DecimalField(max_digits=12, decimal_places=2, default=0, allow_null=True, read_only=True)
     storage_place = serializers.CharField(allow_null=True, required=False, allow_blank=True)
     amount_accuracy = serializers.CharField(max_length=1, allow_null=True, allow_blank=True, default='')
@@ -102,12 +105,19 @@ class SpecificationListSerializer(serializers.ModelSerializer):
     coefficient = serializers.DecimalField(max_digits=8, decimal_places=2)
     verified = serializers.BooleanField(allow_null=True, read_only=True)
     amount = serializers.IntegerField(allow_null=True)
+    available_to_assemble = serializers.IntegerField(read_only=True)
+    available = serializers.IntegerField(read_only=True)
 
     class Meta:
         model = Specification
         fields = '__all__'
 
 
+class SpecificationListValuesSerializer(ValuesSerializer):
+    serializer_class = SpecificationListSerializer
+    expressions = {'available': F('amount') - F('reserved')}
+
+
 class SpecificationEditSerializer(serializers.ModelSerializer):
     name = serializers.CharField(required=False, allow_null=True)
     product_id = serializers.CharField(required=False, allow_null=True)
@@ -1,24 +1,21 @@
+from decimal import Decimal
 from typing import List, Dict
 from xml.dom import minidom
 
-import aiohttp
-import asyncio
-
-from asgiref.sync import async_to_sync, sync_to_async
 from django.core.exceptions import ObjectDoesNotExist
 from django.db import IntegrityError, transaction, DatabaseError
 import logging
 
-from django.db.models import OuterRef, Subquery, Exists, Sum, Min, IntegerField, F, Count, Q
+from django.db.models import Exists, Min, IntegerField
 from django.db.models.functions import Cast
 
 from authentication.models import Operator
-from cella.models import File
-from resources.models import Resource
-from resources.service import Resources
+from cella.models import Job, OutboxMessage
+from cella.service import Jobs, Outbox, Counters
+from resources.models import Resource, StockMovement
+from resources.service import Resources, Stock
 from utils.function import resource_amounts
 from .models import Specification, SpecificationCategory, SpecificationResource
-from django.conf import settings
 
 logger = logging.getLogger(__name__)
 
@@ -58,6 +55,24 @@ class Specifications:
         else:
             return specification
 
+    @classmethod
+    def resolve_products(cls, product_ids):
+        """
+        Maps product ids to their active specifications with one query and creates
+        placeholder specifications for unknown products in one bulk insert.
+        """
+        product_ids = list(dict.fromkeys(product_ids))
+        specifications = {specification.product_id: specification for specification in
+                          Specification.objects.filter(product_id__in=product_ids, is_active=True)}
+        missing = [Specification(product_id=product_id, is_active=True) for product_id in product_ids
+                   if product_id not in specifications]
+        if len(missing) != 0:
+            logger.info(f"Created placeholder specifications for products {[s.product_id for s in missing]} | "
+                        f"{cls.__name__}")
+            for specification in Specification.objects.bulk_create(missing):
+                specifications[specification.product_id] = specification
+        return specifications
+
     @classmethod
     def shortlist(cls):
         return Specification.objects.order_by('name').all()
@@ -75,8 +90,7 @@ class Specifications:
 
     @classmethod
     def verify_price_count(cls):
-        count = Specification.objects.aggregate(count=Count('id', filter=Q(verified=False)))
-        return count['count']
+        return Counters.read()['specifications_unverified']
 
     @classmethod
     def set_coefficient(cls, specification, coefficient: float, user=None, save=True):
@@ -100,22 +114,24 @@ class Specifications:
             logger.warning(f"specification price < 0 for specification '{specification.id}' | {cls.__name__}")
 
         if save:
-            specification.save()
+            with transaction.atomic(), Counters.track(Specification, [specification.id]):
+                specification.save()
+                if send:
+                    cls.notify_new_price(specification)
 
-        if send:
-            s_p = async_to_sync(cls.send_price)
-            s_p(specification.product_id, price)
         return price
 
     @classmethod
     def set_amount(cls, specification, amount: float, user=None, save=True):
         specification = cls.get(specification)
-        specification.amount = amount
-        if amount < 0:
-            logger.warning(f"specification amount < 0 for specification '{specification.id}' | {cls.__name__}")
 
         if save:
-            specification.save()
+            Stock.set_specifications({specification.id: amount}, StockMovement.MovementReason.MANUAL)
+            specification.refresh_from_db(fields=['amount'])
+        else:
+            specification.amount = amount
+            if amount < 0:
+                logger.warning(f"specification amount < 0 for specification '{specification.id}' | {cls.__name__}")
 
         return amount
 
@@ -139,20 +155,15 @@ class Specifications:
 
     @classmethod
     def detail(cls, specification):
+        specification_id = specification.id if isinstance(specification, Specification) else specification
         try:
-            specification = cls.get(specification, prefetched=['res_specs', 'res_specs__resource'])
-            specification_resources = SpecificationResource.objects.select_related('resource').filter(
-                specification=specification)
-            reses = []
-            prime_cost = 0
-
-            for spec_res in specification_resources:
-                reses.append({"resource": spec_res.resource, "amount": spec_res.amount})
-                prime_cost += spec_res.resource.cost * spec_res.amount
-
-            specification.resources = reses
-            specification.prime_cost = prime_cost
-            specification.available_to_assemble = cls.assemble_info(specification)
+            specification = Specification.objects.with_available_to_assemble().select_related('category').get(
+                id=specification_id)
+            specification.resources = [
+                {"resource": spec_res.resource, "amount": spec_res.amount}
+                for spec_res in SpecificationResource.objects.select_related('resource').filter(
+                    specification=specification)
+            ]
         except DatabaseError as ex:
             logger.error(f"Error while detail. | {cls.__name__}", exc_info=True)
             raise cls.QueryError()
@@ -161,12 +172,7 @@ class Specifications:
     @classmethod
     def list(cls):
         try:
-            resources_query = Resource.objects.filter(id=OuterRef('resource_id'))
-            query_res_spec = SpecificationResource.objects.filter(specification=OuterRef('pk')).values(
-                'specification_id').annotate(
-                total_cost=Sum(Subquery(resources_query.values('cost')[:1]) * F('amount')))
-            specifications = Specification.objects.select_related('category').annotate(
-                prime_cost=Subquery(query_res_spec.values('total_cost')))
+            specifications = Specification.objects.with_available_to_assemble().select_related('category')
         except DatabaseError:
             logger.warning(f"list query error. | {cls.__name__}", exc_info=True)
             raise cls.QueryError()
@@ -186,7 +192,7 @@ class Specifications:
         resources = []
         for res_spec in specification.res_specs.all():
             resource = res_spec.resource
-            residue = float(resource.amount) - float(res_spec.amount) * float(amount)
+            residue = float(resource.available) - float(res_spec.amount) * float(amount)
             resources.append({'id': resource.id, 'amount': residue})
 
         return resources
@@ -238,7 +244,7 @@ class Specifications:
                                                              False)
                     actions.append(coefficient_action)
 
-                amount_action = cls.set_amount(specification, amount, operator, False)
+                amount_action = cls.set_amount(specification, amount, operator)
                 actions.append(amount_action)
 
                 price_action = cls.set_price(specification, price, operator, False)
@@ -254,6 +260,8 @@ class Specifications:
                         )
 
                 specification.save()
+                cls.update_prime_cost(specification)
+                cls.notify_new_prime_cost(specification)
 
         except DatabaseError as ex:
             logger.warning(f"Create error specification_name={name}, product_id={product_id}, "
@@ -314,7 +322,7 @@ class Specifications:
                     actions.append(coefficient_action)
 
                 if storage_amount is not None:
-                    _, amount_action = cls.set_amount(specification, storage_amount, operator, False)
+                    amount_action = cls.set_amount(specification, storage_amount, operator)
                     actions.append(amount_action)
                 # -----------
 
@@ -341,6 +349,9 @@ class Specifications:
                         )
                         _resources.append({'resources_create': res, 'amount': resource['amount']})
 
+                cls.update_prime_cost(specification)
+                cls.notify_new_prime_cost(specification)
+
                 try:
                     res_specs = SpecificationResource.objects.select_related('resource').filter(
                         specification=specification)
@@ -357,13 +368,24 @@ class Specifications:
 
         return specification
 
+    @classmethod
+    def update_prime_cost(cls, specification):
+        specification = cls.get(specification)
+        Specification.objects.filter(id=specification.id).update_prime_cost()
+        specification.refresh_from_db(fields=['prime_cost'])
+        return specification.prime_cost
+
     @classmethod
     def notify_new_price(cls, specification):
-        pass
+        specification = cls.get(specification)
+        Outbox.push(OutboxMessage.OutboxEndpoint.PRICE,
+                    {"ID": specification.product_id, "price": float(specification.price)},
+                    key=f"price:{specification.product_id}")
 
     @classmethod
     def notify_new_prime_cost(cls, specification):
-        pass
+        specification = cls.get(specification)
+        Resources.notify_new_prime_cost(Specification.objects.filter(id=specification.id))
 
     @classmethod
     def notify_new_amount(cls, amount):
@@ -371,105 +393,73 @@ class Specifications:
 
     @classmethod
     def assemble_info(cls, specification):
-        specification = cls.get(specification, prefetched=['res_specs', 'res_specs__resource'])
-
-        min_amount = None
+        specification_id = specification.id if isinstance(specification, Specification) else specification
         try:
-            for res_spec in specification.res_specs.all():
-                if min_amount is None:
-                    min_amount = int(res_spec.resource.amount / res_spec.amount)
-                min_amount = min(min_amount, int(res_spec.resource.amount / res_spec.amount))
-        except ZeroDivisionError:
-            logger.warning(f"Zero division error while finding assemble_info.  | {cls.__name__}", exc_info=True)
-        if min_amount is None:
-            return 0
-        return min_amount
+            return Specification.objects.filter(id=specification_id).with_available_to_assemble().values_list(
+                'available_to_assemble', flat=True).get()
+        except Specification.DoesNotExist:
+            logger.warning(f"Specification does not exist. Id: '{specification_id}' | {cls.__name__}")
+            raise cls.DoesNotExist()
 
     @classmethod
     def delete(cls, specification, user):
         specification = cls.get(specification)
-        specification.delete()
+        cls.bulk_delete([specification.id], user)
 
     @classmethod
     def bulk_delete(cls, ids, user):
-        Specification.objects.filter(id__in=ids).delete()
+        with Counters.track(Specification, ids):
+            Specification.objects.filter(id__in=ids).delete()
 
     @classmethod
     def build_set(cls, specification, amount, from_resources=False, user=None):
         try:
             with transaction.atomic():
-                if not isinstance(specification, Specification):
-                    if from_resources:
-                        specification = Specification.objects.prefetch_related(
-                            'res_specs',
-                            'res_specs__resource'
-                        ).get(id=specification)
-                    else:
-                        specification = Specification.objects.get(id=specification)
-
-                resources = []
-                actions = []
+                specification_id = specification.id if isinstance(specification, Specification) else specification
+                Stock.lock(Specification, [specification_id])
 
-                operator = Operator.objects.get_or_create_operator(user)
                 if from_resources:
-                    for res_spec in specification.res_specs.all():
-                        resource = res_spec.resource
-
-                        if resource.amount < float(res_spec.amount) * float(amount):
-                            raise cls.CantBuildSet()
-
-                        else:
-                            action = Resources.change_amount(resource, -float(res_spec.amount) * float(amount),
-                                                             operator,
-                                                             False)
-                            resources.append(resource)
-                            actions.append(action)
-
-                    Resource.objects.bulk_update(resources, fields=['amount'])
-
-                    value = 'from_resources=True'
-                else:
-                    value = 'from_resources=False'
-
-                specification.amount += amount
-                specification.save()
+                    deltas = {}
+                    for resource_id, res_amount in SpecificationResource.objects.filter(
+                            specification_id=specification_id).values_list('resource_id', 'amount'):
+                        deltas[resource_id] = deltas.get(resource_id, 0) - res_amount * Decimal(str(amount))
+                    Stock.change_resources(deltas, StockMovement.MovementReason.BUILD, allow_negative=False)
+
+                Stock.change_specifications({specification_id: amount}, StockMovement.MovementReason.BUILD)
+                if isinstance(specification, Specification):
+                    specification.refresh_from_db(fields=['amount'])
+        except Stock.InsufficientStock:
+            raise cls.CantBuildSet()
         except DatabaseError as ex:
             logger.error(f"Error while building set. | {cls.__name__}", exc_info=True)
             raise cls.CantBuildSet()
 
     @classmethod
-    async def send_price(cls, product_id, price):
-        return asyncio.create_task(send_price(product_id, price))
-
-    @classmethod
-    async def create_from_xml(cls, file_instance_id, operator_id):
-        asyncio.create_task(upload_specifications(file_instance_id, operator_id))
+    def create_from_xml(cls, file_instance_id, operator_id):
+        return Jobs.enqueue(Job.JobKind.SPECIFICATIONS_XML, file_instance_id, operator_id)
 
 
-bitrix_url = settings.BITRIX_URL + "ajax/tsenaobnov.php"
+SPECIFICATION_CREATE_BATCH_SIZE = 1000
 
 
-async def send_price(product_id, price):
-    async with aiohttp.ClientSession(auth=aiohttp.BasicAuth(**settings.BITRIX_AUF_CONF)) as session:
-        print({"ID": product_id, "price": price})
-        async with session.post(bitrix_url, json={"ID": product_id, "price": price}, verify_ssl=False) as response:
-            print(response)
+def import_specifications_from_xml(file, progress):
+    tree = minidom.parse(file.file)
+    offers = tree.getElementsByTagName('offer')
+    progress.set_total(len(offers))
 
-
-async def upload_specifications(file_instance_id, operator_id=None):
-    try:
-        file = await sync_to_async(File.objects.get)(id=file_instance_id)
-        tree = minidom.parse(file.file)
-        offers = tree.getElementsByTagName('offer')
-        specifications = []
-        for offer in offers:
+    specifications = []
+    for row, offer in enumerate(offers, start=1):
+        try:
             obj = dict(
                 name=str(offer.getElementsByTagName('shop-sku')[0].childNodes[0].nodeValue),
                 product_id=str(offer.getElementsByTagName('market-sku')[0].childNodes[0].nodeValue),
                 price=float(offer.getElementsByTagName('price')[0].childNodes[0].nodeValue)
             )
-            specification = Specification(**obj)
-            specifications.append(specification)
-        await sync_to_async(Specification.objects.bulk_create)(specifications)
-    except Exception:
-        logger.error("file read exception", exc_info=True)
+        except (IndexError, ValueError) as ex:
+            progress.error(row, f"Wrong offer: {ex!r}")
+            continue
+        specifications.append(Specification(**obj))
+
+    for start in range(0, len(specifications), SPECIFICATION_CREATE_BATCH_SIZE):
+        batch = Specification.objects.bulk_create(specifications[start:start + SPECIFICATION_CREATE_BATCH_SIZE])
+        progress.advance(len(batch), created=len(batch))
@@ -1,3 +1,96 @@
 from django.test import TestCase
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APITestCase
 
-# Create your tests here.
+from resources.models import Resource
+from resources.service import Resources
+from .models import Specification
+from .serializer import SpecificationListSerializer, SpecificationListValuesSerializer
+from .service import Specifications
+from utils.test.mixins import ResponseTestCaseMixin
+
+
+class SpecificationPrimeCostTest(TestCase):
+
+    def setUp(self):
+        self.first = Resource.objects.create(name='Resource 1', external_id='1', cost=10, amount=100)
+        self.second = Resource.objects.create(name='Resource 2', external_id='2', cost=2.5, amount=100)
+        self.specification = Specifications.create(
+            name='Specification 1',
+            product_id='100',
+            resources_create=[{'id': self.first.id, 'amount': 2}, {'id': self.second.id, 'amount': 4}],
+            user='system'
+        )
+
+    def assertPrimeCost(self, value):
+        self.assertEqual(float(Specification.objects.get(id=self.specification.id).prime_cost), value)
+
+    def testCreate(self):
+        self.assertEqual(float(self.specification.prime_cost), 30)
+        self.assertPrimeCost(30)
+
+    def testResourceCostChange(self):
+        Resources.set_cost(self.first, 20, user='system')
+        self.assertPrimeCost(50)
+
+    def testBomEdit(self):
+        Specifications.edit(self.specification, resource_to_delete=[self.second.id], user='system')
+        self.assertPrimeCost(20)
+
+        Specifications.edit(self.specification, resource_to_add=[{'id': self.second.id, 'amount': 1}],
+                            user='system')
+        self.assertPrimeCost(22.5)
+
+    def testResourceDelete(self):
+        Resources.bulk_delete([self.first.id], user='system')
+        self.assertPrimeCost(10)
+
+
+class SpecificationAssembleTest(ResponseTestCaseMixin, APITestCase):
+
+    def setUp(self):
+        first = Resource.objects.create(name='Resource 1', external_id='1', cost=1, amount=10)
+        second = Resource.objects.create(name='Resource 2', external_id='2', cost=1, amount=7.5)
+        self.wide = Specifications.create(
+            name='Wide',
+            product_id='100',
+            resources_create=[{'id': first.id, 'amount': 2}, {'id': second.id, 'amount': 2.5}],
+            user='system'
+        )
+        self.narrow = Specifications.create(
+            name='Narrow',
+            product_id='200',
+            resources_create=[{'id': first.id, 'amount': 4}],
+            user='system'
+        )
+
+    def testAssembleInfo(self):
+        self.assertEqual(Specifications.assemble_info(self.wide.id), 3)
+        self.assertEqual(Specifications.assemble_info(self.narrow), 2)
+
+    def testListColumn(self):
+        response = self.client.get('/specification/list/', data={'ordering': 'available_to_assemble'})
+        self.assertResponseSuccess(response, "{status_code}, {response_data}")
+        self.assertEqual([(s['name'], s['available_to_assemble']) for s in response.data['results']],
+                         [('Narrow', 2), ('Wide', 3)])
+
+        response = self.client.get('/specification/list/', data={'available_to_assemble_min': 3})
+        self.assertEqual([s['name'] for s in response.data['results']], ['Wide'])
+
+
+class SpecificationValuesSerializerTest(TestCase):
+
+    def testParity(self):
+        resource = Resource.objects.create(name='Resource 1', external_id='1', cost=2.5, amount=10)
+        Specifications.create(name='Categorized', product_id='100', price=10, coefficient=1.5, category_name='Chairs',
+                              resources_create=[{'id': resource.id, 'amount': 3}], amount=2, user='system')
+        Specifications.create(name=None, product_id='200', resources_create=[{'id': resource.id, 'amount': 1}],
+                              user='system')
+        Specification.objects.filter(product_id='100').update(reserved=1, verified=False)
+
+        queryset = Specifications.list()
+        self.assertEqual(
+            JSONRenderer().render(SpecificationListValuesSerializer.render(
+                SpecificationListValuesSerializer.project(queryset))),
+            JSONRenderer().render(SpecificationListSerializer(queryset, many=True).data)
+        )
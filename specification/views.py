@@ -1,8 +1,7 @@
-from asgiref.sync import async_to_sync
 from django.http import Http404
 from rest_framework import status
 from django_filters.rest_framework import DjangoFilterBackend
-from rest_framework.filters import SearchFilter, OrderingFilter
+from rest_framework.filters import OrderingFilter
 from rest_framework.generics import ListAPIView, RetrieveAPIView, CreateAPIView, RetrieveUpdateAPIView
 from logging import getLogger
 
@@ -11,25 +10,31 @@ from rest_framework.views import APIView
 from rest_framework.permissions import IsAuthenticated
 
 from authentication.models import Operator
-from cella.serializer import FileSerializer
+from cella.serializer import FileSerializer, JobSerializer
 from resources.models import Resource
 from resources.service import Resources
-from specification.models import Specification
+from specification.filters import SpecificationFilter
+from specification.models import Specification, SpecificationCategory, SpecificationResource
 from specification.serializer import SpecificationCategorySerializer, SpecificationDetailSerializer, \
-    SpecificationListSerializer, SpecificationEditSerializer, SpecificationShortSerializer
+    SpecificationListSerializer, SpecificationEditSerializer, SpecificationShortSerializer, \
+    SpecificationListValuesSerializer
 from specification.service import Specifications
 from utils.exception import NoParameterSpecified, ParameterExceptions, QueryError, UpdateError, AssembleError, \
     WrongParameterType, FileException
-from utils.pagination import StandardResultsSetPagination
+from utils.filters import TrigramSearchFilter
+from utils.pagination import KeysetPagination
+from utils.view import CachedListMixin, ConditionalGetMixin, ValuesListMixin
 from authentication.permissions import OfficeWorkerPermission, StorageWorkerPermission, DefaultPermission, \
     AdminPermission
 
 logger = getLogger(__name__)
 
 
-class SpecificationCategoryListView(ListAPIView):
+class SpecificationCategoryListView(ConditionalGetMixin, CachedListMixin, ListAPIView):
     serializer_class = SpecificationCategorySerializer
     permission_classes = [DefaultPermission]
+    cache_models = [SpecificationCategory]
+    etag_apps = ['specification']
 
     def get_queryset(self):
         try:
@@ -38,9 +43,10 @@ class SpecificationCategoryListView(ListAPIView):
             logger.warning(f"category list error. | {self.__class__.__name__}", exc_info=True)
 
 
-class SpecificationDetailView(RetrieveAPIView):
+class SpecificationDetailView(ConditionalGetMixin, RetrieveAPIView):
     serializer_class = SpecificationDetailSerializer
     permission_classes = [DefaultPermission]
+    etag_apps = ['specification', 'resources']
 
     def get_object(self):
         s_id = self.kwargs['s_id']
@@ -54,13 +60,16 @@ class SpecificationDetailView(RetrieveAPIView):
         return specification
 
 
-class SpecificationListView(ListAPIView):
+class SpecificationListView(ConditionalGetMixin, CachedListMixin, ValuesListMixin, ListAPIView):
     serializer_class = SpecificationListSerializer
+    values_serializer_class = SpecificationListValuesSerializer
     permission_classes = [DefaultPermission]
-    pagination_class = StandardResultsSetPagination
-    filter_backends = [SearchFilter, OrderingFilter, DjangoFilterBackend]
-    filterset_fields = ['verified']
-    search_fields = ['name', 'id', 'category__name']
+    cache_models = [Specification, SpecificationCategory, SpecificationResource, Resource]
+    etag_apps = ['specification', 'resources']
+    pagination_class = KeysetPagination
+    filter_backends = [OrderingFilter, TrigramSearchFilter, DjangoFilterBackend]
+    filterset_class = SpecificationFilter
+    search_fields = ['name', 'id', 'product_id', 'category__name']
     ordering = '-created_at'
     ordering_fields = [
         'name',
@@ -69,7 +78,8 @@ class SpecificationListView(ListAPIView):
         'price',
         'amount',
         'prime_cost',
-        'verified'
+        'verified',
+        'available_to_assemble'
     ]
 
     def get_queryset(self):
@@ -267,8 +277,9 @@ class SpecificationCreateCategoryView(CreateAPIView):
     serializer_class = SpecificationCategorySerializer
 
 
-class SpecificationListShortView(ListAPIView):
+class SpecificationListShortView(ConditionalGetMixin, ListAPIView):
     serializer_class = SpecificationShortSerializer
+    etag_apps = ['specification']
 
     def get_queryset(self):
         return Specifications.shortlist()
@@ -293,14 +304,13 @@ class SpecificationXMLUploadView(CreateAPIView):
     def post(self, request, *args, **kwargs):
         response = super(SpecificationXMLUploadView, self).post(request, *args, **kwargs)
         instance = self.get_instance()
-        print("deedededededededelzskrfnkbjdnafzskv bksdb xfkved")
         try:
             operator = Operator.objects.get_or_create_operator(request.user)
-            creation = async_to_sync(Specifications.create_from_xml)
-            creation(file_instance_id=instance.id, operator_id=operator.id)
+            job = Specifications.create_from_xml(file_instance_id=instance.id, operator_id=operator.id)
         except Exception as e:
             logger.warning(f"File error. File: {response}| {self.__class__.__name__}", exc_info=True)
             raise FileException()
+        response.data['job'] = JobSerializer(job).data
         return response
 
     def perform_create(self, serializer):
@@ -0,0 +1,13 @@
+from django.db.models import CharField, Lookup
+
+
+@CharField.register_lookup
+class ILikeContains(Lookup):
+    """Substring match as a plain ``ILIKE``, which a gin_trgm_ops index can serve, unlike ``UPPER(...) LIKE``."""
+    lookup_name = 'ilike_contains'
+
+    def as_sql(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        rhs, rhs_params = self.process_rhs(compiler, connection)
+        rhs_params = [f"%{connection.ops.prep_for_like_query(param)}%" for param in rhs_params]
+        return f"{lhs} ILIKE {rhs}", lhs_params + rhs_params
@@ -1,5 +1,7 @@
 from django.db.models import QuerySet
 
+from .signals import bulk_changed
+
 
 class ObjectExisting:
 
@@ -18,3 +20,24 @@ class GetOrCreateQuery(QuerySet):
 
     def get_or_create(self, defaults=None, **kwargs):
         return ObjectExisting(*super(GetOrCreateQuery, self).get_or_create(defaults, **kwargs))
+
+
+class SignalingQuerySet(QuerySet):
+
+    def update(self, **kwargs):
+        rows = super(SignalingQuerySet, self).update(**kwargs)
+        bulk_changed.send(sender=self.model)
+        return rows
+
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = super(SignalingQuerySet, self).bulk_create(objs, *args, **kwargs)
+        if len(objs) != 0:
+            bulk_changed.send(sender=self.model)
+        return objs
+
+    def bulk_update(self, objs, *args, **kwargs):
+        objs = tuple(objs)
+        rows = super(SignalingQuerySet, self).bulk_update(objs, *args, **kwargs)
+        if len(objs) != 0:
+            bulk_changed.send(sender=self.model)
+        return rows
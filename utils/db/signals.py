@@ -0,0 +1,4 @@
+from django.dispatch import Signal
+
+# Sent with the model as sender after update, bulk_create and bulk_update, which bypass post_save.
+bulk_changed = Signal()
@@ -0,0 +1,41 @@
+import threading
+
+from django.db import DEFAULT_DB_ALIAS, transaction
+
+
+class CommitBatch:
+    """
+    Collects items during a transaction and hands them to `callback` once, after the transaction commits.
+    Outside a transaction the callback runs right away, as with transaction.on_commit.
+    """
+
+    def __init__(self, callback):
+        self.callback = callback
+        self._local = threading.local()
+
+    def add(self, *items, using=None):
+        if using is None:
+            using = DEFAULT_DB_ALIAS
+        connection = transaction.get_connection(using)
+        if not connection.in_atomic_block:
+            self.callback(set(items))
+            return
+
+        pending = self._pending()
+        if using not in pending or not self._registered(connection, pending[using][0]):
+            # First item of this transaction, or the callback was dropped with a rolled back one.
+            def flush():
+                self.callback(self._pending().pop(using)[1])
+
+            pending[using] = (flush, set())
+            transaction.on_commit(flush, using)
+        pending[using][1].update(items)
+
+    def _pending(self):
+        if not hasattr(self._local, 'pending'):
+            self._local.pending = {}
+        return self._local.pending
+
+    @staticmethod
+    def _registered(connection, flush):
+        return any(entry[1] is flush for entry in connection.run_on_commit)
@@ -0,0 +1,66 @@
+from django.contrib.postgres.search import TrigramSimilarity
+from django.db import connection
+from django.db.models import Q
+from django.db.models.constants import LOOKUP_SEP
+from django.db.models.functions import Greatest
+from rest_framework.filters import SearchFilter, OrderingFilter
+
+from utils.db.lookups import ILikeContains
+
+
+class TrigramSearchFilter(SearchFilter):
+    """
+    Search backend served by gin_trgm_ops indexes.
+
+    Every term must match one of ``search_fields`` by substring or trigram similarity. Related fields are matched
+    through a subquery on the related table, so the search never joins. Results are ranked by similarity unless an
+    explicit ordering is requested, so the backend goes after ``OrderingFilter`` in ``filter_backends``.
+    """
+    rank_annotation = 'search_rank'
+
+    def filter_queryset(self, request, queryset, view):
+        search_fields = self.get_search_fields(view, request)
+        search_terms = self.get_search_terms(request)
+
+        if not search_fields or not search_terms:
+            return queryset
+
+        model = queryset.model
+        for term in search_terms:
+            condition = Q()
+            for field in search_fields:
+                condition |= self.get_field_condition(model, field, term)
+            queryset = queryset.filter(condition)
+
+        rank = self.get_rank(search_fields, ' '.join(search_terms))
+        if rank is not None:
+            queryset = queryset.annotate(**{self.rank_annotation: rank})
+            if OrderingFilter.ordering_param not in request.query_params:
+                queryset = queryset.order_by(f"-{self.rank_annotation}", *queryset.query.order_by)
+        return queryset
+
+    def get_field_condition(self, model, field, term):
+        if field == 'id':
+            # An id out of the column's range would make the database raise instead of matching nothing.
+            _, maximum = connection.ops.integer_field_range(model._meta.pk.get_internal_type())
+            if term.isdecimal() and len(term) <= len(str(maximum)) and int(term) <= maximum:
+                return Q(id=int(term))
+            return Q()
+
+        if LOOKUP_SEP in field:
+            relation, related_field = field.split(LOOKUP_SEP, 1)
+            related_model = model._meta.get_field(relation).related_model
+            related = related_model._default_manager.filter(
+                self.get_field_condition(related_model, related_field, term))
+            return Q(**{f"{relation}__in": related.values('pk')})
+
+        return Q(**{f"{field}__{ILikeContains.lookup_name}": term}) | Q(**{f"{field}__trigram_similar": term})
+
+    def get_rank(self, search_fields, search):
+        similarities = [TrigramSimilarity(field, search) for field in search_fields
+                        if field != 'id' and LOOKUP_SEP not in field]
+        if len(similarities) == 0:
+            return None
+        if len(similarities) == 1:
+            return similarities[0]
+        return Greatest(*similarities)
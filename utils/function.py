@@ -17,16 +17,6 @@ def resource_amounts(objects, amount_list):
     return ret
 
 
-def product_amounts(objects, amount_list):
-    ret = []
-    for obj in objects:
-        for pair in amount_list:
-            if pair['product_id'] == obj.product_id:
-                ret.append({'specification': obj, 'amount': pair['amount']})
-                break
-    return ret
-
-
 def dict_items_to_str(data):
     norm_data = {}
     if isinstance(data, dict):
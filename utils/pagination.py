@@ -1,7 +1,217 @@
+import base64
+import binascii
+import datetime
+import json
+from collections import OrderedDict
+
+from django.core.exceptions import EmptyResultSet
+from django.core.paginator import Paginator, Page, PageNotAnInteger, EmptyPage
+from django.db import models, connections
+from django.db.models import Q
+from django.utils.functional import cached_property
+from rest_framework.exceptions import NotFound
 from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
 
 
 class StandardResultsSetPagination(PageNumberPagination):
     page_size = 200
     page_size_query_param = 'page_size'
     max_page_size = 2000
+
+
+def estimate_count(queryset):
+    """
+    Row count estimated by the PostgreSQL planner, or None on other databases.
+    """
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return None
+    try:
+        sql, params = queryset.order_by().query.sql_with_params()
+    except EmptyResultSet:
+        return 0
+    with connection.cursor() as cursor:
+        cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}", params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+class EstimatedPage(Page):
+
+    def __init__(self, object_list, number, paginator, more):
+        super(EstimatedPage, self).__init__(object_list, number, paginator)
+        self.more = more
+
+    def has_next(self):
+        return self.more
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Counts exactly only when the planner expects fewer than `exact_threshold` rows. Above that the count is the
+    planner estimate, and pages are read one row past their end to find out if there is a next one.
+    """
+
+    def __init__(self, object_list, per_page, exact_threshold, **kwargs):
+        super(EstimatedCountPaginator, self).__init__(object_list, per_page, **kwargs)
+        self.exact_threshold = exact_threshold
+
+    @cached_property
+    def counted(self):
+        estimate = estimate_count(self.object_list)
+        if estimate is not None and estimate >= self.exact_threshold:
+            return estimate, False
+        # Only the pk is counted, so select-only annotations are not computed.
+        return self.object_list.order_by().values('pk').count(), True
+
+    @property
+    def count(self):
+        return self.counted[0]
+
+    @property
+    def count_exact(self):
+        return self.counted[1]
+
+    def validate_number(self, number):
+        if self.count_exact:
+            return super(EstimatedCountPaginator, self).validate_number(number)
+        try:
+            number = int(number)
+        except (TypeError, ValueError):
+            raise PageNotAnInteger('That page number is not an integer')
+        if number < 1:
+            raise EmptyPage('That page number is less than 1')
+        return number
+
+    def page(self, number):
+        number = self.validate_number(number)
+        if self.count_exact:
+            return super(EstimatedCountPaginator, self).page(number)
+        bottom = (number - 1) * self.per_page
+        rows = list(self.object_list[bottom:bottom + self.per_page + 1])
+        if len(rows) == 0 and number != 1:
+            raise EmptyPage('That page contains no results')
+        return EstimatedPage(rows[:self.per_page], number, self, len(rows) > self.per_page)
+
+
+class EstimatedCountPagination(StandardResultsSetPagination):
+    """
+    Page number pagination with EstimatedCountPaginator. The response tells whether `count` is exact.
+    """
+    exact_count_threshold = 10000
+
+    def django_paginator_class(self, object_list, per_page):
+        return EstimatedCountPaginator(object_list, per_page, self.exact_count_threshold)
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('count', self.page.paginator.count),
+            ('count_exact', self.page.paginator.count_exact),
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data)
+        ]))
+
+
+class KeysetPagination(EstimatedCountPagination):
+    """
+    Estimated count pagination that switches to keyset pagination when the request carries ``cursor`` (empty for
+    the first page). The cursor holds the ordering values of the last row, so a page is read without OFFSET
+    and without COUNT. The view's ordering is kept, with ``id`` as the tiebreaker; NULLs sort last ascending
+    and first descending, as in PostgreSQL. Only forward navigation is supported in this mode.
+    """
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.keyset = self.cursor_query_param in request.query_params
+        if not self.keyset:
+            return super(KeysetPagination, self).paginate_queryset(queryset, request, view)
+
+        self.request = request
+        self.ordering = self.get_ordering(queryset)
+        queryset = queryset.order_by(*self.ordering)
+        cursor = request.query_params[self.cursor_query_param]
+        if cursor:
+            queryset = queryset.filter(self.get_after_condition(self.decode_cursor(cursor)))
+
+        page_size = self.get_page_size(request)
+        rows = list(queryset[:page_size + 1])
+        self.has_next = len(rows) > page_size
+        self.rows = rows[:page_size]
+        return self.rows
+
+    def get_paginated_response(self, data):
+        if not self.keyset:
+            return super(KeysetPagination, self).get_paginated_response(data)
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('results', data)
+        ]))
+
+    def get_next_link(self):
+        if not self.keyset:
+            return super(KeysetPagination, self).get_next_link()
+        if not self.has_next:
+            return None
+        values = [self.get_row_value(self.rows[-1], field.lstrip('-')) for field in self.ordering]
+        return replace_query_param(self.request.build_absolute_uri(), self.cursor_query_param,
+                                   self.encode_cursor(values))
+
+    def get_ordering(self, queryset):
+        ordering = list(queryset.query.order_by or queryset.model._meta.ordering)
+        if not all(isinstance(field, str) and field != '?' for field in ordering):
+            raise NotFound('Keyset pagination needs a field ordering')
+        if not any(field.lstrip('-') in ('id', 'pk') for field in ordering):
+            ordering.append('id')
+        return ordering
+
+    def get_after_condition(self, values):
+        condition = Q(pk__in=[])
+        equal = Q()
+        for field, value in zip(self.ordering, values):
+            descending = field.startswith('-')
+            name = field.lstrip('-')
+            if value is None:
+                after = Q(**{f'{name}__isnull': False}) if descending else Q(pk__in=[])
+                same = Q(**{f'{name}__isnull': True})
+            else:
+                after = Q(**{f'{name}__lt' if descending else f'{name}__gt': value})
+                if not descending:
+                    after |= Q(**{f'{name}__isnull': True})
+                same = Q(**{name: value})
+            condition |= equal & after
+            equal &= same
+        return condition
+
+    def get_row_value(self, row, name):
+        if isinstance(row, dict):
+            return row[name]
+        value = row
+        for part in name.split('__'):
+            value = getattr(value, part, None) if value is not None else None
+        if isinstance(value, models.Model):
+            value = value.pk
+        return value
+
+    def encode_cursor(self, values):
+        def default(value):
+            # Full precision, DjangoJSONEncoder would cut datetimes to milliseconds.
+            if isinstance(value, (datetime.date, datetime.time)):
+                return value.isoformat()
+            return str(value)
+
+        return base64.urlsafe_b64encode(json.dumps(values, default=default).encode()).decode()
+
+    def decode_cursor(self, cursor):
+        try:
+            values = json.loads(base64.urlsafe_b64decode(cursor.encode()).decode())
+        except (binascii.Error, UnicodeDecodeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(values, list) or len(values) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+        return values
@@ -0,0 +1,100 @@
+from rest_framework import serializers
+
+
+class ValuesSerializer:
+    """
+    Read-only list renderer that produces the same data as ``serializer_class`` from ``.values()`` rows.
+
+    The serializer's readable fields are compiled once into (key, kind, column, extra) entries: plain
+    fields read their source column, nested serializers read ``<source>__<field>`` columns of the same row and
+    ``many=True`` reverse relations are fetched with one extra query per page. Fields that are not columns are
+    either annotated from ``expressions`` or listed in ``computed_fields`` and filled in by ``compute``.
+    """
+    serializer_class = None
+    expressions = {}
+    computed_fields = ()
+
+    @classmethod
+    def project(cls, queryset):
+        entries, columns = cls.compiled()
+        annotations = {cls.expression_alias(name): expression for name, expression in cls.expressions.items()}
+        ordering = [field.lstrip('-') for field in queryset.query.order_by if isinstance(field, str)]
+        return queryset.prefetch_related(None).annotate(**annotations).values(
+            *dict.fromkeys(columns + ordering + ['pk']))
+
+    @classmethod
+    def render(cls, rows):
+        entries, _ = cls.compiled()
+        rows = list(rows)
+        for key, kind, column, extra in entries:
+            if kind == 'many':
+                cls.fetch_many(key, column, rows)
+        cls.compute(rows)
+        return [cls.to_dict(entries, row) for row in rows]
+
+    @classmethod
+    def compute(cls, rows):
+        pass
+
+    @classmethod
+    def compiled(cls):
+        if '_compiled' not in cls.__dict__:
+            cls._compiled = cls.compile(cls.serializer_class())
+        return cls._compiled
+
+    @classmethod
+    def compile(cls, serializer, prefix=''):
+        model = serializer.Meta.model
+        entries = []
+        columns = [f'{prefix}{model._meta.pk.name}']
+        for key, field in serializer.fields.items():
+            if field.write_only:
+                continue
+            if prefix == '' and key in cls.computed_fields:
+                entries.append((key, 'computed', key, field.to_representation))
+            elif prefix == '' and key in cls.expressions:
+                entries.append((key, 'value', cls.expression_alias(key), field.to_representation))
+                columns.append(cls.expression_alias(key))
+            elif isinstance(field, serializers.ListSerializer) and prefix == '':
+                relation = model._meta.get_field(field.source)
+                child_entries, child_columns = cls.compile(field.child)
+                entries.append((key, 'many', (relation, child_entries, child_columns), None))
+            elif isinstance(field, serializers.ModelSerializer):
+                nested_entries, nested_columns = cls.compile(field, f'{prefix}{field.source}__')
+                entries.append((key, 'nested', nested_columns[0], nested_entries))
+                columns += nested_columns
+            elif isinstance(field, (serializers.BaseSerializer, serializers.RelatedField)) or field.source == '*':
+                raise TypeError(f"Field '{key}' of {serializer.__class__.__name__} can't be rendered from values")
+            else:
+                column = prefix + field.source.replace('.', '__')
+                entries.append((key, 'value', column, field.to_representation))
+                columns.append(column)
+        return entries, columns
+
+    @classmethod
+    def fetch_many(cls, key, many, rows):
+        relation, child_entries, child_columns = many
+        children = {}
+        for child in relation.related_model.objects.filter(**{
+            f'{relation.field.name}__in': [row['pk'] for row in rows]
+        }).order_by('pk').values(relation.field.attname, *dict.fromkeys(child_columns)):
+            children.setdefault(child[relation.field.attname], []).append(child)
+        for row in rows:
+            row[key] = children.get(row['pk'], [])
+
+    @classmethod
+    def to_dict(cls, entries, row):
+        data = {}
+        for key, kind, column, extra in entries:
+            if kind == 'nested':
+                data[key] = None if row[column] is None else cls.to_dict(extra, row)
+            elif kind == 'many':
+                data[key] = [cls.to_dict(column[1], child) for child in row[key]]
+            else:
+                value = row[column]
+                data[key] = None if value is None else extra(value)
+        return data
+
+    @classmethod
+    def expression_alias(cls, name):
+        return f'values_{name}'
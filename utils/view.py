@@ -0,0 +1,75 @@
+import hashlib
+
+from django.utils.http import parse_etags
+from rest_framework import status
+from rest_framework.response import Response
+
+from cella.service import ResponseCache, Versions
+
+
+class CachedListMixin:
+    """
+    Serves list responses from ResponseCache. The key covers the query string (filters, search, ordering,
+    page) and the generations of `cache_models`, which must include every model the response is built from.
+    """
+    cache_models = ()
+
+    def list(self, request, *args, **kwargs):
+        if not ResponseCache.enabled():
+            return super(CachedListMixin, self).list(request, *args, **kwargs)
+
+        key = ResponseCache.key(self.__class__.__name__, self.cache_models,
+                                [request.get_host(), sorted(request.query_params.lists())])
+        data = ResponseCache.get(key)
+        if data is not None:
+            return Response(data)
+
+        response = super(CachedListMixin, self).list(request, *args, **kwargs)
+        ResponseCache.set(key, response.data)
+        return response
+
+
+class ConditionalGetMixin:
+    """
+    Adds an ETag built from the version stamps of `etag_apps` and answers a matching If-None-Match with 304
+    before the queryset is touched. `etag_apps` must include every app the response is built from.
+    """
+    etag_apps = ()
+
+    def get(self, request, *args, **kwargs):
+        etag = self.get_etag(request)
+        if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+        if if_none_match is not None:
+            # Weak comparison, as compressing proxies mark forwarded ETags as weak.
+            etags = [tag[2:] if tag.startswith('W/') else tag for tag in parse_etags(if_none_match)]
+            if etag in etags or '*' in etags:
+                response = Response(status=status.HTTP_304_NOT_MODIFIED)
+                response['ETag'] = etag
+                return response
+
+        response = super(ConditionalGetMixin, self).get(request, *args, **kwargs)
+        if response.status_code == status.HTTP_200_OK:
+            response['ETag'] = etag
+        return response
+
+    def get_etag(self, request):
+        versions = Versions.get(self.etag_apps)
+        representation = f"{versions}:{request.get_full_path()}:{request.META.get('HTTP_ACCEPT', '')}"
+        return f'"{hashlib.md5(representation.encode()).hexdigest()}"'
+
+
+class ValuesListMixin:
+    """
+    Renders list pages with `values_serializer_class` (a ValuesSerializer) instead of model instances and
+    the DRF serializer.
+    """
+    values_serializer_class = None
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.values_serializer_class.project(self.filter_queryset(self.get_queryset()))
+
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(self.values_serializer_class.render(page))
+
+        return Response(self.values_serializer_class.render(queryset))